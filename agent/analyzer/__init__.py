@@ -3,6 +3,8 @@ IoT Sentry - Analyzer package
 """
 
 from .geo_locator import GeoLocator
+from .geo_enricher import GeoEnricher
 from .behavior_profiler import BehaviorProfiler
+from .alert_aggregator import AlertAggregator
 
-__all__ = ['GeoLocator', 'BehaviorProfiler']
+__all__ = ['GeoLocator', 'GeoEnricher', 'BehaviorProfiler', 'AlertAggregator']
@@ -5,23 +5,50 @@ Detecta 15 tipos diferentes de comportamientos anómalos y sospechosos
 """
 
 from datetime import datetime, timedelta, time
-from typing import Dict, Optional, List
+from typing import Dict, Optional, List, Tuple
 from collections import defaultdict, Counter
 
+import numpy as np
+
+from .device_baseline import BaselineStore
+from .flow_batch import FlowBatch, NO_PORT
+from .flow_history import merge_flow_deltas, row_dicts
+from .reputation_index import ReputationIndex, TOR_LIST
+from .sliding_window import DeviceWindows, EPOCH, DAY_SECONDS
+
+# Países habituales de los servidores de cámaras
+CAMERA_COUNTRIES = ['United States', 'Germany', 'Ireland', 'Netherlands',
+                    'United Kingdom', 'Canada']
+
+# Bits reservados al tiempo (segundos relativos) en las claves compuestas int64
+TIME_BITS = 34
+
+# Lista de países de alto riesgo en el índice de reputación
+HIGH_RISK_LIST = 'high_risk'
+
 
 class AdvancedBehaviorProfiler:
     """
     Perfilador avanzado de comportamiento con múltiples tipos de detección
     """
 
-    def __init__(self, db_session):
+    def __init__(self, session_factory, warm_start: bool = True,
+                 reputation: Optional[ReputationIndex] = None,
+                 reputation_dir: Optional[str] = None):
         """
         Inicializar profiler
 
         Args:
-            db_session: Sesión de base de datos
+            session_factory: Factory de sesiones de base de datos (una sesión
+                             corta por consulta o checkpoint)
+            warm_start: Reconstruir las ventanas en memoria desde la DB
+            reputation: Índice de reputación compartido (None = crear uno con
+                        las listas integradas)
+            reputation_dir: Directorio con listas de IPs/CIDRs a cargar (cada
+                            archivo es una lista; 'tor.txt' sustituye la
+                            lista Tor integrada)
         """
-        self.db_session = db_session
+        self.session_factory = session_factory
 
         # Umbrales configurables
         self.UNUSUAL_HOUR_START = time(2, 0)   # 2 AM
@@ -43,7 +70,8 @@ class AdvancedBehaviorProfiler:
         }
 
         # Rangos de IPs de Tor (simplificado)
-        # En producción, usar lista completa de: https://check.torproject.org/exit-addresses
+        # En producción, cargar la lista completa (https://check.torproject.org/exit-addresses)
+        # como tor.txt en reputation_dir
         self.TOR_EXIT_NODES = [
             '185.220.101.',  # Rango común de Tor
             '185.220.102.',
@@ -56,8 +84,29 @@ class AdvancedBehaviorProfiler:
             'Iran',  # Algunas IPs específicas
         ]
 
-        # Cache de baselines por dispositivo
-        self.device_baselines = {}
+        # Índice de reputación: Tor, blocklists y países (consultas O(log n) / O(1))
+        if reputation is None:
+            reputation = ReputationIndex()
+            reputation.set_list(TOR_LIST, self.TOR_EXIT_NODES, rebuild=False)
+            reputation.set_countries(HIGH_RISK_LIST, self.HIGH_RISK_COUNTRIES, rebuild=False)
+            reputation.rebuild()
+        self.reputation = reputation
+        if reputation_dir:
+            self.reputation.load_directory(reputation_dir)
+
+        # Baselines aprendidos por dispositivo (incrementales, con checkpoint)
+        self.device_baselines = BaselineStore(session_factory)
+
+        # Ventanas deslizantes por dispositivo (conexiones/hora, países, bytes diarios)
+        self.WINDOW_SECONDS = 3600
+        self.WINDOW_BUCKET_SECONDS = 300
+        self.BASELINE_DAYS = 30
+        self.PRUNE_EVERY = 4096
+        self.device_windows: Dict[int, DeviceWindows] = {}
+        self.flows_recorded = 0
+
+        if warm_start:
+            self.rebuild_windows()
 
     def analyze_flow_comprehensive(self, device_id: int, device_type: str,
                                    dest_ip: str, dest_port: int, dest_country: str,
@@ -81,30 +130,18 @@ class AdvancedBehaviorProfiler:
         """
         alerts = []
 
+        # Actualizar ventanas del dispositivo (los checks 4, 5 y 11 leen de aquí)
+        self.record_flow(device_id, dest_ip, dest_country, bytes_sent, timestamp)
+        self.device_baselines.update(device_id, dest_ip, dest_port, bytes_sent, timestamp)
+        self.device_baselines.maybe_checkpoint()
+
         # 1. Hora inusual (original)
         if self._is_unusual_time(timestamp):
-            alerts.append({
-                'alert_type': 'unusual_time',
-                'severity': 'medium',
-                'message': f'Conexión a {dest_ip} ({dest_country}) durante horas inusuales ({timestamp.strftime("%H:%M")})',
-                'metadata': {
-                    'dest_ip': dest_ip,
-                    'dest_country': dest_country,
-                    'timestamp': timestamp.isoformat()
-                }
-            })
+            alerts.append(self._unusual_time_alert(dest_ip, dest_country, timestamp))
 
         # 2. Volumen alto (original)
         if bytes_sent > self.HIGH_VOLUME_THRESHOLD:
-            alerts.append({
-                'alert_type': 'high_volume',
-                'severity': 'high',
-                'message': f'Volumen inusualmente alto de datos: {bytes_sent / (1024*1024):.1f} MB enviados',
-                'metadata': {
-                    'dest_ip': dest_ip,
-                    'bytes_sent': bytes_sent
-                }
-            })
+            alerts.append(self._high_volume_alert(dest_ip, bytes_sent))
 
         # 3. Destino sospechoso (original mejorado)
         suspicious_dest = self._check_suspicious_destination(device_type, dest_country, dest_ip)
@@ -112,12 +149,12 @@ class AdvancedBehaviorProfiler:
             alerts.append(suspicious_dest)
 
         # 4. NUEVO: Conexiones repetitivas anormales
-        excessive = self._check_excessive_connections(device_id, dest_ip)
+        excessive = self._check_excessive_connections(device_id, dest_ip, timestamp)
         if excessive:
             alerts.append(excessive)
 
         # 5. NUEVO: Country hopping
-        hopping = self._check_country_hopping(device_id)
+        hopping = self._check_country_hopping(device_id, timestamp)
         if hopping:
             alerts.append(hopping)
 
@@ -126,8 +163,9 @@ class AdvancedBehaviorProfiler:
         if unusual_port:
             alerts.append(unusual_port)
 
-        # 7. NUEVO: Conexión a Tor
-        tor_connection = self._check_tor_connection(dest_ip)
+        # 7. NUEVO: Conexión a Tor (una sola consulta al índice para 7 y 10)
+        reputation_lists = self.reputation.lookup(dest_ip)
+        tor_connection = self._check_tor_connection(dest_ip, reputation_lists)
         if tor_connection:
             alerts.append(tor_connection)
 
@@ -141,8 +179,259 @@ class AdvancedBehaviorProfiler:
         if blacklisted:
             alerts.append(blacklisted)
 
+        # 10. IP en blocklist
+        blocklisted = self._check_blocklisted_ip(dest_ip, reputation_lists)
+        if blocklisted:
+            alerts.append(blocklisted)
+
         return alerts
 
+    # ============ Evaluación por lotes (vectorizada) ============
+
+    def analyze_flows_batch(self, batch: FlowBatch) -> List[Tuple[int, Dict]]:
+        """
+        Evaluar las 10 reglas de analyze_flow_comprehensive sobre un lote columnar
+
+        Cada regla se calcula como una máscara NumPy sobre todo el lote; los
+        dicts de alerta solo se construyen para las filas que disparan. Las
+        reglas de ventana (4 y 5) se evalúan sobre el propio lote, con la
+        última hora exacta hasta cada fila (no usan las ventanas en memoria).
+        En vivo, el contador de conexiones tiene resolución de
+        WINDOW_BUCKET_SECONDS y puede contar hasta un bucket de más, así que
+        analyze_flow_comprehensive da algunas alertas de conexiones
+        repetitivas que la evaluación por lotes no da.
+
+        Args:
+            batch: Lote de flujos (FlowBatch)
+
+        Returns:
+            Lista de (índice de fila, alerta), ordenada por fila y, dentro de
+            cada fila, en el mismo orden que analyze_flow_comprehensive
+        """
+        if len(batch) == 0:
+            return []
+
+        sent = batch.bytes_sent
+        received = batch.bytes_received
+        ports = batch.dest_ports
+        countries = batch.country_codes
+        types = batch.device_type_codes
+
+        def codes(values, lookup) -> np.ndarray:
+            return np.array([code for code in map(lookup, values) if code >= 0], dtype=np.int32)
+
+        # 1. Hora inusual (segundo del día entre 2:00 y 6:00 inclusive)
+        second_of_day = np.mod(batch.timestamps, DAY_SECONDS)
+        start = self.UNUSUAL_HOUR_START.hour * 3600 + self.UNUSUAL_HOUR_START.minute * 60
+        end = self.UNUSUAL_HOUR_END.hour * 3600 + self.UNUSUAL_HOUR_END.minute * 60
+        unusual_time = (second_of_day >= start) & (second_of_day <= end)
+
+        # 2. Volumen alto
+        high_volume = sent > self.HIGH_VOLUME_THRESHOLD
+
+        # 3. Destino sospechoso (cámaras y asistentes de voz)
+        ignored = ['Local Network', 'Unknown']
+        cameras = np.isin(types, codes(['camera', 'security_camera', 'doorbell', 'baby_monitor'],
+                                       batch.device_type_code))
+        camera_ok = np.isin(countries, codes(CAMERA_COUNTRIES + ignored, batch.country_code))
+        speakers = np.isin(types, codes(['smart_speaker', 'smart_display'], batch.device_type_code))
+        speaker_ok = np.isin(countries, codes(['United States'] + ignored, batch.country_code))
+        suspicious = (cameras & ~camera_ok) | (speakers & ~speaker_ok)
+
+        # 4. Conexiones repetitivas al mismo destino en la última hora
+        connection_counts = self._batch_window_counts(batch)
+        excessive = connection_counts > self.EXCESSIVE_CONNECTIONS_THRESHOLD
+
+        # 5. Países distintos en la última hora
+        country_counts, country_rows = self._batch_country_counts(batch)
+        hopping = country_counts >= self.COUNTRY_HOPPING_THRESHOLD
+
+        # 6. Puerto inusual para el tipo de dispositivo
+        unusual_port = np.zeros(len(batch), dtype=bool)
+        for device_type, normal_ports in self.NORMAL_PORTS.items():
+            code = batch.device_type_code(device_type)
+            if code >= 0:
+                unusual_port |= (types == code) & ~np.isin(ports, normal_ports)
+
+        # 7. Tor (una consulta al índice de reputación por IP única)
+        ip_lists = [self.reputation.lookup(ip, count_hits=False) for ip in batch.ips]
+        tor_ips = np.array([TOR_LIST in lists for lists in ip_lists], dtype=bool)
+        tor = tor_ips[batch.dest_ip_codes]
+
+        # 8. Ratio upload/download
+        ratio = np.divide(sent, received, out=np.zeros(len(batch)), where=received != 0)
+        upload = (received != 0) & (sent >= 10000) & (ratio > self.UPLOAD_RATIO_THRESHOLD)
+
+        # 9. País de alto riesgo (una consulta por país único)
+        risky_countries = np.array(
+            [bool(self.reputation.country_lists_for(country, count_hits=False))
+             for country in batch.countries], dtype=bool)
+        blacklisted = risky_countries[countries]
+
+        # 10. IP en blocklist (cualquier lista salvo Tor)
+        blocklisted_ips = np.array([any(name != TOR_LIST for name in lists) for lists in ip_lists],
+                                   dtype=bool)
+        blocklisted = blocklisted_ips[batch.dest_ip_codes]
+
+        masks = [unusual_time, high_volume, suspicious, excessive, hopping,
+                 unusual_port, tor, upload, blacklisted, blocklisted]
+
+        rows = np.concatenate([np.flatnonzero(mask) for mask in masks])
+        rules = np.concatenate([np.full(int(mask.sum()), rule) for rule, mask in enumerate(masks)])
+        order = np.lexsort((rules, rows))
+
+        # Materializar solo las alertas que disparan
+        results = []
+        for row, rule in zip(rows[order].tolist(), rules[order].tolist()):
+            dest_ip = batch.dest_ip(row)
+            dest_country = batch.countries[countries[row]]
+
+            if rule == 0:
+                timestamp = EPOCH + timedelta(seconds=float(batch.timestamps[row]))
+                alert = self._unusual_time_alert(dest_ip, dest_country, timestamp)
+            elif rule == 1:
+                alert = self._high_volume_alert(dest_ip, int(sent[row]))
+            elif rule == 2:
+                alert = self._check_suspicious_destination(
+                    batch.device_types[types[row]], dest_country, dest_ip)
+            elif rule == 3:
+                alert = self._excessive_connections_alert(dest_ip, int(connection_counts[row]))
+            elif rule == 4:
+                alert = self._country_hopping_alert(country_rows(row))
+            elif rule == 5:
+                port = int(ports[row])
+                alert = self._check_unusual_port(batch.device_types[types[row]],
+                                                 None if port == NO_PORT else port, dest_ip)
+            elif rule == 6:
+                alert = self._check_tor_connection(dest_ip, ip_lists[batch.dest_ip_codes[row]])
+                self.reputation.record_hits(TOR_LIST)
+            elif rule == 7:
+                alert = self._check_upload_ratio(int(sent[row]), int(received[row]))
+            elif rule == 8:
+                alert = self._check_blacklisted_country(dest_country)
+            else:
+                alert = self._check_blocklisted_ip(dest_ip, ip_lists[batch.dest_ip_codes[row]])
+                for name in alert['metadata']['blocklists']:
+                    self.reputation.record_hits(name)
+
+            results.append((row, alert))
+
+        return results
+
+    def _batch_window_counts(self, batch: FlowBatch) -> np.ndarray:
+        """
+        Flujos del mismo dispositivo al mismo destino en [t - ventana, t] por fila
+
+        Args:
+            batch: Lote de flujos
+
+        Returns:
+            Array de conteos
+        """
+        seconds = np.floor(batch.timestamps).astype(np.int64)
+        seconds -= seconds.min()
+
+        # Clave compuesta (dispositivo, destino, segundo) ordenable como int64
+        _, device_ranks = np.unique(batch.device_ids, return_inverse=True)
+        group = device_ranks.astype(np.int64) * len(batch.ips) + batch.dest_ip_codes
+        keys = (group << TIME_BITS) | seconds
+        sorted_keys = np.sort(keys)
+
+        right = np.searchsorted(sorted_keys, keys, side='right')
+        left = np.searchsorted(sorted_keys, keys - self.WINDOW_SECONDS, side='left')
+        return right - left
+
+    def _batch_country_counts(self, batch: FlowBatch):
+        """
+        Países distintos contactados por el dispositivo en [t - ventana, t] por fila
+
+        Cada aparición de un país lo mantiene "activo" una ventana; los
+        intervalos solapados de un mismo (dispositivo, país) se fusionan y un
+        barrido de eventos +1/-1 da el número de países activos en cada fila.
+
+        Args:
+            batch: Lote de flujos
+
+        Returns:
+            Tupla (array de conteos, función fila → lista de países)
+        """
+        window = self.WINDOW_SECONDS
+        seconds = np.floor(batch.timestamps).astype(np.int64)
+        seconds -= seconds.min()
+        _, device_ranks = np.unique(batch.device_ids, return_inverse=True)
+        device_ranks = device_ranks.astype(np.int64)
+
+        ignored = [batch.country_code(c) for c in (None, 'Local Network', 'Unknown')]
+        valid = ~np.isin(batch.country_codes, [c for c in ignored if c >= 0])
+
+        devices = device_ranks[valid]
+        times = seconds[valid]
+        country_codes = batch.country_codes[valid].astype(np.int64)
+
+        counts = np.zeros(len(batch), dtype=np.int64)
+        if len(times):
+            # Ordenar por (dispositivo, país, tiempo) y fusionar apariciones a < ventana
+            order = np.lexsort((times, country_codes, devices))
+            devices, times, country_codes = devices[order], times[order], country_codes[order]
+
+            same_group = np.zeros(len(times), dtype=bool)
+            same_group[1:] = (devices[1:] == devices[:-1]) & (country_codes[1:] == country_codes[:-1])
+            gap = np.zeros(len(times), dtype=bool)
+            gap[1:] = times[1:] - times[:-1] > window
+            run_start = ~same_group | gap
+
+            starts = np.flatnonzero(run_start)
+            ends = np.append(starts[1:], len(times)) - 1
+
+            # +1 al empezar la racha, -1 al dejar de cubrirla (último + ventana + 1)
+            event_keys = np.concatenate([
+                (devices[starts] << TIME_BITS) | times[starts],
+                (devices[ends] << TIME_BITS) | (times[ends] + window + 1),
+            ])
+            event_deltas = np.concatenate([np.ones(len(starts), dtype=np.int64),
+                                           -np.ones(len(ends), dtype=np.int64)])
+            event_order = np.argsort(event_keys, kind='stable')
+            event_keys = event_keys[event_order]
+            running = np.cumsum(event_deltas[event_order])
+
+            query = (device_ranks << TIME_BITS) | seconds
+            position = np.searchsorted(event_keys, query, side='right') - 1
+            counts = np.where(position >= 0, running[np.maximum(position, 0)], 0)
+
+        # Lista de países de una fila (solo se usa para las filas que disparan)
+        by_device_time = np.lexsort((seconds, device_ranks))
+        sorted_keys = ((device_ranks << TIME_BITS) | seconds)[by_device_time]
+
+        def country_rows(row: int) -> List[str]:
+            key = (int(device_ranks[row]) << TIME_BITS) | int(seconds[row])
+            lo = np.searchsorted(sorted_keys, key - window, side='left')
+            hi = np.searchsorted(sorted_keys, key, side='right')
+            rows = by_device_time[lo:hi]
+            codes = batch.country_codes[rows[valid[rows]]]
+            return [batch.countries[code] for code in dict.fromkeys(codes.tolist())]
+
+        return counts, country_rows
+
+    def score_history(self, start: datetime, end: datetime) -> List[Tuple[int, Dict, datetime]]:
+        """
+        Re-evaluar los flujos guardados en un rango con analyze_flows_batch
+
+        Args:
+            start: Inicio del rango (UTC, incluido)
+            end: Fin del rango (UTC, excluido)
+
+        Returns:
+            Lista de (device_id, alerta, inicio del flujo); los deltas guardados
+            por intervalo se evalúan reagrupados en flujos completos
+        """
+        with self.session_factory() as session:
+            batch = FlowBatch.from_query(session, start, end)
+        return [
+            (int(batch.device_ids[row]), alert,
+             EPOCH + timedelta(seconds=float(batch.timestamps[row])))
+            for row, alert in self.analyze_flows_batch(batch)
+        ]
+
     def check_new_device(self, device_id: int, mac_address: str, vendor: str,
                         first_seen: datetime) -> Optional[Dict]:
         """
@@ -163,38 +452,23 @@ class AdvancedBehaviorProfiler:
             }
         return None
 
-    def check_behavior_change(self, device_id: int) -> Optional[Dict]:
+    def check_behavior_change(self, device_id: int,
+                              now: Optional[datetime] = None) -> Optional[Dict]:
         """
         11. NUEVO: Cambio drástico de comportamiento
-        """
-        from agent.database.models import Flow
-        from sqlalchemy import func
-
-        # Obtener baseline (últimos 30 días excepto último día)
-        baseline_start = datetime.utcnow() - timedelta(days=30)
-        baseline_end = datetime.utcnow() - timedelta(days=1)
 
-        baseline_avg = self.db_session.query(
-            func.avg(func.sum(Flow.bytes_sent))
-        ).filter(
-            Flow.device_id == device_id,
-            Flow.timestamp >= baseline_start,
-            Flow.timestamp < baseline_end
-        ).group_by(
-            func.date(Flow.timestamp)
-        ).scalar()
+        Compara los bytes de hoy con la EWMA de bytes diarios del dispositivo.
+        """
+        windows = self.device_windows.get(device_id)
+        if windows is None:
+            return None
 
+        baseline_avg = windows.daily_bytes.average
         if not baseline_avg or baseline_avg < 1000:
             return None  # Insuficientes datos
 
-        # Obtener uso de hoy
-        today_start = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
-        today_usage = self.db_session.query(
-            func.sum(Flow.bytes_sent)
-        ).filter(
-            Flow.device_id == device_id,
-            Flow.timestamp >= today_start
-        ).scalar() or 0
+        # Uso de hoy
+        today_usage = windows.daily_bytes.today(now or datetime.utcnow())
 
         # Detectar cambio drástico (10x)
         if today_usage > baseline_avg * 10:
@@ -219,10 +493,11 @@ class AdvancedBehaviorProfiler:
         from agent.database.models import Device
 
         # Buscar si hay otro dispositivo con misma IP pero MAC diferente
-        devices_same_ip = self.db_session.query(Device).filter(
-            Device.ip_address == ip_address,
-            Device.mac_address != current_mac
-        ).all()
+        with self.session_factory() as session:
+            devices_same_ip = session.query(Device).filter(
+                Device.ip_address == ip_address,
+                Device.mac_address != current_mac
+            ).all()
 
         if devices_same_ip:
             # Verificar si el cambio es reciente (últimas 24h)
@@ -242,6 +517,94 @@ class AdvancedBehaviorProfiler:
 
         return None
 
+    # ============ Ventanas deslizantes ============
+
+    def _get_windows(self, device_id: int) -> DeviceWindows:
+        """
+        Obtener (o crear) las ventanas de un dispositivo
+
+        Args:
+            device_id: ID del dispositivo
+
+        Returns:
+            DeviceWindows del dispositivo
+        """
+        windows = self.device_windows.get(device_id)
+        if windows is None:
+            windows = DeviceWindows(self.WINDOW_SECONDS, self.WINDOW_BUCKET_SECONDS,
+                                    self.BASELINE_DAYS)
+            self.device_windows[device_id] = windows
+        return windows
+
+    def record_flow(self, device_id: int, dest_ip: str, dest_country: Optional[str],
+                    bytes_sent: int, timestamp: datetime):
+        """
+        Registrar un flujo en las ventanas del dispositivo
+
+        Args:
+            device_id: ID del dispositivo
+            dest_ip: IP destino
+            dest_country: País destino
+            bytes_sent: Bytes enviados
+            timestamp: Timestamp del flujo (UTC)
+        """
+        self._get_windows(device_id).record(dest_ip, dest_country, bytes_sent, timestamp)
+
+        # Descartar periódicamente contadores de destinos que ya no aparecen
+        self.flows_recorded += 1
+        if self.flows_recorded % self.PRUNE_EVERY == 0:
+            for windows in self.device_windows.values():
+                windows.prune(timestamp)
+
+    def rebuild_windows(self, now: Optional[datetime] = None):
+        """
+        Reconstruir las ventanas desde la tabla flows (una vez, al arrancar)
+
+        Args:
+            now: Instante de referencia en UTC (por defecto, ahora)
+        """
+        from agent.database.models import Flow
+        from sqlalchemy import func
+
+        now = now or datetime.utcnow()
+        self.device_windows = {}
+
+        baseline_start = now - timedelta(days=self.BASELINE_DAYS)
+        window_start = now - timedelta(seconds=self.WINDOW_SECONDS)
+        day = func.date(Flow.timestamp)
+
+        with self.session_factory() as session:
+            # Bytes por dispositivo y día → EWMA (y total de hoy)
+            daily = session.query(
+                Flow.device_id, day, func.sum(Flow.bytes_sent)
+            ).filter(
+                Flow.timestamp >= baseline_start
+            ).group_by(
+                day, Flow.device_id  # Día primero: rango sobre ix_flows_time_device
+            ).order_by(day).all()
+
+            # Conexiones y países de la última ventana (deltas por intervalo)
+            recent = session.query(
+                Flow.device_id, Flow.dest_ip, Flow.dest_port, Flow.protocol,
+                Flow.dest_country, Flow.timestamp
+            ).filter(
+                Flow.timestamp >= window_start
+            ).order_by(Flow.timestamp).all()
+
+        for device_id, date_str, total in daily:
+            if total:
+                date = datetime.strptime(str(date_str), '%Y-%m-%d')
+                self._get_windows(device_id).daily_bytes.add(date, int(total))
+
+        # Una conexión por flujo, no por intervalo guardado; las ventanas
+        # esperan orden temporal. Los bytes ya están contados en la EWMA
+        flows = sorted(merge_flow_deltas(row_dicts(recent)),
+                       key=lambda flow: flow['timestamp'])
+        for flow in flows:
+            self._get_windows(flow['device_id']).record(
+                flow['dest_ip'], flow['dest_country'], 0, flow['timestamp']
+            )
+
     # ============ Métodos auxiliares ============
 
     def _is_unusual_time(self, timestamp: datetime) -> bool:
@@ -249,13 +612,37 @@ class AdvancedBehaviorProfiler:
         current_time = timestamp.time()
         return self.UNUSUAL_HOUR_START <= current_time <= self.UNUSUAL_HOUR_END
 
+    def _unusual_time_alert(self, dest_ip: str, dest_country: str, timestamp: datetime) -> Dict:
+        """1. Construir alerta de hora inusual"""
+        return {
+            'alert_type': 'unusual_time',
+            'severity': 'medium',
+            'message': f'Conexión a {dest_ip} ({dest_country}) durante horas inusuales ({timestamp.strftime("%H:%M")})',
+            'metadata': {
+                'dest_ip': dest_ip,
+                'dest_country': dest_country,
+                'timestamp': timestamp.isoformat()
+            }
+        }
+
+    def _high_volume_alert(self, dest_ip: str, bytes_sent: int) -> Dict:
+        """2. Construir alerta de volumen alto"""
+        return {
+            'alert_type': 'high_volume',
+            'severity': 'high',
+            'message': f'Volumen inusualmente alto de datos: {bytes_sent / (1024*1024):.1f} MB enviados',
+            'metadata': {
+                'dest_ip': dest_ip,
+                'bytes_sent': bytes_sent
+            }
+        }
+
     def _check_suspicious_destination(self, device_type: str, dest_country: str,
                                       dest_ip: str) -> Optional[Dict]:
         """Verificar destino geográfico sospechoso"""
         # Cámaras
         if device_type in ['camera', 'security_camera', 'doorbell', 'baby_monitor']:
-            common_countries = ['United States', 'Germany', 'Ireland', 'Netherlands',
-                              'United Kingdom', 'Canada']
+            common_countries = list(CAMERA_COUNTRIES)
             if dest_country not in common_countries and dest_country not in ['Local Network', 'Unknown']:
                 return {
                     'alert_type': 'suspicious_destination',
@@ -284,61 +671,60 @@ class AdvancedBehaviorProfiler:
 
         return None
 
-    def _check_excessive_connections(self, device_id: int, dest_ip: str) -> Optional[Dict]:
+    def _check_excessive_connections(self, device_id: int, dest_ip: str,
+                                     now: datetime) -> Optional[Dict]:
         """4. Detectar conexiones repetitivas anormales"""
-        from agent.database.models import Flow
-
-        # Contar conexiones en última hora al mismo destino
-        one_hour_ago = datetime.utcnow() - timedelta(hours=1)
+        windows = self.device_windows.get(device_id)
+        if windows is None:
+            return None
 
-        connection_count = self.db_session.query(Flow).filter(
-            Flow.device_id == device_id,
-            Flow.dest_ip == dest_ip,
-            Flow.timestamp >= one_hour_ago
-        ).count()
+        # Conexiones en última hora al mismo destino
+        connection_count = windows.connection_count(dest_ip, now)
 
         if connection_count > self.EXCESSIVE_CONNECTIONS_THRESHOLD:
-            return {
-                'alert_type': 'excessive_connections',
-                'severity': 'medium',
-                'message': f'{connection_count} conexiones repetitivas en última hora a {dest_ip}',
-                'metadata': {
-                    'dest_ip': dest_ip,
-                    'connection_count': connection_count,
-                    'threshold': self.EXCESSIVE_CONNECTIONS_THRESHOLD
-                }
-            }
+            return self._excessive_connections_alert(dest_ip, connection_count)
 
         return None
 
-    def _check_country_hopping(self, device_id: int) -> Optional[Dict]:
-        """5. Detectar saltos entre múltiples países"""
-        from agent.database.models import Flow
-
-        one_hour_ago = datetime.utcnow() - timedelta(hours=1)
+    def _excessive_connections_alert(self, dest_ip: str, connection_count: int) -> Dict:
+        """Construir alerta de conexiones repetitivas"""
+        return {
+            'alert_type': 'excessive_connections',
+            'severity': 'medium',
+            'message': f'{connection_count} conexiones repetitivas en última hora a {dest_ip}',
+            'metadata': {
+                'dest_ip': dest_ip,
+                'connection_count': connection_count,
+                'threshold': self.EXCESSIVE_CONNECTIONS_THRESHOLD
+            }
+        }
 
-        # Obtener países únicos en última hora
-        countries = self.db_session.query(Flow.dest_country).filter(
-            Flow.device_id == device_id,
-            Flow.timestamp >= one_hour_ago,
-            Flow.dest_country.notin_(['Local Network', 'Unknown', None])
-        ).distinct().all()
+    def _check_country_hopping(self, device_id: int, now: datetime) -> Optional[Dict]:
+        """5. Detectar saltos entre múltiples países"""
+        windows = self.device_windows.get(device_id)
+        if windows is None:
+            return None
 
-        unique_countries = [c[0] for c in countries if c[0]]
+        # Países únicos en última hora
+        unique_countries = windows.countries.values(now)
 
         if len(unique_countries) >= self.COUNTRY_HOPPING_THRESHOLD:
-            return {
-                'alert_type': 'country_hopping',
-                'severity': 'high',
-                'message': f'Dispositivo conectado a {len(unique_countries)} países en última hora',
-                'metadata': {
-                    'countries': unique_countries,
-                    'count': len(unique_countries)
-                }
-            }
+            return self._country_hopping_alert(unique_countries)
 
         return None
 
+    def _country_hopping_alert(self, unique_countries: List[str]) -> Dict:
+        """Construir alerta de saltos entre países"""
+        return {
+            'alert_type': 'country_hopping',
+            'severity': 'high',
+            'message': f'Dispositivo conectado a {len(unique_countries)} países en última hora',
+            'metadata': {
+                'countries': unique_countries,
+                'count': len(unique_countries)
+            }
+        }
+
     def _check_unusual_port(self, device_type: str, dest_port: int, dest_ip: str) -> Optional[Dict]:
         """6. Detectar puerto inusual para tipo de dispositivo"""
         if device_type not in self.NORMAL_PORTS:
@@ -376,19 +762,44 @@ class AdvancedBehaviorProfiler:
 
         return None
 
-    def _check_tor_connection(self, dest_ip: str) -> Optional[Dict]:
+    def _check_tor_connection(self, dest_ip: str,
+                              reputation_lists: Optional[List[str]] = None) -> Optional[Dict]:
         """7. Detectar conexión a red Tor"""
-        for tor_range in self.TOR_EXIT_NODES:
-            if dest_ip.startswith(tor_range):
-                return {
-                    'alert_type': 'tor_connection',
-                    'severity': 'high',
-                    'message': f'Dispositivo conectándose a nodo Tor ({dest_ip})',
-                    'metadata': {
-                        'dest_ip': dest_ip,
-                        'tor_range': tor_range
-                    }
+        if reputation_lists is None:
+            is_tor = self.reputation.contains(TOR_LIST, dest_ip)
+        else:
+            is_tor = TOR_LIST in reputation_lists
+
+        if is_tor:
+            return {
+                'alert_type': 'tor_connection',
+                'severity': 'high',
+                'message': f'Dispositivo conectándose a nodo Tor ({dest_ip})',
+                'metadata': {
+                    'dest_ip': dest_ip,
+                    'reputation_list': TOR_LIST
+                }
+            }
+
+        return None
+
+    def _check_blocklisted_ip(self, dest_ip: str,
+                              reputation_lists: Optional[List[str]] = None) -> Optional[Dict]:
+        """10. Detectar conexión a IP de una blocklist (cualquier lista salvo Tor)"""
+        if reputation_lists is None:
+            reputation_lists = self.reputation.lookup(dest_ip)
+
+        blocklists = [name for name in reputation_lists if name != TOR_LIST]
+        if blocklists:
+            return {
+                'alert_type': 'blocklisted_ip',
+                'severity': 'high',
+                'message': f'Conexión a IP en blocklist ({dest_ip}): {", ".join(blocklists)}',
+                'metadata': {
+                    'dest_ip': dest_ip,
+                    'blocklists': blocklists
                 }
+            }
 
         return None
 
@@ -415,7 +826,7 @@ class AdvancedBehaviorProfiler:
 
     def _check_blacklisted_country(self, dest_country: str) -> Optional[Dict]:
         """9. Detectar conexión a país de alto riesgo"""
-        if dest_country in self.HIGH_RISK_COUNTRIES:
+        if self.reputation.country_lists_for(dest_country):
             return {
                 'alert_type': 'blacklisted_country',
                 'severity': 'high',
@@ -0,0 +1,266 @@
+"""
+IoT Sentry - Agregación de Alertas
+
+Deduplica alertas repetidas: las ocurrencias de la misma alerta (dispositivo,
+tipo y metadata clave) dentro de la ventana de supresión no crean filas nuevas,
+solo incrementan `count` y actualizan `last_seen` de la alerta ya abierta.
+Las escrituras se agrupan en commits por lote, cada uno en su propia sesión.
+"""
+
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Set, Tuple
+
+from agent.database.models import Alert
+
+# Campos de metadata que identifican una alerta por tipo
+DEFAULT_KEY_FIELDS = {
+    # El flujo nuevo aún no está geolocalizado: dest_country suele ser None
+    'unusual_time': ('dest_ip',),
+    'suspicious_destination': ('dest_country',),
+    'high_volume': ('dest_ip',),
+}
+
+# Campos usados para tipos sin entrada en DEFAULT_KEY_FIELDS o cuando
+# todos los campos clave del tipo vienen vacíos
+FALLBACK_KEY_FIELDS = ('dest_ip', 'dest_country')
+
+SEVERITY_ORDER = {'low': 0, 'medium': 1, 'high': 2}
+
+AlertKey = Tuple[int, str, tuple]
+
+
+class AlertAggregator:
+    """
+    Agregador de alertas con ventana de supresión y commits por lote
+
+    `submit()` devuelve la alerta agregada; las alertas nuevas se insertan en
+    el siguiente `flush()`, que además persiste los contadores actualizados.
+    """
+
+    def __init__(self, session_factory, suppression_window: int = 3600,
+                 flush_interval: float = 5.0, max_pending: int = 500,
+                 key_fields: Optional[Dict[str, tuple]] = None):
+        """
+        Inicializar agregador
+
+        Args:
+            session_factory: Factory de sesiones SQLAlchemy (una sesión corta
+                             por carga y por flush)
+            suppression_window: Segundos sin ocurrencias tras los que una alerta
+                                se cierra y la siguiente crea una fila nueva
+            flush_interval: Segundos máximos entre commits de contadores
+            max_pending: Cambios pendientes que fuerzan un commit
+            key_fields: Campos de metadata clave por tipo de alerta
+        """
+        self.session_factory = session_factory
+        self.window = timedelta(seconds=suppression_window)
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.key_fields = {**DEFAULT_KEY_FIELDS, **(key_fields or {})}
+
+        # Clave → [alerta, count, last_seen, severidad] de las alertas abiertas.
+        # Las alertas quedan desacopladas de la sesión entre flushes; los
+        # contadores se llevan en memoria para no tener que recargarlas.
+        self.open_alerts: Dict[AlertKey, list] = {}
+
+        # Cambios aún no persistidos (alertas nuevas y alertas ya guardadas
+        # con contadores modificados)
+        self.new_alerts: List[Alert] = []
+        self.changed: Set[Alert] = set()
+        self.dirty = 0
+        self.last_flush = time.time()
+
+        # Reloj de alertas (timestamp más reciente visto)
+        self.clock: Optional[datetime] = None
+
+        self.submitted = 0
+        self.suppressed = 0
+        self.created = 0
+
+    def _make_key(self, device_id: int, alert_data: dict) -> AlertKey:
+        """
+        Construir clave de deduplicación
+
+        Args:
+            device_id: ID del dispositivo
+            alert_data: Dict de alerta del profiler
+
+        Returns:
+            Tupla (device_id, alert_type, valores de metadata clave)
+        """
+        alert_type = alert_data['alert_type']
+        metadata = alert_data.get('metadata') or {}
+        fields = self.key_fields.get(alert_type, FALLBACK_KEY_FIELDS)
+        values = tuple(metadata.get(field) for field in fields)
+
+        # Sin valores clave todas las alertas del tipo colapsarían en una
+        if all(value is None for value in values):
+            values = tuple(metadata.get(field) for field in FALLBACK_KEY_FIELDS)
+        return device_id, alert_type, values
+
+    def load_open_alerts(self, now: Optional[datetime] = None):
+        """
+        Recuperar alertas aún abiertas de la DB (tras reiniciar el motor)
+
+        Args:
+            now: Instante de referencia en UTC (por defecto, ahora)
+        """
+        now = now or datetime.utcnow()
+        with self.session_factory() as session:
+            recent = session.query(Alert).filter(
+                Alert.last_seen >= now - self.window
+            ).order_by(Alert.last_seen).all()
+
+        for alert in recent:
+            key = self._make_key(alert.device_id, {
+                'alert_type': alert.alert_type,
+                'metadata': alert.alert_metadata,
+            })
+            self.open_alerts[key] = [alert, alert.count or 1, alert.last_seen, alert.severity]
+
+    def submit(self, device_id: int, alert_data: dict,
+               timestamp: datetime) -> Tuple[Alert, bool]:
+        """
+        Registrar una ocurrencia de alerta
+
+        Args:
+            device_id: ID del dispositivo
+            alert_data: Dict con alert_type, severity, message y metadata
+            timestamp: Momento de la ocurrencia
+
+        Returns:
+            Tupla (alerta agregada, True si es una alerta nueva)
+        """
+        self.submitted += 1
+        if self.clock is None or timestamp > self.clock:
+            self.clock = timestamp
+
+        key = self._make_key(device_id, alert_data)
+        entry = self.open_alerts.get(key)
+
+        if entry is not None and timestamp - entry[2] <= self.window:
+            # Repetición: solo contadores (y severidad si es mayor)
+            alert = entry[0]
+            entry[1] += 1
+            alert.count = entry[1]
+            if timestamp > entry[2]:
+                entry[2] = timestamp
+                alert.last_seen = timestamp
+            if SEVERITY_ORDER.get(alert_data['severity'], 0) > SEVERITY_ORDER.get(entry[3], 0):
+                entry[3] = alert_data['severity']
+                alert.severity = alert_data['severity']
+                alert.message = alert_data['message']
+            self.changed.add(alert)
+            self.dirty += 1
+            self.suppressed += 1
+            return alert, False
+
+        alert = Alert(
+            device_id=device_id,
+            alert_type=alert_data['alert_type'],
+            severity=alert_data['severity'],
+            message=alert_data['message'],
+            alert_metadata=alert_data['metadata'],
+            timestamp=timestamp,
+            first_seen=timestamp,
+            last_seen=timestamp,
+            count=1
+        )
+        self.open_alerts[key] = [alert, 1, timestamp, alert_data['severity']]
+        self.new_alerts.append(alert)
+        self.created += 1
+        return alert, True
+
+    def pending(self) -> int:
+        """
+        Cambios pendientes de persistir
+
+        Returns:
+            Alertas nuevas más repeticiones sin commit
+        """
+        return len(self.new_alerts) + self.dirty
+
+    def should_flush(self) -> bool:
+        """
+        Verificar si toca hacer commit (alertas nuevas, lote lleno o intervalo)
+
+        Returns:
+            True si hay que llamar a flush()
+        """
+        if self.new_alerts or self.pending() >= self.max_pending:
+            return True
+        return self.dirty > 0 and time.time() - self.last_flush >= self.flush_interval
+
+    def flush(self) -> List[Alert]:
+        """
+        Persistir alertas nuevas y contadores en un solo commit
+
+        Returns:
+            Alertas nuevas persistidas (para notificar a la GUI)
+        """
+        created = self.new_alerts
+        changed = self.changed
+        self.new_alerts = []
+        self.changed = set()
+        self.dirty = 0
+        self.last_flush = time.time()
+
+        if not created and not changed:
+            return []
+
+        # Las alertas ya guardadas se reasocian a la sesión: solo se escriben
+        # las columnas modificadas desde el último flush
+        with self.session_factory() as session:
+            try:
+                session.add_all(created)
+                session.add_all(changed)
+                session.commit()
+            except Exception as e:
+                print(f"❌ Error guardando alertas: {e}")
+                session.rollback()
+                # Las alertas descartadas no deben seguir absorbiendo repeticiones
+                for alert in created:
+                    self._forget(alert)
+                return []
+
+        self._expire_open_alerts()
+        return created
+
+    def _forget(self, alert: Alert):
+        """
+        Quitar una alerta de las abiertas
+
+        Args:
+            alert: Alerta a olvidar
+        """
+        for key, entry in list(self.open_alerts.items()):
+            if entry[0] is alert:
+                del self.open_alerts[key]
+
+    def _expire_open_alerts(self):
+        """
+        Cerrar alertas cuya última ocurrencia quedó fuera de la ventana
+        """
+        if self.clock is None:
+            return
+
+        limit = self.clock - self.window
+        expired = [key for key, entry in self.open_alerts.items() if entry[2] < limit]
+        for key in expired:
+            del self.open_alerts[key]
+
+    def get_stats(self) -> dict:
+        """
+        Obtener estadísticas del agregador
+
+        Returns:
+            Dict con ocurrencias recibidas, suprimidas, alertas creadas y abiertas
+        """
+        return {
+            'alerts_submitted': self.submitted,
+            'alerts_suppressed': self.suppressed,
+            'alerts_created': self.created,
+            'alerts_open': len(self.open_alerts),
+            'alerts_pending': self.pending(),
+        }
@@ -5,8 +5,10 @@ Detecta comportamientos anómalos en dispositivos IoT
 """
 
 from datetime import datetime, time
-from typing import Dict, Optional
-from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+from collections import OrderedDict, defaultdict
+
+from .device_baseline import BaselineStore
 
 
 class BehaviorProfiler:
@@ -17,20 +19,43 @@ class BehaviorProfiler:
     - Conexiones a horas inusuales
     - Volúmenes anormales de datos
     - Destinos inesperados geográficamente
+
+    Consume eventos de flujo agregados del FlowTracker (nuevo, delta
+    periódico, fin) y mantiene estado por dispositivo en memoria, de modo
+    que el coste escala con los flujos y no con los paquetes.
     """
 
-    def __init__(self, db_session):
+    SEVERITY_ORDER = {'high': 3, 'medium': 2, 'low': 1}
+
+    def __init__(self, session_factory, device_index=None,
+                 max_checked_destinations: int = 4096):
         """
         Inicializar profiler
 
         Args:
-            db_session: Sesión de base de datos
+            session_factory: Factory de sesiones de base de datos (sesiones
+                             cortas en el thread que entrega los eventos)
+            device_index: DeviceIndex opcional para obtener el tipo de
+                          dispositivo sin consultar la DB
+            max_checked_destinations: Destinos evaluados a recordar por
+                                      dispositivo (LRU)
         """
-        self.db_session = db_session
+        self.session_factory = session_factory
+        self.device_index = device_index
+        self.max_checked_destinations = max_checked_destinations
 
         # Perfiles de dispositivos (calculados dinámicamente)
         self.device_profiles: Dict[int, dict] = defaultdict(dict)
 
+        # Baselines aprendidos (incrementales, con checkpoint en device_baselines)
+        self.baselines = BaselineStore(session_factory)
+
+        # Estado en memoria por dispositivo (alimentado por eventos de flujo)
+        self.device_state: Dict[int, dict] = {}
+
+        # IP → device_id cuando no hay DeviceIndex (una query por IP nueva)
+        self.ip_to_device: Dict[str, Optional[int]] = {}
+
         # Umbrales
         self.UNUSUAL_HOUR_START = time(2, 0)   # 2 AM
         self.UNUSUAL_HOUR_END = time(6, 0)     # 6 AM
@@ -92,13 +117,276 @@ class BehaviorProfiler:
             alerts.append(suspicious_alert)
 
         # Retornar la alerta más severa
-        if alerts:
-            # Ordenar por severidad
-            severity_order = {'high': 3, 'medium': 2, 'low': 1}
-            alerts.sort(key=lambda x: severity_order[x['severity']], reverse=True)
-            return alerts[0]
+        return self._most_severe(alerts)
 
-        return None
+    def _most_severe(self, alerts: List[Dict]) -> Optional[Dict]:
+        """
+        Elegir la alerta más severa
+
+        Args:
+            alerts: Alertas candidatas
+
+        Returns:
+            Alerta de mayor severidad o None si no hay
+        """
+        if not alerts:
+            return None
+        return max(alerts, key=lambda x: self.SEVERITY_ORDER[x['severity']])
+
+    def process_flow_events(self, event: str, flows: List[dict]) -> List[Tuple[int, Dict, datetime]]:
+        """
+        Analizar un lote de eventos de flujo del FlowTracker
+
+        Args:
+            event: 'new', 'update' o 'end'
+            flows: Registros de flujo (ver FlowTracker.subscribe)
+
+        Returns:
+            Lista de (device_id, alerta, timestamp) con todas las alertas detectadas
+            (cada condición se reporta una sola vez por flujo o destino)
+        """
+        results = []
+
+        for flow in flows:
+            device_id = flow.get('device_id') or self._resolve_device_id(flow['src_ip'])
+            if device_id is None:
+                continue
+
+            state = self._get_state(device_id)
+
+            if event == 'new':
+                alerts = self._on_new_flow(device_id, state, flow)
+            elif event == 'update':
+                alerts = self._on_flow_update(device_id, state, flow)
+            elif event == 'end':
+                alerts = self._on_flow_end(device_id, state, flow)
+            else:
+                continue
+
+            if alerts:
+                # Un flujo nuevo se reporta al inicio (las alertas de horario
+                # usan su primer paquete); el resto, al último paquete visto
+                seen = flow['first_seen'] if event == 'new' else flow['last_seen']
+                timestamp = datetime.utcfromtimestamp(seen)
+                results.extend((device_id, alert, timestamp) for alert in alerts)
+
+        self.baselines.maybe_checkpoint()
+        return results
+
+    def _get_state(self, device_id: int) -> dict:
+        """
+        Obtener (o crear) el estado en memoria de un dispositivo
+
+        Args:
+            device_id: ID del dispositivo
+
+        Returns:
+            Dict de estado del dispositivo
+        """
+        state = self.device_state.get(device_id)
+        if state is None:
+            state = {
+                'bytes': 0,
+                'packets': 0,
+                'flows': 0,
+                'active_flows': 0,
+                'last_seen': None,
+                # Destinos ya evaluados por geografía (una vez por destino,
+                # LRU acotado a max_checked_destinations)
+                'checked_destinations': OrderedDict(),
+                # Flujos que ya dispararon high_volume
+                'high_volume_flows': set(),
+            }
+            self.device_state[device_id] = state
+        return state
+
+    @staticmethod
+    def _flow_key(flow: dict) -> tuple:
+        """
+        Clave de un registro de flujo
+
+        Args:
+            flow: Registro de flujo
+
+        Returns:
+            Tupla (src_ip, dst_ip, dst_port, protocol)
+        """
+        return (flow['src_ip'], flow['dst_ip'], flow['dst_port'], flow['protocol'])
+
+    def _on_new_flow(self, device_id: int, state: dict, flow: dict) -> List[Dict]:
+        """
+        Analizar un flujo nuevo: hora inusual y destino
+
+        Returns:
+            Alertas detectadas
+        """
+        state['flows'] += 1
+        state['active_flows'] += 1
+
+        alerts = []
+        dest_ip = flow['dst_ip']
+        dest_country = flow.get('dest_country')
+        started = datetime.utcfromtimestamp(flow['first_seen'])
+
+        # Una alerta por flujo nuevo en horas inusuales (no por paquete)
+        if self._is_unusual_time(started):
+            alerts.append({
+                'alert_type': 'unusual_time',
+                'severity': 'medium',
+                'message': f'Conexión a {dest_ip} durante horas inusuales ({started.strftime("%H:%M")})',
+                'metadata': {
+                    'dest_ip': dest_ip,
+                    'dest_country': dest_country,
+                    'timestamp': started.isoformat()
+                }
+            })
+
+        alerts.extend(self._check_destination_once(device_id, state, dest_ip, dest_country))
+        return alerts
+
+    def _on_flow_update(self, device_id: int, state: dict, flow: dict) -> List[Dict]:
+        """
+        Analizar el delta periódico de un flujo: volumen y destino
+
+        Returns:
+            Alertas detectadas
+        """
+        state['bytes'] += flow['bytes']
+        state['packets'] += flow['packets']
+        state['last_seen'] = flow['last_seen']
+
+        alerts = self._check_destination_once(
+            device_id, state, flow['dst_ip'], flow.get('dest_country')
+        )
+
+        high_volume = self._check_flow_volume(state, flow, flow.get('total_bytes', flow['bytes']))
+        if high_volume:
+            alerts.append(high_volume)
+
+        return alerts
+
+    def _on_flow_end(self, device_id: int, state: dict, flow: dict) -> List[Dict]:
+        """
+        Analizar un flujo terminado y liberar su estado
+
+        Returns:
+            Alertas detectadas
+        """
+        state['active_flows'] = max(0, state['active_flows'] - 1)
+
+        # El flujo completo alimenta el baseline del dispositivo
+        self.baselines.update(
+            device_id, flow['dst_ip'], flow['dst_port'], flow['bytes'],
+            datetime.utcfromtimestamp(flow['first_seen'])
+        )
+
+        alerts = []
+        high_volume = self._check_flow_volume(state, flow, flow['bytes'])
+        if high_volume:
+            alerts.append(high_volume)
+
+        state['high_volume_flows'].discard(self._flow_key(flow))
+        return alerts
+
+    def _check_flow_volume(self, state: dict, flow: dict, total_bytes: int) -> Optional[Dict]:
+        """
+        Verificar si un flujo superó el umbral de volumen (una vez por flujo)
+
+        Args:
+            state: Estado del dispositivo
+            flow: Registro de flujo
+            total_bytes: Bytes acumulados del flujo
+
+        Returns:
+            Alerta high_volume o None
+        """
+        if total_bytes <= self.HIGH_VOLUME_THRESHOLD:
+            return None
+
+        key = self._flow_key(flow)
+        if key in state['high_volume_flows']:
+            return None
+        state['high_volume_flows'].add(key)
+
+        return {
+            'alert_type': 'high_volume',
+            'severity': 'high',
+            'message': f'Volumen inusualmente alto de datos: {total_bytes / (1024*1024):.1f} MB enviados',
+            'metadata': {
+                'dest_ip': flow['dst_ip'],
+                'bytes_sent': total_bytes
+            }
+        }
+
+    def _check_destination_once(self, device_id: int, state: dict, dest_ip: str,
+                                dest_country: Optional[str]) -> List[Dict]:
+        """
+        Evaluar un destino por geografía la primera vez que se conoce su país
+
+        Returns:
+            Lista con la alerta de destino sospechoso (vacía si no aplica)
+        """
+        if not dest_country:
+            return []
+
+        checked = state['checked_destinations']
+        if dest_ip in checked:
+            checked.move_to_end(dest_ip)
+            return []
+
+        # Un destino expulsado se vuelve a evaluar si reaparece (el
+        # AlertAggregator agrupa la alerta repetida)
+        checked[dest_ip] = True
+        if len(checked) > self.max_checked_destinations:
+            checked.popitem(last=False)
+
+        alert = self._check_suspicious_destination(device_id, dest_country, dest_ip)
+        return [alert] if alert else []
+
+    def _resolve_device_id(self, ip_address: str) -> Optional[int]:
+        """
+        Resolver IP origen → device_id
+
+        Args:
+            ip_address: IP del dispositivo
+
+        Returns:
+            ID del dispositivo o None si no es un dispositivo conocido
+        """
+        if self.device_index is not None:
+            return self.device_index.get_device_id(ip_address)
+
+        if ip_address not in self.ip_to_device:
+            from agent.database.models import Device
+
+            with self.session_factory() as session:
+                device = session.query(Device.id).filter_by(ip_address=ip_address).first()
+            self.ip_to_device[ip_address] = device.id if device else None
+
+        return self.ip_to_device[ip_address]
+
+    def get_device_state(self, device_id: int) -> Optional[dict]:
+        """
+        Obtener resumen del estado en memoria de un dispositivo
+
+        Args:
+            device_id: ID del dispositivo
+
+        Returns:
+            Dict con bytes, paquetes, flujos y destinos evaluados, o None
+        """
+        state = self.device_state.get(device_id)
+        if state is None:
+            return None
+
+        return {
+            'bytes': state['bytes'],
+            'packets': state['packets'],
+            'flows': state['flows'],
+            'active_flows': state['active_flows'],
+            'last_seen': state['last_seen'],
+            'destinations': len(state['checked_destinations']),
+        }
 
     def _is_unusual_time(self, timestamp: datetime) -> bool:
         """
@@ -126,15 +414,12 @@ class BehaviorProfiler:
         Returns:
             Alerta si es sospechoso
         """
-        from agent.database.models import Device
-
         # Obtener tipo de dispositivo
-        device = self.db_session.query(Device).filter_by(id=device_id).first()
-        if not device:
+        device_type = self._get_device_type(device_id)
+        if device_type is None:
             return None
 
         # Heurísticas específicas por tipo de dispositivo
-        device_type = device.device_type
 
         # Cámaras conectándose a países lejanos
         if device_type == 'camera':
@@ -169,9 +454,34 @@ class BehaviorProfiler:
 
         return None
 
+    def _get_device_type(self, device_id: int) -> Optional[str]:
+        """
+        Obtener tipo de dispositivo (índice en memoria o DB como fallback)
+
+        Args:
+            device_id: ID del dispositivo
+
+        Returns:
+            Tipo de dispositivo, '' si no tiene tipo o None si no existe
+        """
+        if self.device_index is not None:
+            entry = self.device_index.get_by_id(device_id)
+            return (entry['device_type'] or '') if entry else None
+
+        from agent.database.models import Device
+
+        with self.session_factory() as session:
+            device = session.query(Device).filter_by(id=device_id).first()
+            if not device:
+                return None
+            return device.device_type or ''
+
     def calculate_device_baseline(self, device_id: int):
         """
-        Calcular comportamiento baseline de un dispositivo
+        Obtener comportamiento baseline de un dispositivo
+
+        Se lee del baseline aprendido (sin recorrer `flows`; solo un
+        dispositivo sin checkpoint se inicializa una vez desde la tabla).
 
         Args:
             device_id: ID del dispositivo
@@ -179,25 +489,19 @@ class BehaviorProfiler:
         Returns:
             Dict con estadísticas baseline
         """
-        from agent.database.models import Flow
-        from sqlalchemy import func
-
-        # Calcular estadísticas de los últimos 7 días
-        stats = self.db_session.query(
-            func.avg(Flow.bytes_sent).label('avg_bytes'),
-            func.max(Flow.bytes_sent).label('max_bytes'),
-            func.count(Flow.id).label('total_flows')
-        ).filter(
-            Flow.device_id == device_id
-        ).first()
-
-        if stats and stats.total_flows > 0:
-            baseline = {
-                'avg_bytes': stats.avg_bytes or 0,
-                'max_bytes': stats.max_bytes or 0,
-                'total_flows': stats.total_flows
-            }
-            self.device_profiles[device_id] = baseline
-            return baseline
+        baseline = self.baselines.get(device_id)
+        if baseline is None or not baseline.total_flows:
+            return None
 
-        return None
+        summary = baseline.summary()
+        self.device_profiles[device_id] = summary
+        return summary
+
+    def save_baselines(self) -> bool:
+        """
+        Forzar checkpoint de los baselines modificados
+
+        Returns:
+            True si se escribió el checkpoint
+        """
+        return self.baselines.checkpoint()
@@ -0,0 +1,464 @@
+"""
+IoT Sentry - Baselines Aprendidos por Dispositivo
+
+Comportamiento "normal" de cada dispositivo, actualizado de forma
+incremental con cada flujo terminado: histograma de actividad por hora,
+destinos y puertos vistos y distribución de bytes por flujo (sketch de
+cuantiles con buckets logarítmicos). Se guarda en `device_baselines` con
+checkpoints periódicos, de modo que reiniciar no exige recorrer `flows`.
+"""
+
+import math
+import time
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+from .flow_history import merge_flow_deltas, row_dicts
+
+
+class QuantileSketch:
+    """
+    Sketch de cuantiles con buckets logarítmicos (error relativo acotado)
+
+    Cada valor v > 0 cae en el bucket ceil(log(v) / log(gamma)), con
+    gamma = (1 + accuracy) / (1 - accuracy): cualquier cuantil se estima con
+    error relativo <= accuracy. Si se superan `max_buckets` se fusionan los
+    buckets más bajos (la cola alta, la relevante para anomalías, se conserva).
+    """
+
+    def __init__(self, accuracy: float = 0.02, max_buckets: int = 2048):
+        """
+        Inicializar sketch
+
+        Args:
+            accuracy: Error relativo máximo de los cuantiles
+            max_buckets: Buckets máximos a conservar
+        """
+        self.accuracy = accuracy
+        self.gamma = (1 + accuracy) / (1 - accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.max_buckets = max_buckets
+        self.buckets: Dict[int, int] = {}
+        self.zero_count = 0
+        self.count = 0
+
+    def add(self, value: float, count: int = 1):
+        """
+        Añadir un valor
+
+        Args:
+            value: Valor (se ignoran negativos)
+            count: Repeticiones del valor
+        """
+        if value < 0:
+            return
+
+        self.count += count
+        if value < 1:
+            self.zero_count += count
+            return
+
+        index = math.ceil(math.log(value) / self.log_gamma)
+        self.buckets[index] = self.buckets.get(index, 0) + count
+
+        if len(self.buckets) > self.max_buckets:
+            self._collapse()
+
+    def _collapse(self):
+        """
+        Fusionar los buckets más bajos hasta volver al límite
+        """
+        indexes = sorted(self.buckets)
+        excess = len(indexes) - self.max_buckets
+        target = indexes[excess]
+        for index in indexes[:excess]:
+            self.buckets[target] += self.buckets.pop(index)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """
+        Estimar un cuantil
+
+        Args:
+            q: Cuantil en [0, 1]
+
+        Returns:
+            Valor estimado o None si el sketch está vacío
+        """
+        if self.count == 0:
+            return None
+
+        rank = q * (self.count - 1)
+        if rank < self.zero_count:
+            return 0.0
+
+        seen = self.zero_count
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen > rank:
+                # Punto medio del bucket (gamma^(i-1), gamma^i]
+                return 2 * self.gamma ** index / (self.gamma + 1)
+
+        return 2 * self.gamma ** max(self.buckets) / (self.gamma + 1)
+
+    def to_dict(self) -> dict:
+        """
+        Serializar (JSON)
+
+        Returns:
+            Dict con precisión, contadores y buckets
+        """
+        return {
+            'accuracy': self.accuracy,
+            'zero_count': self.zero_count,
+            'count': self.count,
+            'buckets': {str(index): count for index, count in self.buckets.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data: Optional[dict], max_buckets: int = 2048) -> 'QuantileSketch':
+        """
+        Reconstruir desde to_dict()
+
+        Args:
+            data: Dict serializado (None → sketch vacío)
+            max_buckets: Buckets máximos
+
+        Returns:
+            QuantileSketch
+        """
+        if not data:
+            return cls(max_buckets=max_buckets)
+
+        sketch = cls(accuracy=data.get('accuracy', 0.02), max_buckets=max_buckets)
+        sketch.zero_count = data.get('zero_count', 0)
+        sketch.count = data.get('count', 0)
+        sketch.buckets = {int(index): count for index, count in data.get('buckets', {}).items()}
+        return sketch
+
+
+class LearnedBaseline:
+    """
+    Baseline en memoria de un dispositivo
+    """
+
+    def __init__(self, device_id: int, max_destinations: int = 4096, max_ports: int = 1024):
+        """
+        Inicializar baseline vacío
+
+        Args:
+            device_id: ID del dispositivo
+            max_destinations: Destinos máximos a recordar
+            max_ports: Puertos máximos a recordar
+        """
+        self.device_id = device_id
+        self.max_destinations = max_destinations
+        self.max_ports = max_ports
+
+        self.hourly_histogram: List[int] = [0] * 24
+        self.destinations = set()
+        self.ports = set()
+        self.bytes_sketch = QuantileSketch()
+        self.total_flows = 0
+        self.total_bytes = 0
+        self.max_bytes = 0
+
+    def update(self, dest_ip: str, dest_port: Optional[int], bytes_sent: int,
+               timestamp: datetime):
+        """
+        Incorporar un flujo
+
+        Args:
+            dest_ip: IP destino
+            dest_port: Puerto destino (None si no aplica)
+            bytes_sent: Bytes del flujo completo (no un delta de intervalo)
+            timestamp: Inicio del flujo (UTC)
+        """
+        self.hourly_histogram[timestamp.hour] += 1
+
+        if dest_ip not in self.destinations and len(self.destinations) < self.max_destinations:
+            self.destinations.add(dest_ip)
+        if dest_port is not None and dest_port not in self.ports and len(self.ports) < self.max_ports:
+            self.ports.add(dest_port)
+
+        self.bytes_sketch.add(bytes_sent)
+        self.total_flows += 1
+        self.total_bytes += bytes_sent
+        if bytes_sent > self.max_bytes:
+            self.max_bytes = bytes_sent
+
+    def hour_share(self, hour: int) -> float:
+        """
+        Fracción de los flujos del dispositivo que ocurren a una hora
+
+        Args:
+            hour: Hora UTC (0-23)
+
+        Returns:
+            Fracción entre 0 y 1 (0 si no hay historial)
+        """
+        if not self.total_flows:
+            return 0.0
+        return self.hourly_histogram[hour] / self.total_flows
+
+    def summary(self) -> dict:
+        """
+        Resumen del baseline
+
+        Returns:
+            Dict con avg/max/cuantiles de bytes, flujos, horas activas,
+            destinos y puertos
+        """
+        return {
+            'avg_bytes': self.total_bytes / self.total_flows if self.total_flows else 0,
+            'max_bytes': self.max_bytes,
+            'p50_bytes': self.bytes_sketch.quantile(0.5),
+            'p95_bytes': self.bytes_sketch.quantile(0.95),
+            'p99_bytes': self.bytes_sketch.quantile(0.99),
+            'total_flows': self.total_flows,
+            'active_hours': [hour for hour, count in enumerate(self.hourly_histogram) if count],
+            'destinations': len(self.destinations),
+            'ports': sorted(self.ports),
+        }
+
+    def to_row(self, row):
+        """
+        Copiar el estado a una fila DeviceBaseline
+
+        Args:
+            row: Instancia de DeviceBaseline
+        """
+        # Objetos nuevos para que SQLAlchemy detecte el cambio en columnas JSON
+        row.hourly_histogram = list(self.hourly_histogram)
+        row.destinations = sorted(self.destinations)
+        row.ports = sorted(self.ports)
+        row.bytes_sketch = self.bytes_sketch.to_dict()
+        row.total_flows = self.total_flows
+        row.total_bytes = self.total_bytes
+        row.max_bytes = self.max_bytes
+        row.updated_at = datetime.utcnow()
+
+    @classmethod
+    def from_row(cls, row) -> 'LearnedBaseline':
+        """
+        Reconstruir desde una fila DeviceBaseline
+
+        Args:
+            row: Instancia de DeviceBaseline
+
+        Returns:
+            LearnedBaseline
+        """
+        baseline = cls(row.device_id)
+        baseline.hourly_histogram = list(row.hourly_histogram or [0] * 24)
+        baseline.destinations = set(row.destinations or [])
+        baseline.ports = set(row.ports or [])
+        baseline.bytes_sketch = QuantileSketch.from_dict(row.bytes_sketch)
+        baseline.total_flows = row.total_flows or 0
+        baseline.total_bytes = row.total_bytes or 0
+        baseline.max_bytes = row.max_bytes or 0
+        return baseline
+
+
+class BaselineStore:
+    """
+    Baselines de todos los dispositivos con checkpoints en la DB
+
+    Los baselines se cargan de `device_baselines` al primer uso; un
+    dispositivo sin checkpoint se inicializa una única vez desde `flows`.
+    Los cambios se escriben cada `checkpoint_interval` segundos.
+    """
+
+    def __init__(self, session_factory, checkpoint_interval: float = 300.0):
+        """
+        Inicializar store
+
+        Args:
+            session_factory: Factory de sesiones (una sesión corta por carga,
+                             bootstrap y checkpoint)
+            checkpoint_interval: Segundos entre checkpoints
+        """
+        self.session_factory = session_factory
+        self.checkpoint_interval = checkpoint_interval
+
+        self.baselines: Dict[int, LearnedBaseline] = {}
+        # Filas DeviceBaseline (desacopladas entre checkpoints)
+        self.rows: Dict[int, object] = {}
+        self.dirty = set()
+        self.loaded = False
+        self.last_checkpoint = time.time()
+
+        self.checkpoints = 0
+        self.bootstrapped = 0
+
+    def load(self):
+        """
+        Cargar todos los checkpoints (una query)
+        """
+        from agent.database.models import DeviceBaseline
+
+        with self.session_factory() as session:
+            rows = session.query(DeviceBaseline).all()
+
+        for row in rows:
+            self.rows[row.device_id] = row
+            if row.device_id not in self.baselines:
+                self.baselines[row.device_id] = LearnedBaseline.from_row(row)
+        self.loaded = True
+
+    def get(self, device_id: int, bootstrap: bool = True) -> Optional[LearnedBaseline]:
+        """
+        Obtener el baseline de un dispositivo
+
+        Args:
+            device_id: ID del dispositivo
+            bootstrap: Inicializarlo desde `flows` si no tiene checkpoint
+
+        Returns:
+            LearnedBaseline o None si no hay datos
+        """
+        if not self.loaded:
+            self.load()
+
+        baseline = self.baselines.get(device_id)
+        if baseline is None and bootstrap:
+            baseline = self._bootstrap(device_id)
+        return baseline
+
+    def _get_or_create(self, device_id: int) -> LearnedBaseline:
+        """
+        Obtener (o crear vacío) el baseline de un dispositivo
+
+        Returns:
+            LearnedBaseline
+        """
+        if not self.loaded:
+            self.load()
+
+        baseline = self.baselines.get(device_id)
+        if baseline is None:
+            baseline = self._bootstrap(device_id) or LearnedBaseline(device_id)
+            self.baselines[device_id] = baseline
+        return baseline
+
+    def _bootstrap(self, device_id: int) -> Optional[LearnedBaseline]:
+        """
+        Construir un baseline desde los flujos guardados (solo sin checkpoint)
+
+        Cada fila de `flows` es el delta de un intervalo de flush, mientras
+        que el baseline se alimenta con flujos completos (como en vivo, al
+        terminar cada flujo): los deltas se reagrupan con merge_flow_deltas.
+
+        Args:
+            device_id: ID del dispositivo
+
+        Returns:
+            LearnedBaseline o None si el dispositivo no tiene flujos
+        """
+        from agent.database.models import Flow
+
+        baseline = LearnedBaseline(device_id)
+        with self.session_factory() as session:
+            rows = session.query(
+                Flow.dest_ip, Flow.dest_port, Flow.protocol, Flow.bytes_sent, Flow.timestamp
+            ).filter(Flow.device_id == device_id).order_by(Flow.timestamp).yield_per(5000)
+
+            for flow in merge_flow_deltas(row_dicts(rows)):
+                baseline.update(flow['dest_ip'], flow['dest_port'],
+                                flow['bytes_sent'] or 0, flow['timestamp'])
+
+        if not baseline.total_flows:
+            return None
+
+        self.baselines[device_id] = baseline
+        self.dirty.add(device_id)
+        self.bootstrapped += 1
+        return baseline
+
+    def update(self, device_id: int, dest_ip: str, dest_port: Optional[int],
+               bytes_sent: int, timestamp: datetime):
+        """
+        Incorporar un flujo terminado al baseline del dispositivo
+
+        Args:
+            device_id: ID del dispositivo
+            dest_ip: IP destino
+            dest_port: Puerto destino
+            bytes_sent: Bytes del flujo completo (no un delta de intervalo)
+            timestamp: Inicio del flujo (UTC)
+        """
+        self._get_or_create(device_id).update(dest_ip, dest_port, bytes_sent, timestamp)
+        self.dirty.add(device_id)
+
+    def update_many(self, flows: Iterable[tuple]):
+        """
+        Incorporar varios flujos
+
+        Args:
+            flows: Tuplas (device_id, dest_ip, dest_port, bytes_sent, timestamp)
+        """
+        for device_id, dest_ip, dest_port, bytes_sent, timestamp in flows:
+            self.update(device_id, dest_ip, dest_port, bytes_sent, timestamp)
+
+    def maybe_checkpoint(self) -> bool:
+        """
+        Hacer checkpoint si pasó el intervalo
+
+        Returns:
+            True si se escribió un checkpoint
+        """
+        if not self.dirty or time.time() - self.last_checkpoint < self.checkpoint_interval:
+            return False
+        return self.checkpoint()
+
+    def checkpoint(self) -> bool:
+        """
+        Guardar los baselines modificados (un commit)
+
+        Returns:
+            True si se escribió correctamente
+        """
+        from agent.database.models import DeviceBaseline
+
+        self.last_checkpoint = time.time()
+        if not self.dirty:
+            return False
+
+        created = []
+        with self.session_factory() as session:
+            try:
+                for device_id in self.dirty:
+                    row = self.rows.get(device_id)
+                    if row is None:
+                        row = DeviceBaseline(device_id=device_id)
+                        self.rows[device_id] = row
+                        created.append(device_id)
+                    self.baselines[device_id].to_row(row)
+                    # Filas nuevas o ya guardadas: se reasocian a esta sesión
+                    session.add(row)
+
+                session.commit()
+            except Exception as e:
+                print(f"❌ Error guardando baselines: {e}")
+                session.rollback()
+                # Las filas nuevas descartadas por el rollback se vuelven a crear
+                for device_id in created:
+                    self.rows.pop(device_id, None)
+                return False
+
+        self.dirty.clear()
+        self.checkpoints += 1
+        return True
+
+    def get_stats(self) -> dict:
+        """
+        Obtener estadísticas del store
+
+        Returns:
+            Dict con baselines en memoria, pendientes y checkpoints
+        """
+        return {
+            'baselines': len(self.baselines),
+            'baselines_dirty': len(self.dirty),
+            'baseline_checkpoints': self.checkpoints,
+            'baselines_bootstrapped': self.bootstrapped,
+        }
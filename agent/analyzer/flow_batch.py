@@ -0,0 +1,198 @@
+"""
+IoT Sentry - Bloques Columnares de Flujos
+
+Representación de un lote de flujos como arrays NumPy paralelos, para
+evaluar reglas de anomalía con máscaras vectorizadas en lugar de flujo
+por flujo. Los strings (países, tipos de dispositivo, IPs destino) se
+internan a códigos enteros; las IPv4 se guardan además como enteros.
+"""
+
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+from .flow_history import merge_flow_deltas, row_dicts
+from .ip_classifier import ip_to_int
+from .sliding_window import to_epoch
+
+# Puerto ausente (ICMP, etc.)
+NO_PORT = -1
+
+
+class FlowBatch:
+    """
+    Lote columnar de flujos
+
+    Columnas (todas de la misma longitud):
+        device_ids, dest_ports, bytes_sent, bytes_received, timestamps (epoch),
+        country_codes (→ self.countries), device_type_codes (→ self.device_types),
+        dest_ip_codes (→ self.ips) y dest_ip_ints (IPv4 como entero, 0 si no es IPv4)
+    """
+
+    def __init__(self):
+        """Inicializar lote vacío"""
+        self.countries: List[Optional[str]] = []
+        self.device_types: List[Optional[str]] = []
+        self.ips: List[str] = []
+        self._country_ids: Dict[Optional[str], int] = {}
+        self._device_type_ids: Dict[Optional[str], int] = {}
+        self._ip_ids: Dict[str, int] = {}
+
+        self.device_ids = np.zeros(0, dtype=np.int64)
+        self.dest_ports = np.zeros(0, dtype=np.int64)
+        self.bytes_sent = np.zeros(0, dtype=np.int64)
+        self.bytes_received = np.zeros(0, dtype=np.int64)
+        self.timestamps = np.zeros(0, dtype=np.float64)
+        self.country_codes = np.zeros(0, dtype=np.int32)
+        self.device_type_codes = np.zeros(0, dtype=np.int32)
+        self.dest_ip_codes = np.zeros(0, dtype=np.int64)
+        self.dest_ip_ints = np.zeros(0, dtype=np.int64)
+
+    def __len__(self) -> int:
+        return len(self.device_ids)
+
+    @staticmethod
+    def _intern(value, ids: Dict, values: List) -> int:
+        """
+        Obtener código entero de un valor (creándolo si no existe)
+
+        Returns:
+            Código del valor
+        """
+        code = ids.get(value)
+        if code is None:
+            code = len(values)
+            ids[value] = code
+            values.append(value)
+        return code
+
+    def dest_ip(self, row: int) -> str:
+        """
+        IP destino de una fila
+
+        Args:
+            row: Índice de la fila
+
+        Returns:
+            IP destino
+        """
+        return self.ips[self.dest_ip_codes[row]]
+
+    def country_code(self, country: Optional[str]) -> int:
+        """
+        Código de un país (-1 si no aparece en el lote)
+
+        Args:
+            country: Nombre del país
+
+        Returns:
+            Código o -1
+        """
+        return self._country_ids.get(country, -1)
+
+    def device_type_code(self, device_type: Optional[str]) -> int:
+        """
+        Código de un tipo de dispositivo (-1 si no aparece en el lote)
+
+        Args:
+            device_type: Tipo de dispositivo
+
+        Returns:
+            Código o -1
+        """
+        return self._device_type_ids.get(device_type, -1)
+
+    @classmethod
+    def from_records(cls, records: Iterable[dict],
+                     device_types: Optional[Dict[int, str]] = None) -> 'FlowBatch':
+        """
+        Construir lote desde registros de flujo
+
+        Args:
+            records: Dicts con device_id, dest_ip, dest_port, dest_country,
+                     bytes_sent, bytes_received (opcional) y timestamp
+                     (datetime UTC o epoch); acepta también Flow.to_dict()
+            device_types: device_id → tipo de dispositivo (si el registro no
+                          trae 'device_type')
+
+        Returns:
+            FlowBatch
+        """
+        batch = cls()
+        device_types = device_types or {}
+
+        device_ids, ports, sent, received, timestamps = [], [], [], [], []
+        countries, types, ip_codes = [], [], []
+
+        for record in records:
+            device_id = record['device_id']
+            dest_ip = record['dest_ip']
+            port = record.get('dest_port')
+            timestamp = record['timestamp']
+            if isinstance(timestamp, str):
+                timestamp = datetime.fromisoformat(timestamp)
+
+            device_ids.append(device_id)
+            ports.append(NO_PORT if port is None else port)
+            sent.append(record.get('bytes_sent') or 0)
+            received.append(record.get('bytes_received') or 0)
+            timestamps.append(to_epoch(timestamp))
+            countries.append(batch._intern(record.get('dest_country'),
+                                           batch._country_ids, batch.countries))
+            device_type = record.get('device_type', device_types.get(device_id))
+            types.append(batch._intern(device_type, batch._device_type_ids, batch.device_types))
+
+            ip_codes.append(batch._intern(dest_ip, batch._ip_ids, batch.ips))
+
+        batch.device_ids = np.array(device_ids, dtype=np.int64)
+        batch.dest_ports = np.array(ports, dtype=np.int64)
+        batch.bytes_sent = np.array(sent, dtype=np.int64)
+        batch.bytes_received = np.array(received, dtype=np.int64)
+        batch.timestamps = np.array(timestamps, dtype=np.float64)
+        batch.country_codes = np.array(countries, dtype=np.int32)
+        batch.device_type_codes = np.array(types, dtype=np.int32)
+        batch.dest_ip_codes = np.array(ip_codes, dtype=np.int64)
+
+        # IPv4 como entero: se convierte una vez por IP única
+        unique_ints = []
+        for ip in batch.ips:
+            parsed = ip_to_int(ip)
+            unique_ints.append(parsed[1] if parsed and parsed[0] == 4 else 0)
+        batch.dest_ip_ints = np.array(unique_ints, dtype=np.int64)[batch.dest_ip_codes]
+        return batch
+
+    @classmethod
+    def from_query(cls, db_session, start: Optional[datetime] = None,
+                   end: Optional[datetime] = None) -> 'FlowBatch':
+        """
+        Construir lote con los flujos guardados en la DB (ej. un día de historial)
+
+        Las filas de `flows` son deltas por intervalo de flush: se reagrupan
+        en flujos completos (merge_flow_deltas) para evaluar cada flujo una
+        vez y con sus bytes totales, como en vivo. Un flujo que cruza los
+        límites del rango solo aporta los deltas que caen dentro.
+
+        Args:
+            db_session: Sesión de SQLAlchemy
+            start: Inicio del rango (UTC, incluido)
+            end: Fin del rango (UTC, excluido)
+
+        Returns:
+            FlowBatch ordenado por inicio de flujo
+        """
+        from agent.database.models import Flow, Device
+
+        query = db_session.query(
+            Flow.device_id, Flow.dest_ip, Flow.dest_port, Flow.protocol, Flow.dest_country,
+            Flow.bytes_sent, Flow.timestamp, Device.device_type
+        ).join(Device, Flow.device_id == Device.id)
+
+        if start is not None:
+            query = query.filter(Flow.timestamp >= start)
+        if end is not None:
+            query = query.filter(Flow.timestamp < end)
+
+        rows = query.order_by(Flow.timestamp).all()
+        flows = sorted(merge_flow_deltas(row_dicts(rows)), key=lambda flow: flow['timestamp'])
+        return cls.from_records(flows)
@@ -0,0 +1,212 @@
+"""
+IoT Sentry - Cache de Geolocalización
+
+Cache LRU acotada por IP con TTL, cache de resultados negativos,
+contadores de aciertos/fallos y persistencia en un archivo sidecar JSON
+"""
+
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+# Marcador para distinguir "no está en cache" de un resultado None cacheado
+MISSING = object()
+
+# Versión del formato del archivo sidecar
+CACHE_FILE_VERSION = 1
+
+
+class GeoCache:
+    """
+    Cache LRU de resultados de geolocalización
+
+    Cada entrada guarda (resultado, expira_en). Los resultados negativos
+    (IP no encontrada, None) usan un TTL propio más corto para que no
+    queden fijados para siempre.
+    """
+
+    def __init__(self, max_size: int = 65536, ttl: float = 86400,
+                 negative_ttl: float = 3600):
+        """
+        Inicializar cache
+
+        Args:
+            max_size: Número máximo de IPs en cache
+            ttl: Segundos de validez de un resultado positivo
+            negative_ttl: Segundos de validez de un resultado negativo
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+
+        # ip → (resultado, expira_en epoch)
+        self.entries: "OrderedDict[str, Tuple[Optional[dict], float]]" = OrderedDict()
+        self.lock = threading.Lock()
+
+        # Contadores
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, ip_address: str):
+        """
+        Buscar IP en cache
+
+        Args:
+            ip_address: Dirección IP
+
+        Returns:
+            Resultado cacheado (puede ser None) o MISSING si no está o expiró
+        """
+        with self.lock:
+            entry = self.entries.get(ip_address)
+            if entry is None:
+                self.misses += 1
+                return MISSING
+
+            result, expires_at = entry
+            if expires_at < time.time():
+                del self.entries[ip_address]
+                self.expirations += 1
+                self.misses += 1
+                return MISSING
+
+            self.entries.move_to_end(ip_address)
+            self.hits += 1
+            if result is None or result.get('country_code') == '??':
+                self.negative_hits += 1
+            return result
+
+    def put(self, ip_address: str, result: Optional[dict], negative: bool = False):
+        """
+        Guardar resultado en cache
+
+        Args:
+            ip_address: Dirección IP
+            result: Resultado de geolocalización
+            negative: True si es un resultado negativo (usa negative_ttl)
+        """
+        ttl = self.negative_ttl if negative or result is None else self.ttl
+
+        with self.lock:
+            self.entries[ip_address] = (result, time.time() + ttl)
+            self.entries.move_to_end(ip_address)
+
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """
+        Vaciar cache
+        """
+        with self.lock:
+            self.entries.clear()
+
+    def load(self, path: str, source_mtime: Optional[float] = None) -> int:
+        """
+        Cargar entradas vigentes desde archivo sidecar
+
+        Args:
+            path: Ruta al archivo JSON
+            source_mtime: mtime de la base GeoLite2; si cambió, el archivo se ignora
+
+        Returns:
+            Número de entradas cargadas
+        """
+        if not os.path.exists(path):
+            return 0
+
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"⚠️  Cache de geolocalización ilegible ({path}): {e}")
+            return 0
+
+        if data.get('version') != CACHE_FILE_VERSION:
+            return 0
+        if source_mtime is not None and data.get('source_mtime') != source_mtime:
+            # Base GeoLite2 actualizada: los resultados pueden haber cambiado
+            return 0
+
+        now = time.time()
+        loaded = 0
+
+        with self.lock:
+            for ip_address, result, expires_at in data.get('entries', []):
+                if expires_at > now:
+                    self.entries[ip_address] = (result, expires_at)
+                    loaded += 1
+
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+        return loaded
+
+    def save(self, path: str, source_mtime: Optional[float] = None) -> int:
+        """
+        Guardar entradas vigentes en archivo sidecar (escritura atómica)
+
+        Args:
+            path: Ruta al archivo JSON
+            source_mtime: mtime de la base GeoLite2 asociada
+
+        Returns:
+            Número de entradas guardadas
+        """
+        now = time.time()
+        with self.lock:
+            entries = [
+                [ip_address, result, expires_at]
+                for ip_address, (result, expires_at) in self.entries.items()
+                if expires_at > now
+            ]
+
+        data = {
+            'version': CACHE_FILE_VERSION,
+            'source_mtime': source_mtime,
+            'entries': entries,
+        }
+
+        tmp_path = path + '.tmp'
+        try:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"⚠️  No se pudo guardar cache de geolocalización: {e}")
+            return 0
+
+        return len(entries)
+
+    def get_stats(self) -> dict:
+        """
+        Obtener estadísticas de la cache
+
+        Returns:
+            Dict con tamaño, aciertos, fallos, evicciones y expiraciones
+        """
+        lookups = self.hits + self.misses
+
+        return {
+            'cache_size': len(self.entries),
+            'cache_max_size': self.max_size,
+            'cache_hits': self.hits,
+            'cache_negative_hits': self.negative_hits,
+            'cache_misses': self.misses,
+            'cache_evictions': self.evictions,
+            'cache_expirations': self.expirations,
+            'cache_hit_rate': (self.hits / lookups) if lookups else 0.0,
+        }
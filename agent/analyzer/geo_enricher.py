@@ -0,0 +1,179 @@
+"""
+IoT Sentry - Enriquecimiento Geográfico Asíncrono
+
+Resuelve la geolocalización una vez por destino nuevo en un pool de
+workers, fuera del camino de los paquetes. Los consumidores solo leen
+resultados ya resueltos (un lookup en dict) y nunca tocan el reader mmdb.
+"""
+
+import queue
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional
+
+
+class GeoEnricher:
+    """
+    Etapa de enriquecimiento geográfico por destino
+
+    `request()` encola un destino si no está resuelto ni pendiente;
+    `get()` devuelve el resultado si ya está disponible (sin bloquear).
+    """
+
+    def __init__(self, geo_locator, workers: int = 2, queue_size: int = 10000,
+                 max_results: int = 65536):
+        """
+        Inicializar etapa
+
+        Args:
+            geo_locator: GeoLocator usado por los workers
+            workers: Threads del pool de resolución
+            queue_size: Destinos pendientes máximos (los excedentes se descartan
+                        y se vuelven a pedir más tarde)
+            max_results: Destinos resueltos a conservar en memoria
+        """
+        self.geo_locator = geo_locator
+        self.num_workers = workers
+        self.max_results = max_results
+
+        self.queue: "queue.Queue[str]" = queue.Queue(maxsize=queue_size)
+        self.results: "OrderedDict[str, Optional[dict]]" = OrderedDict()
+        self.pending = set()
+        self.lock = threading.Lock()
+
+        # Se activa cuando no quedan destinos pendientes
+        self.idle = threading.Event()
+        self.idle.set()
+
+        self.workers = []
+        self.running = False
+
+        self.requested = 0
+        self.resolved = 0
+        self.dropped = 0
+
+    def request(self, dst_ip: str):
+        """
+        Pedir la geolocalización de un destino (no bloquea)
+
+        Args:
+            dst_ip: IP destino
+        """
+        if dst_ip in self.results or dst_ip in self.pending:
+            return
+
+        with self.lock:
+            if dst_ip in self.results or dst_ip in self.pending:
+                return
+            self.pending.add(dst_ip)
+            self.idle.clear()
+
+        try:
+            self.queue.put_nowait(dst_ip)
+            self.requested += 1
+        except queue.Full:
+            with self.lock:
+                self.pending.discard(dst_ip)
+                if not self.pending:
+                    self.idle.set()
+            self.dropped += 1
+
+    def request_many(self, ips: Iterable[str]):
+        """
+        Pedir la geolocalización de varios destinos
+
+        Args:
+            ips: IPs destino
+        """
+        for dst_ip in ips:
+            self.request(dst_ip)
+
+    def get(self, dst_ip: str) -> Optional[dict]:
+        """
+        Obtener geolocalización ya resuelta
+
+        Args:
+            dst_ip: IP destino
+
+        Returns:
+            Dict de geolocalización o None si aún no está resuelta (o no existe)
+        """
+        return self.results.get(dst_ip)
+
+    def wait_idle(self, timeout: float) -> bool:
+        """
+        Esperar a que se resuelvan los destinos pendientes
+
+        Args:
+            timeout: Segundos máximos de espera
+
+        Returns:
+            True si no quedan pendientes
+        """
+        return self.idle.wait(timeout)
+
+    def _worker_loop(self):
+        """
+        Resolver destinos de la cola (ejecutado en cada thread del pool)
+        """
+        while self.running:
+            try:
+                dst_ip = self.queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+
+            try:
+                geo_info = self.geo_locator.geolocate(dst_ip)
+            except Exception as e:
+                print(f"⚠️  Error enriqueciendo {dst_ip}: {e}")
+                geo_info = None
+
+            with self.lock:
+                self.results[dst_ip] = geo_info
+                while len(self.results) > self.max_results:
+                    self.results.popitem(last=False)
+
+                self.pending.discard(dst_ip)
+                self.resolved += 1
+                if not self.pending:
+                    self.idle.set()
+
+    def start(self):
+        """
+        Iniciar pool de workers
+        """
+        if self.running:
+            return
+
+        self.running = True
+        for _ in range(self.num_workers):
+            worker = threading.Thread(target=self._worker_loop, daemon=True)
+            worker.start()
+            self.workers.append(worker)
+
+    def stop(self):
+        """
+        Detener pool de workers
+        """
+        if not self.running:
+            return
+
+        self.running = False
+        for worker in self.workers:
+            worker.join(timeout=2)
+        self.workers = []
+
+    def get_stats(self) -> Dict[str, int]:
+        """
+        Obtener estadísticas de la etapa
+
+        Returns:
+            Dict con destinos pedidos, resueltos, pendientes y descartados
+        """
+        return {
+            'geo_requested': self.requested,
+            'geo_resolved': self.resolved,
+            'geo_pending': len(self.pending),
+            'geo_dropped': self.dropped,
+            'geo_destinations': len(self.results),
+        }
@@ -5,32 +5,60 @@ Geolocalización offline usando base de datos GeoLite2
 """
 
 import os
-from typing import Optional, Dict
+from typing import Optional, Dict, Tuple
 import geoip2.database
-from functools import lru_cache
+
+from .geo_cache import GeoCache, MISSING
+from .geo_range_index import GeoRangeIndex
+from .ip_classifier import is_private_ip
 
 
 class GeoLocator:
     """Geolocalizador de direcciones IP"""
 
-    def __init__(self, db_path: Optional[str] = None):
+    def __init__(self, db_path: Optional[str] = None, cache_size: int = 65536,
+                 cache_ttl: float = 86400, negative_ttl: float = 3600,
+                 cache_file: Optional[str] = None, persist_cache: bool = True,
+                 use_range_index: bool = True):
         """
         Inicializar geolocalizador
 
         Args:
             db_path: Ruta a GeoLite2-City.mmdb (None = ubicación por defecto)
+            cache_size: Número máximo de IPs en cache
+            cache_ttl: Segundos de validez de un resultado en cache
+            negative_ttl: Segundos de validez de un resultado negativo (IP no encontrada)
+            cache_file: Archivo sidecar de la cache (None = junto a la base .mmdb)
+            persist_cache: Cargar la cache al iniciar y guardarla al cerrar
+            use_range_index: Indexar los bloques CIDR resueltos para que otras IPs
+                             del mismo bloque no consulten el mmdb
         """
         if db_path is None:
             # Buscar en ubicación por defecto
             project_root = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
             db_path = os.path.join(project_root, 'shared', 'databases', 'GeoLite2-City.mmdb')
 
+        if cache_file is None:
+            cache_file = os.path.splitext(db_path)[0] + '.cache.json'
+
         self.db_path = db_path
         self.reader = None
 
+        self.cache = GeoCache(max_size=cache_size, ttl=cache_ttl, negative_ttl=negative_ttl)
+        self.cache_file = cache_file if persist_cache else None
+        self.range_index = GeoRangeIndex() if use_range_index else None
+        self.reader_lookups = 0
+        self.lookup_errors = 0
+
         # Intentar cargar base de datos
         self._load_database()
 
+        # Cache caliente desde la ejecución anterior
+        if self.reader and self.cache_file:
+            loaded = self.cache.load(self.cache_file, self._get_source_mtime())
+            if loaded:
+                print(f"✅ Cache de geolocalización: {loaded} IPs cargadas")
+
     def _load_database(self):
         """
         Cargar base de datos GeoLite2
@@ -46,7 +74,18 @@ class GeoLocator:
         except Exception as e:
             print(f"❌ Error cargando GeoLite2: {e}")
 
-    @lru_cache(maxsize=1024)
+    def _get_source_mtime(self) -> Optional[float]:
+        """
+        Obtener mtime de la base GeoLite2 (invalida la cache persistida si cambia)
+
+        Returns:
+            mtime o None si no existe
+        """
+        try:
+            return os.path.getmtime(self.db_path)
+        except OSError:
+            return None
+
     def geolocate(self, ip_address: str) -> Optional[Dict]:
         """
         Geolocalizar dirección IP
@@ -68,6 +107,41 @@ class GeoLocator:
         if not self.reader:
             return None
 
+        cached = self.cache.get(ip_address)
+        if cached is not MISSING:
+            return cached
+
+        # Bloque CIDR ya resuelto: bisect sin tocar el reader
+        if self.range_index is not None:
+            result = self.range_index.lookup(ip_address)
+            if result is not None:
+                self.cache.put(ip_address, result, result['country_code'] == '??')
+                return result
+
+        try:
+            result, negative, network = self._lookup(ip_address)
+        except Exception as e:
+            # Error inesperado: no se cachea para reintentar en la próxima
+            self.lookup_errors += 1
+            print(f"⚠️  Error geolocalizando {ip_address}: {e}")
+            return None
+
+        if self.range_index is not None and network is not None:
+            result = self.range_index.add(network, result)
+
+        self.cache.put(ip_address, result, negative)
+        return result
+
+    def _lookup(self, ip_address: str) -> Tuple[Optional[Dict], bool, object]:
+        """
+        Consultar la base GeoLite2 (sin cache)
+
+        Args:
+            ip_address: Dirección IP a geolocalizar
+
+        Returns:
+            Tupla (resultado, es_negativo, network del bloque o None)
+        """
         # Filtrar IPs privadas
         if self._is_private_ip(ip_address):
             return {
@@ -77,9 +151,10 @@ class GeoLocator:
                 'latitude': None,
                 'longitude': None,
                 'continent': 'Local'
-            }
+            }, False, None
 
         try:
+            self.reader_lookups += 1
             response = self.reader.city(ip_address)
 
             return {
@@ -89,10 +164,10 @@ class GeoLocator:
                 'latitude': response.location.latitude,
                 'longitude': response.location.longitude,
                 'continent': response.continent.name or 'Unknown'
-            }
+            }, False, getattr(response.traits, 'network', None)
 
-        except geoip2.errors.AddressNotFoundError:
-            # IP no encontrada en base de datos
+        except (geoip2.errors.AddressNotFoundError, ValueError) as e:
+            # IP no encontrada en base de datos (o no es una IP válida)
             return {
                 'country': 'Unknown',
                 'country_code': '??',
@@ -100,14 +175,11 @@ class GeoLocator:
                 'latitude': None,
                 'longitude': None,
                 'continent': 'Unknown'
-            }
-        except Exception as e:
-            print(f"⚠️  Error geolocalizando {ip_address}: {e}")
-            return None
+            }, True, getattr(e, 'network', None)
 
     def _is_private_ip(self, ip: str) -> bool:
         """
-        Verificar si una IP es privada/local
+        Verificar si una IP es privada/local (o cualquier bogon no geolocalizable)
 
         Args:
             ip: Dirección IP
@@ -115,26 +187,45 @@ class GeoLocator:
         Returns:
             True si es IP privada
         """
-        # Rangos privados
-        private_ranges = [
-            '10.',           # 10.0.0.0/8
-            '172.16.', '172.17.', '172.18.', '172.19.',  # 172.16.0.0/12
-            '172.20.', '172.21.', '172.22.', '172.23.',
-            '172.24.', '172.25.', '172.26.', '172.27.',
-            '172.28.', '172.29.', '172.30.', '172.31.',
-            '192.168.',      # 192.168.0.0/16
-            '127.',          # Loopback
-            'localhost'
-        ]
+        return is_private_ip(ip)
 
-        return any(ip.startswith(prefix) for prefix in private_ranges)
+    def save_cache(self) -> int:
+        """
+        Persistir la cache en el archivo sidecar
+
+        Returns:
+            Número de entradas guardadas
+        """
+        if not self.reader or not self.cache_file:
+            return 0
+        return self.cache.save(self.cache_file, self._get_source_mtime())
+
+    def get_stats(self) -> dict:
+        """
+        Obtener estadísticas del geolocalizador
+
+        Returns:
+            Dict con estado de la base y contadores de cache
+        """
+        stats = self.cache.get_stats()
+        if self.range_index is not None:
+            stats.update(self.range_index.get_stats())
+        stats['reader_loaded'] = self.reader is not None
+        stats['reader_lookups'] = self.reader_lookups
+        stats['lookup_errors'] = self.lookup_errors
+        return stats
 
     def close(self):
         """
-        Cerrar conexión a base de datos
+        Guardar cache y cerrar conexión a base de datos
         """
         if self.reader:
+            saved = self.save_cache()
+            if saved:
+                print(f"💾 Cache de geolocalización guardada ({saved} IPs)")
+
             self.reader.close()
+            self.reader = None
             print("✅ GeoIP database cerrada")
 
 
@@ -0,0 +1,187 @@
+"""
+IoT Sentry - Índice de Rangos de Geolocalización
+
+Índice en memoria de bloques CIDR ya resueltos contra GeoLite2. Se construye
+de forma perezosa con la `network` que devuelve cada consulta al mmdb: las
+siguientes IPs del mismo bloque se resuelven con un `bisect`, sin tocar el
+reader. Países y ciudades se internan como códigos enteros pequeños.
+"""
+
+import bisect
+import threading
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+from .ip_classifier import ip_to_int
+
+
+class _RangeTable:
+    """
+    Rangos disjuntos [start, end] ordenados por inicio, con códigos paralelos
+    """
+
+    def __init__(self):
+        """Inicializar tabla vacía"""
+        self.starts: List[int] = []
+        self.ends: List[int] = []
+        self.country_ids = array('H')
+        self.city_ids = array('L')
+
+    def find(self, value: int) -> int:
+        """
+        Buscar el rango que contiene un valor
+
+        Args:
+            value: IP como entero
+
+        Returns:
+            Posición del rango o -1
+        """
+        pos = bisect.bisect_right(self.starts, value) - 1
+        if pos >= 0 and value <= self.ends[pos]:
+            return pos
+        return -1
+
+    def insert(self, start: int, end: int, country_id: int, city_id: int) -> bool:
+        """
+        Insertar rango manteniendo el orden (se ignora si se solapa con otro)
+
+        Returns:
+            True si se insertó
+        """
+        pos = bisect.bisect_right(self.starts, start)
+
+        if pos > 0 and self.ends[pos - 1] >= start:
+            return False
+        if pos < len(self.starts) and self.starts[pos] <= end:
+            return False
+
+        self.starts.insert(pos, start)
+        self.ends.insert(pos, end)
+        self.country_ids.insert(pos, country_id)
+        self.city_ids.insert(pos, city_id)
+        return True
+
+
+class GeoRangeIndex:
+    """
+    Índice de bloques CIDR → ubicación
+
+    Los resultados se guardan como (country_id, city_id) sobre tablas de
+    internado, y el dict de resultado se construye una sola vez por
+    combinación de país y ciudad.
+    """
+
+    def __init__(self, max_networks: int = 200000):
+        """
+        Inicializar índice
+
+        Args:
+            max_networks: Bloques máximos a indexar (al llegar al límite se
+                          dejan de añadir; las búsquedas siguen funcionando)
+        """
+        self.max_networks = max_networks
+        self.tables = {4: _RangeTable(), 6: _RangeTable()}
+        self.lock = threading.Lock()
+
+        # Internado: (country, country_code, continent) y (city, lat, lon)
+        self.country_ids: Dict[tuple, int] = {}
+        self.countries: List[tuple] = []
+        self.city_ids: Dict[tuple, int] = {}
+        self.cities: List[tuple] = []
+
+        # (country_id, city_id) → dict de resultado compartido
+        self.results: Dict[Tuple[int, int], dict] = {}
+
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return sum(len(table.starts) for table in self.tables.values())
+
+    @staticmethod
+    def _intern(value: tuple, ids: Dict[tuple, int], values: List[tuple]) -> int:
+        """
+        Obtener código entero de un valor (creándolo si no existe)
+
+        Returns:
+            Código del valor
+        """
+        code = ids.get(value)
+        if code is None:
+            code = len(values)
+            ids[value] = code
+            values.append(value)
+        return code
+
+    def lookup(self, ip_address: str) -> Optional[dict]:
+        """
+        Resolver IP contra los bloques ya indexados
+
+        Args:
+            ip_address: Dirección IP
+
+        Returns:
+            Dict de geolocalización o None si el bloque aún no está indexado
+        """
+        parsed = ip_to_int(ip_address)
+        if parsed is None:
+            return None
+
+        version, value = parsed
+        table = self.tables[version]
+
+        with self.lock:
+            pos = table.find(value)
+            if pos < 0:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            return self.results[(table.country_ids[pos], table.city_ids[pos])]
+
+    def add(self, network, result: dict) -> dict:
+        """
+        Indexar el bloque de una consulta al mmdb
+
+        Args:
+            network: ipaddress.IPv4Network/IPv6Network devuelta por el reader
+            result: Dict de geolocalización de la consulta
+
+        Returns:
+            Dict internado equivalente a `result` (compartido por el bloque)
+        """
+        country_key = (result['country'], result['country_code'], result['continent'])
+        city_key = (result['city'], result['latitude'], result['longitude'])
+
+        with self.lock:
+            country_id = self._intern(country_key, self.country_ids, self.countries)
+            city_id = self._intern(city_key, self.city_ids, self.cities)
+
+            shared = self.results.get((country_id, city_id))
+            if shared is None:
+                shared = dict(result)
+                self.results[(country_id, city_id)] = shared
+
+            if network is not None and len(self) < self.max_networks:
+                self.tables[network.version].insert(
+                    int(network.network_address), int(network.broadcast_address),
+                    country_id, city_id
+                )
+
+        return shared
+
+    def get_stats(self) -> dict:
+        """
+        Obtener estadísticas del índice
+
+        Returns:
+            Dict con bloques indexados, países/ciudades internados y aciertos
+        """
+        return {
+            'range_networks': len(self),
+            'range_countries': len(self.countries),
+            'range_cities': len(self.cities),
+            'range_hits': self.hits,
+            'range_misses': self.misses,
+        }
@@ -0,0 +1,178 @@
+"""
+IoT Sentry - Clasificador de IPs
+
+Clasificación numérica de direcciones IPv4/IPv6 (privadas, bogons, CGNAT,
+link-local, multicast, ...) sobre redes pre-parseadas a pares (red, máscara).
+Cada llamada cuesta una conversión a entero y un número fijo de AND/compare.
+"""
+
+import ipaddress
+import socket
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+# Categorías
+GLOBAL = 'global'
+PRIVATE = 'private'
+LOOPBACK = 'loopback'
+LINK_LOCAL = 'link_local'
+CGNAT = 'cgnat'
+MULTICAST = 'multicast'
+BROADCAST = 'broadcast'
+UNSPECIFIED = 'unspecified'
+RESERVED = 'reserved'
+INVALID = 'invalid'
+
+# Categorías que nunca salen de la red local
+LAN_CATEGORIES = frozenset({PRIVATE, LOOPBACK, LINK_LOCAL, MULTICAST, BROADCAST, UNSPECIFIED})
+
+# Rangos especiales (orden: el primero que coincide gana)
+_IPV4_RANGES = [
+    ('255.255.255.255/32', BROADCAST),
+    ('0.0.0.0/8', UNSPECIFIED),
+    ('10.0.0.0/8', PRIVATE),
+    ('172.16.0.0/12', PRIVATE),
+    ('192.168.0.0/16', PRIVATE),
+    ('127.0.0.0/8', LOOPBACK),
+    ('169.254.0.0/16', LINK_LOCAL),
+    ('100.64.0.0/10', CGNAT),
+    ('224.0.0.0/4', MULTICAST),
+    ('192.0.0.0/24', RESERVED),      # IETF protocol assignments
+    ('192.0.2.0/24', RESERVED),      # TEST-NET-1
+    ('198.18.0.0/15', RESERVED),     # Benchmarking
+    ('198.51.100.0/24', RESERVED),   # TEST-NET-2
+    ('203.0.113.0/24', RESERVED),    # TEST-NET-3
+    ('240.0.0.0/4', RESERVED),
+]
+
+_IPV6_RANGES = [
+    ('::/128', UNSPECIFIED),
+    ('::1/128', LOOPBACK),
+    ('fe80::/10', LINK_LOCAL),
+    ('fc00::/7', PRIVATE),           # Unique local
+    ('ff00::/8', MULTICAST),
+    ('64:ff9b:1::/48', RESERVED),    # NAT64 local
+    ('100::/64', RESERVED),          # Discard-only
+    ('2001:db8::/32', RESERVED),     # Documentación
+    ('fec0::/10', RESERVED),         # Site-local (obsoleto)
+]
+
+# IPv4 mapeada en IPv6 (::ffff:a.b.c.d)
+_IPV4_MAPPED_PREFIX = 0xFFFF << 32
+_IPV4_MAPPED_MASK = ((1 << 96) - 1) << 32
+
+
+def _compile(ranges: List[Tuple[str, str]]) -> List[Tuple[int, int, str]]:
+    """
+    Pre-parsear redes a tuplas (red, máscara, categoría)
+
+    Args:
+        ranges: Lista de (CIDR, categoría)
+
+    Returns:
+        Lista de (red como entero, máscara como entero, categoría)
+    """
+    compiled = []
+    for cidr, category in ranges:
+        network = ipaddress.ip_network(cidr)
+        compiled.append((int(network.network_address), int(network.netmask), category))
+    return compiled
+
+
+IPV4_NETWORKS = _compile(_IPV4_RANGES)
+IPV6_NETWORKS = _compile(_IPV6_RANGES)
+
+
+def ip_to_int(ip_address: str) -> Optional[Tuple[int, int]]:
+    """
+    Convertir IP a entero
+
+    Args:
+        ip_address: Dirección IPv4 o IPv6
+
+    Returns:
+        Tupla (versión, entero) o None si no es una IP válida
+    """
+    if ':' in ip_address:
+        family, version = socket.AF_INET6, 6
+    else:
+        family, version = socket.AF_INET, 4
+
+    try:
+        return version, int.from_bytes(socket.inet_pton(family, ip_address), 'big')
+    except (OSError, ValueError):
+        return None
+
+
+def classify_int(version: int, value: int) -> str:
+    """
+    Clasificar una IP ya convertida a entero
+
+    Args:
+        version: 4 o 6
+        value: IP como entero
+
+    Returns:
+        Categoría de la IP
+    """
+    if version == 6:
+        if value & _IPV4_MAPPED_MASK == _IPV4_MAPPED_PREFIX:
+            return classify_int(4, value & 0xFFFFFFFF)
+        networks = IPV6_NETWORKS
+    else:
+        networks = IPV4_NETWORKS
+
+    for network, mask, category in networks:
+        if value & mask == network:
+            return category
+
+    return GLOBAL
+
+
+@lru_cache(maxsize=65536)
+def classify_ip(ip_address: str) -> str:
+    """
+    Clasificar una dirección IP
+
+    Args:
+        ip_address: Dirección IPv4 o IPv6
+
+    Returns:
+        'global', 'private', 'loopback', 'link_local', 'cgnat', 'multicast',
+        'broadcast', 'unspecified', 'reserved' o 'invalid'
+    """
+    if ip_address == 'localhost':
+        return LOOPBACK
+
+    parsed = ip_to_int(ip_address)
+    if parsed is None:
+        return INVALID
+
+    return classify_int(*parsed)
+
+
+def is_private_ip(ip_address: str) -> bool:
+    """
+    Verificar si una IP no es enrutable en Internet (privada o bogon)
+
+    Args:
+        ip_address: Dirección IP
+
+    Returns:
+        True si la IP no es global (no tiene sentido geolocalizarla)
+    """
+    category = classify_ip(ip_address)
+    return category != GLOBAL and category != INVALID
+
+
+def is_lan_ip(ip_address: str) -> bool:
+    """
+    Verificar si una IP es de la red local (tráfico que no sale a Internet)
+
+    Args:
+        ip_address: Dirección IP
+
+    Returns:
+        True si es privada, loopback, link-local, multicast o broadcast
+    """
+    return classify_ip(ip_address) in LAN_CATEGORIES
@@ -0,0 +1,505 @@
+"""
+IoT Sentry - Índice de Reputación de Destinos
+
+Listas de IPs/CIDRs (nodos de salida Tor, blocklists) y de países
+compiladas a rangos enteros disjuntos y ordenados: cada consulta es un
+`bisect` (O(log n)) que devuelve las listas que contienen la IP. Las
+listas se cargan de archivos locales y se recargan en caliente: se
+construye un snapshot nuevo y se sustituye de forma atómica, sin
+bloquear las consultas en curso.
+"""
+
+import bisect
+import ipaddress
+import os
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .ip_classifier import ip_to_int
+
+# Lista de nodos de salida Tor
+TOR_LIST = 'tor'
+
+# Extensiones de archivo de lista reconocidas por load_directory
+LIST_EXTENSIONS = ('.txt', '.list', '.netset', '.ipset')
+
+
+def parse_entry(line: str) -> Optional[Tuple[int, int, int]]:
+    """
+    Convertir una línea de lista a rango (versión, inicio, fin)
+
+    Acepta IPs, CIDRs, rangos "a-b", prefijos con punto final
+    ("185.220.101.") y líneas "ExitAddress <ip> ..." del formato de Tor.
+
+    Args:
+        line: Línea del archivo (sin comentarios)
+
+    Returns:
+        Tupla (versión, inicio, fin) o None si no es válida
+    """
+    entry = line.strip()
+    if not entry:
+        return None
+
+    if entry.startswith('ExitAddress'):
+        parts = entry.split()
+        if len(parts) < 2:
+            return None
+        entry = parts[1]
+    else:
+        entry = entry.split()[0]
+
+    # Prefijo textual IPv4 ("185.220.101.") → CIDR
+    if entry.endswith('.') and ':' not in entry:
+        octets = entry.rstrip('.').split('.')
+        entry = '.'.join(octets + ['0'] * (4 - len(octets))) + f'/{8 * len(octets)}'
+
+    try:
+        if '-' in entry:
+            first, last = entry.split('-', 1)
+            start = ipaddress.ip_address(first.strip())
+            end = ipaddress.ip_address(last.strip())
+            if start.version != end.version or int(end) < int(start):
+                return None
+            return start.version, int(start), int(end)
+
+        network = ipaddress.ip_network(entry, strict=False)
+        return network.version, int(network.network_address), int(network.broadcast_address)
+    except ValueError:
+        return None
+
+
+def read_list_file(path: str) -> List[str]:
+    """
+    Leer un archivo de lista (una entrada por línea, '#' y ';' comentan)
+
+    Args:
+        path: Ruta del archivo
+
+    Returns:
+        Líneas con entradas
+    """
+    entries = []
+    with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+        for line in f:
+            line = line.split('#', 1)[0].split(';', 1)[0].strip()
+            if line:
+                entries.append(line)
+    return entries
+
+
+class _Segments:
+    """
+    Segmentos disjuntos [start, end] ordenados, con máscara de listas
+    """
+
+    __slots__ = ('starts', 'ends', 'masks')
+
+    def __init__(self, ranges: List[Tuple[int, int, int]]):
+        """
+        Compilar rangos (posiblemente solapados) a segmentos disjuntos
+
+        Args:
+            ranges: Tuplas (inicio, fin, bit de lista)
+        """
+        # Barrido de eventos: +bit al empezar, -bit tras terminar
+        events: Dict[int, List[int]] = {}
+        for start, end, bit in ranges:
+            events.setdefault(start, []).append(bit)
+            events.setdefault(end + 1, []).append(-bit)
+
+        self.starts: List[int] = []
+        self.ends: List[int] = []
+        self.masks: List[int] = []
+
+        active: Dict[int, int] = {}
+        points = sorted(events)
+        for position, point in enumerate(points):
+            for bit in events[point]:
+                if bit > 0:
+                    active[bit] = active.get(bit, 0) + 1
+                else:
+                    active[-bit] -= 1
+                    if not active[-bit]:
+                        del active[-bit]
+
+            mask = 0
+            for bit in active:
+                mask |= bit
+            if not mask or position + 1 == len(points):
+                continue
+
+            end = points[position + 1] - 1
+            # Fusionar con el segmento anterior si es contiguo y de las mismas listas
+            if self.ends and self.ends[-1] + 1 == point and self.masks[-1] == mask:
+                self.ends[-1] = end
+            else:
+                self.starts.append(point)
+                self.ends.append(end)
+                self.masks.append(mask)
+
+    def find(self, value: int) -> int:
+        """
+        Máscara de listas que contienen un valor
+
+        Args:
+            value: IP como entero
+
+        Returns:
+            Máscara (0 si ninguna)
+        """
+        pos = bisect.bisect_right(self.starts, value) - 1
+        if pos >= 0 and value <= self.ends[pos]:
+            return self.masks[pos]
+        return 0
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+
+class _Snapshot:
+    """
+    Estado inmutable del índice (se sustituye completo en cada recarga)
+    """
+
+    __slots__ = ('names', 'bits', 'segments', 'countries', 'entries')
+
+    def __init__(self, ip_lists: Dict[str, List[str]], country_lists: Dict[str, Iterable[str]]):
+        """
+        Compilar listas
+
+        Args:
+            ip_lists: Nombre → entradas de IP/CIDR
+            country_lists: Nombre → países
+        """
+        self.names: List[str] = list(ip_lists)
+        self.bits: Dict[str, int] = {name: 1 << i for i, name in enumerate(self.names)}
+        self.entries: Dict[str, int] = {}
+
+        ranges = {4: [], 6: []}
+        for name, entries in ip_lists.items():
+            bit = self.bits[name]
+            valid = 0
+            for entry in entries:
+                parsed = parse_entry(entry)
+                if parsed:
+                    version, start, end = parsed
+                    ranges[version].append((start, end, bit))
+                    valid += 1
+            self.entries[name] = valid
+
+        self.segments = {version: _Segments(items) for version, items in ranges.items()}
+
+        # País → nombres de listas (O(1) por consulta)
+        self.countries: Dict[str, Tuple[str, ...]] = {}
+        for name, countries in country_lists.items():
+            for country in countries:
+                self.countries[country] = self.countries.get(country, ()) + (name,)
+
+    def lists_for(self, mask: int) -> List[str]:
+        """
+        Nombres de listas de una máscara
+
+        Returns:
+            Lista de nombres
+        """
+        return [name for name in self.names if mask & self.bits[name]]
+
+
+class ReputationIndex:
+    """
+    Índice de reputación de IPs y países con recarga en caliente
+
+    Las listas de IPs se registran desde memoria (`set_list`) o desde
+    archivos (`load_file`, `load_directory`); `reload()` vuelve a leer los
+    archivos modificados y publica un snapshot nuevo.
+    """
+
+    def __init__(self):
+        """Inicializar índice vacío"""
+        # Fuentes: nombre → entradas en memoria o (ruta, mtime)
+        self.ip_entries: Dict[str, List[str]] = {}
+        self.files: Dict[str, Tuple[str, float]] = {}
+        self.country_lists: Dict[str, List[str]] = {}
+
+        self.snapshot = _Snapshot({}, {})
+        self.build_lock = threading.Lock()
+
+        self.hits: Dict[str, int] = {}
+        self.hits_lock = threading.Lock()
+        self.lookups = 0
+        self.reloads = 0
+        self.last_reload: Optional[float] = None
+
+        self.watcher: Optional[threading.Thread] = None
+        self.watching = False
+
+    # ============ Fuentes ============
+
+    def set_list(self, name: str, entries: Iterable[str], rebuild: bool = True):
+        """
+        Registrar (o reemplazar) una lista de IPs/CIDRs en memoria
+
+        Args:
+            name: Nombre de la lista (ej. 'tor')
+            entries: IPs, CIDRs, rangos o prefijos
+            rebuild: Publicar un snapshot nuevo inmediatamente
+        """
+        with self.build_lock:
+            self.ip_entries[name] = list(entries)
+            self.files.pop(name, None)
+        if rebuild:
+            self.rebuild()
+
+    def set_countries(self, name: str, countries: Iterable[str], rebuild: bool = True):
+        """
+        Registrar (o reemplazar) una lista de países
+
+        Args:
+            name: Nombre de la lista (ej. 'high_risk')
+            countries: Nombres de país (como los devuelve GeoLocator)
+            rebuild: Publicar un snapshot nuevo inmediatamente
+        """
+        with self.build_lock:
+            self.country_lists[name] = list(countries)
+        if rebuild:
+            self.rebuild()
+
+    def load_file(self, name: str, path: str, rebuild: bool = True):
+        """
+        Registrar una lista de IPs desde archivo
+
+        Args:
+            name: Nombre de la lista
+            path: Ruta del archivo
+            rebuild: Publicar un snapshot nuevo inmediatamente
+        """
+        entries = read_list_file(path)
+        with self.build_lock:
+            self.ip_entries[name] = entries
+            self.files[name] = (path, os.path.getmtime(path))
+        if rebuild:
+            self.rebuild()
+
+    def load_directory(self, directory: str) -> List[str]:
+        """
+        Registrar cada archivo de lista de un directorio (nombre = archivo sin extensión)
+
+        Args:
+            directory: Directorio con listas (.txt, .list, .netset, .ipset)
+
+        Returns:
+            Nombres de las listas cargadas
+        """
+        names = []
+        if not os.path.isdir(directory):
+            return names
+
+        for filename in sorted(os.listdir(directory)):
+            stem, ext = os.path.splitext(filename)
+            if ext.lower() in LIST_EXTENSIONS:
+                self.load_file(stem, os.path.join(directory, filename), rebuild=False)
+                names.append(stem)
+
+        if names:
+            self.rebuild()
+        return names
+
+    # ============ Compilación y recarga ============
+
+    def rebuild(self):
+        """
+        Compilar las fuentes y publicar el snapshot (sustitución atómica)
+        """
+        with self.build_lock:
+            snapshot = _Snapshot(dict(self.ip_entries), dict(self.country_lists))
+            # Asignar la referencia es atómico: las consultas ven el snapshot
+            # anterior o el nuevo, nunca uno a medio construir
+            self.snapshot = snapshot
+            self.reloads += 1
+            self.last_reload = time.time()
+
+    def reload(self, force: bool = False) -> bool:
+        """
+        Releer los archivos modificados desde la última carga
+
+        Args:
+            force: Releer todos los archivos aunque no hayan cambiado
+
+        Returns:
+            True si se publicó un snapshot nuevo
+        """
+        changed = False
+        for name, (path, mtime) in list(self.files.items()):
+            try:
+                current = os.path.getmtime(path)
+                if not force and current == mtime:
+                    continue
+                entries = read_list_file(path)
+            except OSError as e:
+                print(f"⚠️  No se pudo recargar la lista {name}: {e}")
+                continue
+
+            with self.build_lock:
+                self.ip_entries[name] = entries
+                self.files[name] = (path, current)
+            changed = True
+
+        if changed:
+            self.rebuild()
+            print(f"🔄 Listas de reputación recargadas ({len(self.snapshot.names)} listas)")
+        return changed
+
+    def _watch_loop(self, interval: float):
+        """
+        Comprobar periódicamente si cambiaron los archivos
+        """
+        while self.watching:
+            time.sleep(interval)
+            if self.watching:
+                self.reload()
+
+    def start_watcher(self, interval: float = 60.0):
+        """
+        Iniciar thread de recarga en caliente
+
+        Args:
+            interval: Segundos entre comprobaciones de los archivos
+        """
+        if self.watching:
+            return
+        self.watching = True
+        self.watcher = threading.Thread(target=self._watch_loop, args=(interval,), daemon=True)
+        self.watcher.start()
+
+    def stop_watcher(self):
+        """
+        Detener thread de recarga
+        """
+        self.watching = False
+        self.watcher = None
+
+    # ============ Consultas ============
+
+    def record_hits(self, name: str, count: int = 1):
+        """
+        Sumar aciertos a una lista
+
+        Args:
+            name: Nombre de la lista
+            count: Aciertos
+        """
+        with self.hits_lock:
+            self.hits[name] = self.hits.get(name, 0) + count
+
+    def lookup(self, ip_address: str, count_hits: bool = True) -> List[str]:
+        """
+        Listas de IPs que contienen una dirección
+
+        Args:
+            ip_address: Dirección IP
+            count_hits: Sumar el acierto a los contadores de cada lista
+
+        Returns:
+            Nombres de las listas (vacía si ninguna)
+        """
+        snapshot = self.snapshot
+        self.lookups += 1
+
+        parsed = ip_to_int(ip_address)
+        if parsed is None:
+            return []
+
+        version, value = parsed
+        mask = snapshot.segments[version].find(value)
+        if not mask:
+            return []
+
+        names = snapshot.lists_for(mask)
+        if count_hits:
+            for name in names:
+                self.record_hits(name)
+        return names
+
+    def contains(self, name: str, ip_address: str, count_hits: bool = True) -> bool:
+        """
+        Verificar si una IP está en una lista concreta
+
+        Args:
+            name: Nombre de la lista
+            ip_address: Dirección IP
+            count_hits: Sumar el acierto al contador de la lista
+
+        Returns:
+            True si la IP está en la lista
+        """
+        snapshot = self.snapshot
+        bit = snapshot.bits.get(name)
+        if bit is None:
+            return False
+
+        self.lookups += 1
+        parsed = ip_to_int(ip_address)
+        if parsed is None:
+            return False
+
+        version, value = parsed
+        if not snapshot.segments[version].find(value) & bit:
+            return False
+
+        if count_hits:
+            self.record_hits(name)
+        return True
+
+    def country_lists_for(self, country: Optional[str], count_hits: bool = True) -> Tuple[str, ...]:
+        """
+        Listas de países que contienen un país
+
+        Args:
+            country: Nombre del país
+            count_hits: Sumar el acierto a los contadores
+
+        Returns:
+            Nombres de las listas (tupla vacía si ninguna)
+        """
+        names = self.snapshot.countries.get(country, ())
+        if names and count_hits:
+            for name in names:
+                self.record_hits(name)
+        return names
+
+    def countries(self, name: str) -> List[str]:
+        """
+        Países de una lista
+
+        Args:
+            name: Nombre de la lista de países
+
+        Returns:
+            Lista de países
+        """
+        return [country for country, names in self.snapshot.countries.items() if name in names]
+
+    def get_stats(self) -> dict:
+        """
+        Obtener estadísticas del índice
+
+        Returns:
+            Dict con entradas y aciertos por lista, segmentos, consultas y recargas
+        """
+        snapshot = self.snapshot
+        lists = {
+            name: {'entries': snapshot.entries.get(name, 0), 'hits': self.hits.get(name, 0)}
+            for name in snapshot.names
+        }
+        for name in self.country_lists:
+            lists[name] = {'entries': len(self.country_lists[name]), 'hits': self.hits.get(name, 0)}
+
+        return {
+            'reputation_lists': lists,
+            'reputation_segments': sum(len(s) for s in snapshot.segments.values()),
+            'reputation_lookups': self.lookups,
+            'reputation_reloads': self.reloads,
+            'reputation_last_reload': self.last_reload,
+        }
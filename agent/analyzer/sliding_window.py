@@ -0,0 +1,329 @@
+"""
+IoT Sentry - Ventanas Deslizantes en Memoria
+
+Estructuras por dispositivo para los detectores que antes consultaban la
+tabla `flows` en cada flujo analizado: contadores en anillo por buckets,
+conjunto de países de la ventana y EWMA de bytes diarios. Cada operación
+es O(1) amortizado.
+"""
+
+from collections import deque
+from datetime import datetime
+from typing import Dict, List, Optional
+
+EPOCH = datetime(1970, 1, 1)
+DAY_SECONDS = 86400
+
+
+def to_epoch(timestamp) -> float:
+    """
+    Convertir timestamp (datetime UTC naive o epoch) a epoch float
+
+    Args:
+        timestamp: datetime o float
+
+    Returns:
+        Segundos desde epoch
+    """
+    if isinstance(timestamp, datetime):
+        return (timestamp - EPOCH).total_seconds()
+    return float(timestamp)
+
+
+class RingCounter:
+    """
+    Contador de eventos en una ventana deslizante dividida en buckets
+
+    El ring guarda un bucket más de los que caben en la ventana, de modo que
+    el bucket parcial que contiene `now - window` sigue dentro: el total
+    nunca omite eventos de la ventana. Con `window_seconds` múltiplo de
+    `bucket_seconds` incluye como mucho `bucket_seconds` de más por el
+    principio (cubre entre `window` y `window + bucket_seconds`). Eventos
+    más antiguos que el ring se ignoran.
+    """
+
+    __slots__ = ('bucket_seconds', 'buckets', 'head', 'total')
+
+    def __init__(self, window_seconds: int = 3600, bucket_seconds: int = 300):
+        """
+        Inicializar contador
+
+        Args:
+            window_seconds: Duración de la ventana
+            bucket_seconds: Duración de cada bucket
+        """
+        self.bucket_seconds = bucket_seconds
+        # ceil(ventana / bucket) buckets completos + el parcial más antiguo
+        self.buckets = [0] * (-(-window_seconds // bucket_seconds) + 1)
+        self.head: Optional[int] = None  # Índice absoluto del bucket más reciente
+        self.total = 0
+
+    def _advance(self, bucket: int):
+        """
+        Mover la ventana hasta un bucket, vaciando los que salen
+
+        Args:
+            bucket: Índice absoluto del bucket
+        """
+        if self.head is None:
+            self.head = bucket
+            return
+
+        size = len(self.buckets)
+        if bucket - self.head >= size:
+            self.buckets = [0] * size
+            self.total = 0
+        else:
+            for expired in range(self.head + 1, bucket + 1):
+                slot = expired % size
+                self.total -= self.buckets[slot]
+                self.buckets[slot] = 0
+        self.head = bucket
+
+    def add(self, timestamp, count: int = 1):
+        """
+        Sumar eventos
+
+        Args:
+            timestamp: Momento de los eventos (datetime o epoch)
+            count: Número de eventos
+        """
+        bucket = int(to_epoch(timestamp)) // self.bucket_seconds
+        if self.head is None or bucket > self.head:
+            self._advance(bucket)
+        elif self.head - bucket >= len(self.buckets):
+            return  # Fuera de la ventana
+
+        self.buckets[bucket % len(self.buckets)] += count
+        self.total += count
+
+    def count(self, now) -> int:
+        """
+        Eventos dentro de la ventana que termina en `now`
+
+        Args:
+            now: Momento de referencia
+
+        Returns:
+            Total de la ventana
+        """
+        bucket = int(to_epoch(now)) // self.bucket_seconds
+        if self.head is not None and bucket > self.head:
+            self._advance(bucket)
+        return self.total
+
+
+class WindowedSet:
+    """
+    Conjunto de valores vistos dentro de una ventana deslizante
+
+    Guarda el último instante de cada valor y una cola de (instante, valor)
+    para expirar en orden sin recorrer el conjunto completo.
+    """
+
+    __slots__ = ('window', 'last_seen', 'events')
+
+    def __init__(self, window_seconds: int = 3600):
+        """
+        Inicializar conjunto
+
+        Args:
+            window_seconds: Duración de la ventana
+        """
+        self.window = window_seconds
+        self.last_seen: Dict[str, float] = {}
+        self.events: deque = deque()
+
+    def add(self, value: str, timestamp):
+        """
+        Registrar un valor
+
+        Args:
+            value: Valor (ej. país)
+            timestamp: Momento (datetime o epoch)
+        """
+        ts = to_epoch(timestamp)
+        previous = self.last_seen.get(value)
+        if previous is not None and previous >= ts:
+            return
+
+        self.last_seen[value] = ts
+        self.events.append((ts, value))
+        self._expire(ts)
+
+    def _expire(self, now: float):
+        """
+        Quitar valores cuya última aparición quedó fuera de la ventana
+
+        Args:
+            now: Momento de referencia (epoch)
+        """
+        limit = now - self.window
+        events = self.events
+        while events and events[0][0] < limit:
+            ts, value = events.popleft()
+            # Solo se borra si no volvió a aparecer después
+            if self.last_seen.get(value) == ts:
+                del self.last_seen[value]
+
+    def values(self, now) -> List[str]:
+        """
+        Valores vistos dentro de la ventana
+
+        Args:
+            now: Momento de referencia
+
+        Returns:
+            Lista de valores
+        """
+        self._expire(to_epoch(now))
+        return list(self.last_seen)
+
+    def __len__(self) -> int:
+        return len(self.last_seen)
+
+
+class DailyEWMA:
+    """
+    Media móvil exponencial de un total diario (ej. bytes enviados por día)
+
+    Acumula el día en curso y lo incorpora a la media al cambiar de día.
+    Los días sin tráfico no se incorporan (como el AVG por fecha de la DB).
+    """
+
+    __slots__ = ('alpha', 'average', 'days', 'current_day', 'current_total')
+
+    def __init__(self, span_days: int = 30):
+        """
+        Inicializar media
+
+        Args:
+            span_days: Días equivalentes de la media (alpha = 2 / (span + 1))
+        """
+        self.alpha = 2.0 / (span_days + 1)
+        self.average: Optional[float] = None
+        self.days = 0
+        self.current_day: Optional[int] = None
+        self.current_total = 0
+
+    def _roll(self, day: int):
+        """
+        Cerrar el día en curso si `day` es posterior
+
+        Args:
+            day: Día (epoch // 86400)
+        """
+        if self.current_day is None:
+            self.current_day = day
+            return
+        if day <= self.current_day:
+            return
+
+        if self.current_total:
+            if self.average is None:
+                self.average = float(self.current_total)
+            else:
+                self.average += self.alpha * (self.current_total - self.average)
+            self.days += 1
+
+        self.current_day = day
+        self.current_total = 0
+
+    def add(self, timestamp, value: int):
+        """
+        Sumar al total del día
+
+        Args:
+            timestamp: Momento (datetime o epoch)
+            value: Cantidad a sumar
+        """
+        day = int(to_epoch(timestamp)) // DAY_SECONDS
+        self._roll(day)
+        if day == self.current_day:
+            self.current_total += value
+        # Días ya cerrados se ignoran (llegan tarde)
+
+    def today(self, now) -> int:
+        """
+        Total del día de `now`
+
+        Args:
+            now: Momento de referencia
+
+        Returns:
+            Total acumulado del día
+        """
+        self._roll(int(to_epoch(now)) // DAY_SECONDS)
+        return self.current_total
+
+
+class DeviceWindows:
+    """
+    Ventanas deslizantes de un dispositivo
+    """
+
+    __slots__ = ('connections', 'countries', 'daily_bytes', 'window', 'bucket')
+
+    def __init__(self, window_seconds: int = 3600, bucket_seconds: int = 300,
+                 span_days: int = 30):
+        """
+        Inicializar ventanas
+
+        Args:
+            window_seconds: Ventana de conexiones y países
+            bucket_seconds: Resolución de los contadores de conexiones
+            span_days: Días de la EWMA de bytes
+        """
+        self.window = window_seconds
+        self.bucket = bucket_seconds
+        # dest_ip → conexiones en la ventana
+        self.connections: Dict[str, RingCounter] = {}
+        self.countries = WindowedSet(window_seconds)
+        self.daily_bytes = DailyEWMA(span_days)
+
+    def record(self, dest_ip: str, dest_country: Optional[str], bytes_sent: int, timestamp):
+        """
+        Registrar un flujo
+
+        Args:
+            dest_ip: IP destino
+            dest_country: País destino (None si se desconoce)
+            bytes_sent: Bytes enviados
+            timestamp: Momento del flujo
+        """
+        counter = self.connections.get(dest_ip)
+        if counter is None:
+            counter = RingCounter(self.window, self.bucket)
+            self.connections[dest_ip] = counter
+        counter.add(timestamp)
+
+        if dest_country and dest_country not in ('Local Network', 'Unknown'):
+            self.countries.add(dest_country, timestamp)
+
+        if bytes_sent:
+            self.daily_bytes.add(timestamp, bytes_sent)
+
+    def connection_count(self, dest_ip: str, now) -> int:
+        """
+        Conexiones a un destino en la ventana
+
+        Returns:
+            Conexiones en la última ventana
+        """
+        counter = self.connections.get(dest_ip)
+        if counter is None:
+            return 0
+        count = counter.count(now)
+        if count == 0:
+            del self.connections[dest_ip]
+        return count
+
+    def prune(self, now):
+        """
+        Descartar contadores de destinos sin conexiones en la ventana
+
+        Args:
+            now: Momento de referencia
+        """
+        for dest_ip in [ip for ip, counter in self.connections.items() if counter.count(now) == 0]:
+            del self.connections[dest_ip]
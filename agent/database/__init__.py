@@ -1,18 +1,46 @@
 """
 IoT Sentry - Database package
+
+Importar el paquete no abre la base de datos: `engine`, `read_engine`,
+`SessionLocal` y `ReadSessionLocal` se resuelven al primer uso sobre la
+base por defecto (ver `configure()` y `Database`).
 """
 
-from .models import Device, Flow, Alert, Base
-from .database import engine, SessionLocal, get_db, get_db_session, init_db
+from .models import Device, Flow, Alert, DeviceBaseline, Base
+from . import database as _database
+from .database import (
+    Database, configure, get_database,
+    get_db, get_read_db, get_db_session, init_db,
+)
+from .migrations import run_migrations, get_schema_version
+from .device_index import DeviceIndex
+
+
+def __getattr__(name: str):
+    # Engines y factories de la base por defecto (se crean al primer acceso)
+    if name in _database._LAZY_ATTRIBUTES:
+        return getattr(_database, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 __all__ = [
     'Device',
     'Flow',
     'Alert',
+    'DeviceBaseline',
     'Base',
+    'Database',
+    'configure',
+    'get_database',
     'engine',
+    'read_engine',
     'SessionLocal',
+    'ReadSessionLocal',
     'get_db',
+    'get_read_db',
     'get_db_session',
     'init_db',
+    'run_migrations',
+    'get_schema_version',
+    'DeviceIndex',
 ]
@@ -1,57 +1,396 @@
 """
 IoT Sentry - Configuración de Base de Datos
+
+Los engines se crean al primer uso, no al importar: importar el paquete no
+crea `data/` ni abre conexiones. `Database` agrupa engines, session
+factories e inicialización de una base; los nombres de módulo (`engine`,
+`SessionLocal`, `get_db()`...) usan la base por defecto (ver `configure()`).
 """
 
 import os
-from sqlalchemy import create_engine
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Optional
+from sqlalchemy import create_engine, event, inspect
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy.pool import QueuePool, StaticPool
 from contextlib import contextmanager
 from .models import Base
+from .migrations import run_migrations
 
-# Directorio de datos
+# Directorio de datos (se crea al abrir la base por defecto)
 DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'data')
-os.makedirs(DATA_DIR, exist_ok=True)
 
-# Ruta de la base de datos SQLite
-DATABASE_URL = f"sqlite:///{os.path.join(DATA_DIR, 'iotsentry.db')}"
+# Base en memoria (tests)
+MEMORY_URL = 'sqlite://'
 
-# Crear engine
-engine = create_engine(
-    DATABASE_URL,
-    connect_args={"check_same_thread": False},  # Necesario para SQLite
-    echo=False  # Cambiar a True para debug SQL
-)
+# Perfil de almacenamiento SQLite (se aplica a cada conexión nueva)
+SQLITE_PRAGMAS = {
+    'synchronous': 'NORMAL',        # Seguro con WAL; fsync solo en checkpoints
+    'cache_size': -64000,           # 64 MB de caché de páginas (negativo = KiB)
+    'mmap_size': 268435456,         # 256 MB mapeados en memoria para lecturas
+    'busy_timeout': 5000,           # Esperar 5 s a un lock en vez de fallar
+    'temp_store': 'MEMORY',
+}
 
-# Crear session factory
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Conexiones de solo lectura para GUI y consultas analíticas
+READ_POOL_SIZE = 4
+READ_MAX_OVERFLOW = 4
 
 
-def init_db():
+def _is_sqlite(url: str) -> bool:
+    """Verificar si la URL es de SQLite"""
+    return make_url(url).get_backend_name() == 'sqlite'
+
+
+def _is_memory(url: str) -> bool:
+    """Verificar si la URL es una base SQLite en memoria"""
+    database = make_url(url).database
+    return not database or database == ':memory:' or 'mode=memory' in str(url)
+
+
+def _set_pragmas(dbapi_connection, read_only: bool):
+    """
+    Aplicar el perfil de almacenamiento a una conexión SQLite
+
+    Args:
+        dbapi_connection: Conexión sqlite3
+        read_only: Conexión de solo lectura (no cambia el modo de journal)
+    """
+    cursor = dbapi_connection.cursor()
+    if not read_only:
+        # WAL: los lectores no bloquean al escritor ni viceversa
+        cursor.execute("PRAGMA journal_mode=WAL")
+    for name, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    if read_only:
+        cursor.execute("PRAGMA query_only=ON")
+    cursor.close()
+
+
+def _create_engines(url: str):
+    """
+    Crear engine de escritura y engine de lectura
+
+    En SQLite file-based el escritor es una única conexión serializada (las
+    sesiones esperan su turno en el pool) y las lecturas usan un pool de
+    conexiones abiertas en modo solo lectura. En memoria ambos comparten la
+    misma conexión; otros backends usan un solo engine con su pool normal.
+
+    Args:
+        url: URL de la base de datos
+
+    Returns:
+        Tupla (engine de escritura, engine de lectura)
+    """
+    if not _is_sqlite(url):
+        writer = create_engine(url, echo=False)
+        return writer, writer
+
+    connect_args = {"check_same_thread": False}  # Necesario para SQLite
+
+    if _is_memory(url):
+        writer = create_engine(url, connect_args=connect_args, poolclass=StaticPool, echo=False)
+        return writer, writer
+
+    writer = create_engine(
+        url,
+        connect_args=connect_args,
+        pool_size=1,          # Un único escritor: SQLite solo admite uno a la vez
+        max_overflow=0,
+        pool_timeout=30,
+        echo=False  # Cambiar a True para debug SQL
+    )
+    event.listen(writer, 'connect', lambda conn, record: _set_pragmas(conn, read_only=False))
+
+    # URI de SQLite en modo solo lectura (as_uri escapa espacios y rutas Windows)
+    read_uri = Path(make_url(url).database).resolve().as_uri() + '?mode=ro'
+    reader = create_engine(
+        "sqlite://",
+        creator=lambda: sqlite3.connect(read_uri, uri=True, check_same_thread=False),
+        poolclass=QueuePool,
+        pool_size=READ_POOL_SIZE,
+        max_overflow=READ_MAX_OVERFLOW,
+        echo=False
+    )
+    event.listen(reader, 'connect', lambda conn, record: _set_pragmas(conn, read_only=True))
+
+    return writer, reader
+
+
+def default_database_url() -> str:
+    """
+    URL de la base por defecto
+
+    IOTSENTRY_DATABASE_URL permite usar otra (ej. benchmarks); se lee al
+    crear la base, no al importar.
+
+    Returns:
+        URL de SQLAlchemy
+    """
+    return os.environ.get('IOTSENTRY_DATABASE_URL') or \
+        f"sqlite:///{os.path.join(DATA_DIR, 'iotsentry.db')}"
+
+
+class Database:
+    """
+    Base de datos de IoT Sentry: engines, session factories e inicialización
+
+    Nada se crea hasta el primer acceso a `engine`, `SessionLocal` o una
+    sesión; en ese momento se abren los engines, se crean las tablas y se
+    aplican las migraciones. Cada instancia es independiente, así que un
+    proceso puede usar varias bases (una por sitio, una en memoria por test).
+
+    Uso:
+        db = Database(in_memory=True)
+        engine = IoTSentryEngine(database=db)
+        with db.session() as session:
+            session.add(Device(...))
+    """
+
+    def __init__(self, url: Optional[str] = None, path: Optional[str] = None,
+                 in_memory: bool = False):
+        """
+        Configurar base de datos (sin abrirla)
+
+        Args:
+            url: URL de SQLAlchemy
+            path: Ruta de un archivo SQLite (alternativa a url)
+            in_memory: Base SQLite en memoria, privada de esta instancia
+
+        Sin ninguno de los tres se usa la URL por defecto (IOTSENTRY_DATABASE_URL
+        o data/iotsentry.db).
+        """
+        if sum(bool(option) for option in (url, path, in_memory)) > 1:
+            raise ValueError("Indicar solo uno de url, path o in_memory")
+
+        if in_memory:
+            url = MEMORY_URL
+        elif path:
+            url = f"sqlite:///{os.path.abspath(path)}"
+        self.url = url or default_database_url()
+
+        self._engine = None
+        self._read_engine = None
+        self._session_factory = None
+        self._read_session_factory = None
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"<Database(url={self.url}, open={self._engine is not None})>"
+
+    def _open(self):
+        """
+        Crear engines y factories e inicializar el esquema (una sola vez)
+        """
+        if self._engine is not None:
+            return
+
+        with self._lock:
+            if self._engine is not None:
+                return
+
+            if _is_sqlite(self.url) and not _is_memory(self.url):
+                os.makedirs(os.path.dirname(os.path.abspath(make_url(self.url).database)),
+                            exist_ok=True)
+
+            # Escritura serializada + lecturas en pool
+            writer, reader = _create_engines(self.url)
+            _init_schema(writer, self.url)
+
+            # Cada componente recibe una factory y abre una sesión corta por
+            # unidad de trabajo (un flush, un checkpoint, un escaneo, una
+            # consulta de la GUI), en el thread que la usa: nunca se comparte
+            # una sesión entre threads ni se retiene la conexión de escritura
+            # entre unidades de trabajo. Los objetos no se expiran en el commit
+            # para poder leerlos después de cerrar la sesión.
+            self._session_factory = sessionmaker(
+                autocommit=False, autoflush=False, expire_on_commit=False, bind=writer
+            )
+            self._read_session_factory = sessionmaker(
+                autocommit=False, autoflush=False, bind=reader
+            )
+            self._read_engine = reader
+            self._engine = writer
+
+    @property
+    def engine(self):
+        """Engine de escritura"""
+        self._open()
+        return self._engine
+
+    @property
+    def read_engine(self):
+        """Engine de solo lectura (el mismo que `engine` en memoria u otros backends)"""
+        self._open()
+        return self._read_engine
+
+    @property
+    def SessionLocal(self) -> sessionmaker:
+        """Factory de sesiones de escritura"""
+        self._open()
+        return self._session_factory
+
+    @property
+    def ReadSessionLocal(self) -> sessionmaker:
+        """Factory de sesiones de solo lectura"""
+        self._open()
+        return self._read_session_factory
+
+    @contextmanager
+    def session(self):
+        """
+        Unidad de trabajo: sesión con commit al salir (rollback si hay error)
+
+        Uso:
+            with db.session() as session:
+                devices = session.query(Device).all()
+        """
+        session = self.SessionLocal()
+        try:
+            yield session
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            raise e
+        finally:
+            session.close()
+
+    @contextmanager
+    def read_session(self):
+        """
+        Sesión de solo lectura (GUI, análisis): no espera al escritor
+
+        Uso:
+            with db.read_session() as session:
+                alerts = session.query(Alert).limit(50).all()
+        """
+        session = self.ReadSessionLocal()
+        try:
+            yield session
+        finally:
+            session.close()
+
+    def dispose(self):
+        """
+        Cerrar las conexiones de los engines (la base se puede volver a abrir)
+        """
+        with self._lock:
+            if self._engine is None:
+                return
+            if self._read_engine is not self._engine:
+                self._read_engine.dispose()
+            self._engine.dispose()
+            self._engine = None
+            self._read_engine = None
+            self._session_factory = None
+            self._read_session_factory = None
+
+
+def _init_schema(engine, url: str):
     """
-    Inicializar la base de datos creando todas las tablas
+    Crear tablas nuevas y aplicar migraciones
+
+    Args:
+        engine: Engine de escritura
+        url: URL (para el mensaje)
     """
+    # Base nueva: create_all ya deja el esquema actual, las migraciones solo se registran
+    with engine.connect() as conn:
+        fresh = not inspect(conn).has_table('devices')
+
     Base.metadata.create_all(bind=engine)
-    print(f"✅ Base de datos inicializada en: {DATABASE_URL}")
+    run_migrations(engine, stamp_only=fresh)
+    print(f"✅ Base de datos inicializada en: {url}")
+
+
+# ============ Base por defecto ============
+
+_default_database: Optional[Database] = None
+_default_lock = threading.Lock()
+
+
+def configure(url: Optional[str] = None, path: Optional[str] = None,
+              in_memory: bool = False) -> Database:
+    """
+    Configurar la base por defecto (antes de usarla)
+
+    Args:
+        url: URL de SQLAlchemy
+        path: Ruta de un archivo SQLite
+        in_memory: Base SQLite en memoria
+
+    Returns:
+        Nueva base por defecto
+    """
+    global _default_database
+
+    with _default_lock:
+        if _default_database is not None:
+            _default_database.dispose()
+        _default_database = Database(url=url, path=path, in_memory=in_memory)
+        return _default_database
+
+
+def get_database() -> Database:
+    """
+    Obtener la base por defecto (creándola con la URL por defecto si hace falta)
+
+    Returns:
+        Database
+    """
+    global _default_database
+
+    if _default_database is None:
+        with _default_lock:
+            if _default_database is None:
+                _default_database = Database()
+    return _default_database
+
+
+# Atributos de módulo resueltos al primer uso sobre la base por defecto
+_LAZY_ATTRIBUTES = ('engine', 'read_engine', 'SessionLocal', 'ReadSessionLocal')
+
+
+def __getattr__(name: str):
+    if name in _LAZY_ATTRIBUTES:
+        return getattr(get_database(), name)
+    if name == 'DATABASE_URL':
+        return get_database().url
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def init_db():
+    """
+    Inicializar la base por defecto: crear tablas nuevas y aplicar migraciones
+    """
+    get_database()._open()
 
 
-@contextmanager
 def get_db():
     """
-    Context manager para obtener sesión de base de datos
+    Context manager para obtener sesión de la base por defecto
 
     Uso:
         with get_db() as db:
             devices = db.query(Device).all()
     """
-    db = SessionLocal()
-    try:
-        yield db
-        db.commit()
-    except Exception as e:
-        db.rollback()
-        raise e
-    finally:
-        db.close()
+    return get_database().session()
+
+
+def get_read_db():
+    """
+    Context manager para consultas de solo lectura (GUI, análisis)
+
+    Usa el pool de lectura: no espera al escritor ni puede bloquearlo.
+
+    Uso:
+        with get_read_db() as db:
+            alerts = db.query(Alert).limit(50).all()
+    """
+    return get_database().read_session()
 
 
 def get_db_session() -> Session:
@@ -63,12 +402,8 @@ def get_db_session() -> Session:
         def get_devices(db: Session = Depends(get_db_session)):
             return db.query(Device).all()
     """
-    db = SessionLocal()
+    db = get_database().SessionLocal()
     try:
         yield db
     finally:
         db.close()
-
-
-# Inicializar base de datos al importar
-init_db()
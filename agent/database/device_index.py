@@ -0,0 +1,159 @@
+"""
+IoT Sentry - Índice de Dispositivos en Memoria
+
+Mapea IP → dispositivo y MAC → dispositivo sin consultar la base de datos
+"""
+
+from typing import Dict, Iterable, List, Optional
+import threading
+
+
+class DeviceIndex:
+    """
+    Índice en memoria de los dispositivos conocidos
+
+    Lo mantiene el motor: se reconstruye tras cada escaneo de red y se
+    consulta desde el camino caliente de captura (un lookup de dict por
+    paquete en lugar de una query SQLite).
+
+    Cada entrada es un dict ligero:
+    {'id': int, 'mac_address': str, 'ip_address': str,
+     'device_type': str, 'vendor': str}
+    """
+
+    def __init__(self):
+        """
+        Inicializar índice vacío
+        """
+        self._by_id: Dict[int, dict] = {}
+        self._by_ip: Dict[str, dict] = {}
+        self._by_mac: Dict[str, dict] = {}
+
+        # Solo protege a los escritores; las lecturas usan la referencia
+        # actual del dict (reemplazada atómicamente en rebuild)
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _make_entry(device) -> dict:
+        """
+        Crear entrada del índice a partir de un modelo Device
+
+        Args:
+            device: Instancia de Device
+
+        Returns:
+            Dict con los campos necesarios en el camino caliente
+        """
+        return {
+            'id': device.id,
+            'mac_address': device.mac_address,
+            'ip_address': device.ip_address,
+            'device_type': device.device_type,
+            'vendor': device.vendor,
+        }
+
+    def rebuild(self, devices: Iterable):
+        """
+        Reconstruir el índice completo
+
+        Args:
+            devices: Iterable de modelos Device
+        """
+        by_id = {}
+        by_ip = {}
+        by_mac = {}
+
+        for device in devices:
+            entry = self._make_entry(device)
+            by_id[entry['id']] = entry
+            by_mac[entry['mac_address']] = entry
+            if entry['ip_address']:
+                by_ip[entry['ip_address']] = entry
+
+        with self.lock:
+            # Swap atómico: los lectores ven el índice viejo o el nuevo
+            self._by_id = by_id
+            self._by_ip = by_ip
+            self._by_mac = by_mac
+
+    def update(self, device):
+        """
+        Insertar o actualizar un dispositivo en el índice
+
+        Args:
+            device: Instancia de Device (ya persistida, con id)
+        """
+        entry = self._make_entry(device)
+
+        with self.lock:
+            old = self._by_mac.get(entry['mac_address'])
+            if old and old['ip_address'] and old['ip_address'] != entry['ip_address']:
+                # La IP cambió: quitar el mapeo anterior si sigue apuntando aquí
+                if self._by_ip.get(old['ip_address']) is old:
+                    del self._by_ip[old['ip_address']]
+
+            self._by_id[entry['id']] = entry
+            self._by_mac[entry['mac_address']] = entry
+            if entry['ip_address']:
+                self._by_ip[entry['ip_address']] = entry
+
+    def get_by_id(self, device_id: int) -> Optional[dict]:
+        """
+        Buscar dispositivo por ID
+
+        Args:
+            device_id: ID del dispositivo
+
+        Returns:
+            Entrada del índice o None
+        """
+        return self._by_id.get(device_id)
+
+    def get_by_ip(self, ip_address: str) -> Optional[dict]:
+        """
+        Buscar dispositivo por IP
+
+        Args:
+            ip_address: Dirección IP
+
+        Returns:
+            Entrada del índice o None
+        """
+        return self._by_ip.get(ip_address)
+
+    def get_by_mac(self, mac_address: str) -> Optional[dict]:
+        """
+        Buscar dispositivo por MAC
+
+        Args:
+            mac_address: Dirección MAC
+
+        Returns:
+            Entrada del índice o None
+        """
+        return self._by_mac.get(mac_address)
+
+    def get_device_id(self, ip_address: str) -> Optional[int]:
+        """
+        Obtener el ID de dispositivo asociado a una IP
+
+        Args:
+            ip_address: Dirección IP
+
+        Returns:
+            ID del dispositivo o None
+        """
+        entry = self._by_ip.get(ip_address)
+        return entry['id'] if entry else None
+
+    def get_ip_addresses(self) -> List[str]:
+        """
+        Obtener todas las IPs indexadas
+
+        Returns:
+            Lista de IPs
+        """
+        return list(self._by_ip.keys())
+
+    def __len__(self) -> int:
+        return len(self._by_mac)
@@ -0,0 +1,346 @@
+"""
+IoT Sentry - Migraciones de Esquema
+
+Migraciones versionadas que se aplican al arrancar sobre bases de datos ya
+existentes (`create_all` solo crea tablas nuevas, no modifica las que ya
+hay). La versión aplicada se guarda en la tabla `schema_version`.
+
+Cada migración es una función que recibe el engine y usa los helpers de
+este módulo, pensados para no bloquear la DB durante minutos:
+- Cada paso (columna, índice, lote de backfill) va en su propia transacción
+- Los backfills recorren la tabla por rangos de id en lotes
+- Todos los pasos son idempotentes: una migración interrumpida se puede
+  volver a ejecutar desde el principio
+
+Para añadir una migración, ver docs/DEVELOPMENT.md (Database Migrations).
+"""
+
+from datetime import datetime
+from typing import Callable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, inspect, text
+
+# Filas por transacción en los backfills
+BACKFILL_BATCH_SIZE = 5000
+
+_metadata = MetaData()
+
+schema_version = Table(
+    'schema_version', _metadata,
+    Column('version', Integer, primary_key=True),
+    Column('description', String(255), nullable=False),
+    Column('applied_at', DateTime, nullable=False),
+)
+
+# Migraciones registradas: (versión, descripción, función)
+MIGRATIONS: List[Tuple[int, str, Callable]] = []
+
+
+def migration(version: int, description: str):
+    """
+    Decorador para registrar una migración
+
+    Args:
+        version: Número de versión (creciente, sin reutilizar)
+        description: Descripción corta
+
+    Returns:
+        Decorador que registra la función
+    """
+    def register(func: Callable) -> Callable:
+        if any(existing == version for existing, _, _ in MIGRATIONS):
+            raise ValueError(f"Versión de migración duplicada: {version}")
+        MIGRATIONS.append((version, description, func))
+        MIGRATIONS.sort(key=lambda entry: entry[0])
+        return func
+    return register
+
+
+# ============ Helpers ============
+
+def add_column(engine, table: str, name: str, ddl: str) -> bool:
+    """
+    Añadir una columna si no existe
+
+    Args:
+        engine: Engine de SQLAlchemy
+        table: Tabla
+        name: Nombre de la columna
+        ddl: Tipo y restricciones (ej. 'INTEGER NOT NULL DEFAULT 1')
+
+    Returns:
+        True si se añadió
+    """
+    with engine.begin() as conn:
+        existing = {column['name'] for column in inspect(conn).get_columns(table)}
+        if name in existing:
+            return False
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {ddl}"))
+    return True
+
+
+def create_index(engine, name: str, table: str, columns: Sequence[str],
+                 unique: bool = False) -> bool:
+    """
+    Crear un índice si no existe (una transacción por índice)
+
+    SQLite bloquea las escrituras mientras construye el índice; con WAL los
+    lectores siguen trabajando, y al ir cada índice por separado el bloqueo
+    dura solo lo que tarda uno.
+
+    Args:
+        engine: Engine de SQLAlchemy
+        name: Nombre del índice
+        table: Tabla
+        columns: Columnas en orden
+        unique: Índice único
+
+    Returns:
+        True si se creó
+    """
+    with engine.begin() as conn:
+        existing = {index['name'] for index in inspect(conn).get_indexes(table)}
+        if name in existing:
+            return False
+        print(f"🔧 Creando índice {name}...")
+        kind = 'UNIQUE INDEX' if unique else 'INDEX'
+        conn.execute(text(f"CREATE {kind} {name} ON {table} ({', '.join(columns)})"))
+    return True
+
+
+def drop_index(engine, name: str, table: str) -> bool:
+    """
+    Eliminar un índice si existe
+
+    Args:
+        engine: Engine de SQLAlchemy
+        name: Nombre del índice
+        table: Tabla del índice
+
+    Returns:
+        True si se eliminó
+    """
+    with engine.begin() as conn:
+        existing = {index['name'] for index in inspect(conn).get_indexes(table)}
+        if name not in existing:
+            return False
+        conn.execute(text(f"DROP INDEX {name}"))
+    return True
+
+
+def backfill(engine, table: str, assignments: str, condition: str,
+             batch_size: int = BACKFILL_BATCH_SIZE, key: str = 'id') -> int:
+    """
+    Actualizar filas por lotes de ids consecutivos (una transacción por lote)
+
+    Entre lotes se libera el lock de escritura, así que el resto de la
+    aplicación puede escribir durante un backfill largo.
+
+    Args:
+        engine: Engine de SQLAlchemy
+        table: Tabla
+        assignments: Cláusula SET (ej. 'last_seen = timestamp')
+        condition: Filas pendientes (ej. 'last_seen IS NULL'); las filas ya
+                   actualizadas no deben cumplirla
+        batch_size: Rango de ids por lote
+        key: Columna entera por la que se recorre la tabla
+
+    Returns:
+        Filas actualizadas
+    """
+    with engine.connect() as conn:
+        low, high = conn.execute(text(f"SELECT MIN({key}), MAX({key}) FROM {table}")).one()
+    if low is None:
+        return 0
+
+    updated = 0
+    start = low
+    while start <= high:
+        with engine.begin() as conn:
+            result = conn.execute(text(
+                f"UPDATE {table} SET {assignments} "
+                f"WHERE {key} >= :start AND {key} < :end AND ({condition})"
+            ), {'start': start, 'end': start + batch_size})
+            updated += result.rowcount
+        start += batch_size
+
+    if updated:
+        print(f"🔧 {table}: {updated} filas actualizadas")
+    return updated
+
+
+# ============ Migraciones ============
+
+@migration(1, "Agregación de alertas (first_seen, last_seen, count)")
+def _alert_aggregation(engine):
+    add_column(engine, 'alerts', 'first_seen', 'DATETIME')
+    add_column(engine, 'alerts', 'last_seen', 'DATETIME')
+    add_column(engine, 'alerts', 'count', 'INTEGER NOT NULL DEFAULT 1')
+    backfill(engine, 'alerts',
+             "first_seen = COALESCE(first_seen, timestamp), "
+             "last_seen = COALESCE(last_seen, timestamp)",
+             "first_seen IS NULL OR last_seen IS NULL")
+    create_index(engine, 'ix_alerts_last_seen', 'alerts', ['last_seen'])
+
+
+@migration(2, "Índices compuestos para consultas analíticas")
+def _analytic_indexes(engine):
+    create_index(engine, 'ix_devices_ip_address', 'devices', ['ip_address'])
+    create_index(engine, 'ix_flows_device_time', 'flows',
+                 ['device_id', 'timestamp', 'bytes_sent'])
+    create_index(engine, 'ix_flows_time_device', 'flows',
+                 ['timestamp', 'device_id', 'bytes_sent'])
+    create_index(engine, 'ix_flows_device_dest', 'flows',
+                 ['device_id', 'dest_ip', 'dest_country', 'dest_city', 'bytes_sent'])
+    # Reemplazados por los compuestos (prefijos de ix_flows_device_time / ix_flows_time_device)
+    drop_index(engine, 'ix_flows_device_id', 'flows')
+    drop_index(engine, 'ix_flows_timestamp', 'flows')
+
+
+@migration(3, "Filas de flows acumuladas (anteriores a los deltas) a deltas por intervalo")
+def _cumulative_flows_to_deltas(engine):
+    # Antes de los deltas, cada flush guardaba el acumulado de cada flujo activo
+    # con timestamp = primer paquete: una cadena de filas con la misma clave y
+    # el mismo timestamp es un flujo. Las filas delta tienen un timestamp por
+    # intervalo, así que forman cadenas de una sola fila y no se tocan.
+    #
+    # Los deltas se calculan una vez en una tabla auxiliar (atómica); después
+    # se aplican por lotes de ids borrando de la tabla auxiliar lo aplicado,
+    # de modo que repetir la migración continúa donde se quedó. Los
+    # intervalos sin tráfico (delta 0) se eliminan, como hace el flush actual.
+    # Los deltas heredan el timestamp del inicio del flujo.
+    #
+    # Recalcular sobre filas ya convertidas las volvería a restar: la versión
+    # se registra en la misma transacción que elimina la tabla auxiliar.
+    with engine.begin() as conn:
+        if not inspect(conn).has_table('_flow_deltas'):
+            conn.execute(text("""
+                CREATE TABLE _flow_deltas AS
+                SELECT id,
+                       CASE WHEN bytes >= prev_bytes THEN bytes - prev_bytes ELSE bytes END
+                           AS bytes_sent,
+                       CASE WHEN packets >= prev_packets THEN packets - prev_packets ELSE packets END
+                           AS packets_sent
+                FROM (
+                    SELECT id,
+                           COALESCE(bytes_sent, 0) AS bytes,
+                           COALESCE(packets_sent, 0) AS packets,
+                           LAG(COALESCE(bytes_sent, 0)) OVER chain AS prev_bytes,
+                           LAG(COALESCE(packets_sent, 0)) OVER chain AS prev_packets
+                    FROM flows
+                    WINDOW chain AS (
+                        PARTITION BY device_id, dest_ip, dest_port, protocol, timestamp
+                        ORDER BY id
+                    )
+                )
+                WHERE prev_bytes IS NOT NULL
+            """))
+
+    with engine.connect() as conn:
+        low, high, pending = conn.execute(
+            text("SELECT MIN(id), MAX(id), COUNT(*) FROM _flow_deltas")
+        ).one()
+
+    if pending:
+        print(f"🔧 flows: {pending} filas acumuladas a convertir en deltas")
+        start = low
+        while start <= high:
+            batch = {'start': start, 'end': start + BACKFILL_BATCH_SIZE}
+            with engine.begin() as conn:
+                conn.execute(text("""
+                    DELETE FROM flows WHERE id IN (
+                        SELECT id FROM _flow_deltas
+                        WHERE id >= :start AND id < :end
+                          AND bytes_sent = 0 AND packets_sent = 0
+                    )
+                """), batch)
+                conn.execute(text("""
+                    UPDATE flows
+                    SET bytes_sent = d.bytes_sent, packets_sent = d.packets_sent
+                    FROM _flow_deltas AS d
+                    WHERE flows.id = d.id AND d.id >= :start AND d.id < :end
+                """), batch)
+                conn.execute(text(
+                    "DELETE FROM _flow_deltas WHERE id >= :start AND id < :end"
+                ), batch)
+            start += BACKFILL_BATCH_SIZE
+
+    with engine.begin() as conn:
+        conn.execute(text("DROP TABLE IF EXISTS _flow_deltas"))
+        stamp_version(conn, 3)
+
+
+# ============ Runner ============
+
+def stamp_version(conn, version: int):
+    """
+    Registrar una versión aplicada (si no lo está ya)
+
+    Una migración que no es idempotente puede registrarse en la misma
+    transacción que su último paso; el runner no la vuelve a registrar.
+
+    Args:
+        conn: Conexión dentro de una transacción
+        version: Versión de MIGRATIONS
+    """
+    registered = conn.execute(
+        text("SELECT 1 FROM schema_version WHERE version = :version"), {'version': version}
+    ).first()
+    if registered is None:
+        description = next(desc for number, desc, _ in MIGRATIONS if number == version)
+        conn.execute(schema_version.insert().values(
+            version=version, description=description, applied_at=datetime.utcnow()
+        ))
+
+
+def get_schema_version(engine) -> int:
+    """
+    Obtener la versión de esquema aplicada
+
+    Args:
+        engine: Engine de SQLAlchemy
+
+    Returns:
+        Última versión aplicada (0 si no se aplicó ninguna)
+    """
+    with engine.connect() as conn:
+        if not inspect(conn).has_table('schema_version'):
+            return 0
+        version = conn.execute(text("SELECT MAX(version) FROM schema_version")).scalar()
+    return version or 0
+
+
+def run_migrations(engine, target: Optional[int] = None,
+                   stamp_only: bool = False) -> List[int]:
+    """
+    Aplicar las migraciones pendientes en orden
+
+    Se ejecuta después de `create_all`.
+
+    Args:
+        engine: Engine de SQLAlchemy
+        target: Versión hasta la que migrar (None = última)
+        stamp_only: Registrar las versiones sin ejecutarlas (base recién
+                    creada por `create_all`, que ya tiene el esquema actual)
+
+    Returns:
+        Versiones aplicadas
+    """
+    _metadata.create_all(bind=engine)
+    current = get_schema_version(engine)
+
+    applied = []
+    for version, description, func in MIGRATIONS:
+        if version <= current or (target is not None and version > target):
+            continue
+
+        if not stamp_only:
+            print(f"🔧 Migración {version}: {description}")
+            func(engine)
+
+        # La versión se registra al terminar: si falla, se repite completa
+        with engine.begin() as conn:
+            stamp_version(conn, version)
+        applied.append(version)
+
+    return applied
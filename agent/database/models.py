@@ -3,7 +3,9 @@ IoT Sentry - Modelos de Base de Datos SQLAlchemy
 """
 
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, ForeignKey, Float, JSON
+from sqlalchemy import (
+    Column, Integer, BigInteger, String, Text, DateTime, Boolean, ForeignKey, Float, JSON, Index
+)
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 
@@ -16,7 +18,7 @@ class Device(Base):
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     mac_address = Column(String(17), unique=True, nullable=False, index=True)
-    ip_address = Column(String(15), nullable=True)
+    ip_address = Column(String(15), nullable=True, index=True)  # Búsqueda IP → dispositivo
     hostname = Column(String(255), nullable=True)
     vendor = Column(String(255), nullable=True)  # Fabricante via OUI
     device_type = Column(String(50), nullable=True)  # camera, speaker, bulb, etc.
@@ -26,6 +28,8 @@ class Device(Base):
     # Relaciones
     flows = relationship("Flow", back_populates="device", cascade="all, delete-orphan")
     alerts = relationship("Alert", back_populates="device", cascade="all, delete-orphan")
+    baseline = relationship("DeviceBaseline", back_populates="device", uselist=False,
+                            cascade="all, delete-orphan")
 
     def __repr__(self):
         return f"<Device(id={self.id}, mac={self.mac_address}, ip={self.ip_address}, vendor={self.vendor})>"
@@ -48,8 +52,22 @@ class Flow(Base):
     """Modelo para flujos de red capturados"""
     __tablename__ = 'flows'
 
+    # Índices para las consultas analíticas (ver test_query_plans.py). Los
+    # que incluyen bytes_sent son "covering": las sumas por dispositivo u hora
+    # se resuelven solo con el índice, sin leer las filas de la tabla.
+    __table_args__ = (
+        # device_id = ? [AND timestamp >= ?] [ORDER BY timestamp]: flujos de un
+        # dispositivo, timeline por dispositivo, bootstrap de baselines
+        Index('ix_flows_device_time', 'device_id', 'timestamp', 'bytes_sent'),
+        # timestamp >= ?: consumo por dispositivo, timeline global, ventanas al arrancar
+        Index('ix_flows_time_device', 'timestamp', 'device_id', 'bytes_sent'),
+        # device_id = ? GROUP BY dest_ip, dest_country, dest_city: destinos más frecuentes
+        Index('ix_flows_device_dest', 'device_id', 'dest_ip', 'dest_country', 'dest_city',
+              'bytes_sent'),
+    )
+
     id = Column(Integer, primary_key=True, autoincrement=True)
-    device_id = Column(Integer, ForeignKey('devices.id'), nullable=False, index=True)
+    device_id = Column(Integer, ForeignKey('devices.id'), nullable=False)
     dest_ip = Column(String(45), nullable=False)  # IPv4 o IPv6
     dest_port = Column(Integer, nullable=True)
     protocol = Column(String(10), nullable=False)  # TCP, UDP, ICMP, etc.
@@ -60,11 +78,11 @@ class Flow(Base):
     dest_lat = Column(Float, nullable=True)
     dest_lon = Column(Float, nullable=True)
 
-    # Métricas
+    # Métricas (delta del flujo en un intervalo de flush, no acumulado)
     bytes_sent = Column(Integer, default=0)
     packets_sent = Column(Integer, default=0)
 
-    timestamp = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
+    timestamp = Column(DateTime, default=datetime.utcnow, nullable=False)
 
     # Relación
     device = relationship("Device", back_populates="flows")
@@ -103,6 +121,11 @@ class Alert(Base):
     timestamp = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
     acknowledged = Column(Boolean, default=False)
 
+    # Agregación: repeticiones de la misma alerta dentro de la ventana de supresión
+    first_seen = Column(DateTime, default=datetime.utcnow, nullable=True)
+    last_seen = Column(DateTime, default=datetime.utcnow, nullable=True, index=True)
+    count = Column(Integer, default=1, nullable=False)
+
     # Relación
     device = relationship("Device", back_populates="alerts")
 
@@ -120,4 +143,41 @@ class Alert(Base):
             'metadata': self.alert_metadata,
             'timestamp': self.timestamp.isoformat() if self.timestamp else None,
             'acknowledged': self.acknowledged,
+            'first_seen': self.first_seen.isoformat() if self.first_seen else None,
+            'last_seen': self.last_seen.isoformat() if self.last_seen else None,
+            'count': self.count,
+        }
+
+
+class DeviceBaseline(Base):
+    """Modelo para el comportamiento aprendido de un dispositivo (checkpoint)"""
+    __tablename__ = 'device_baselines'
+
+    device_id = Column(Integer, ForeignKey('devices.id'), primary_key=True)
+    hourly_histogram = Column(JSON, nullable=False)  # 24 contadores de flujos por hora UTC
+    destinations = Column(JSON, nullable=False)  # IPs destino vistas
+    ports = Column(JSON, nullable=False)  # Puertos destino vistos
+    bytes_sketch = Column(JSON, nullable=False)  # Sketch de cuantiles de bytes por flujo
+    total_flows = Column(Integer, default=0, nullable=False)
+    total_bytes = Column(BigInteger, default=0, nullable=False)
+    max_bytes = Column(BigInteger, default=0, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+    # Relación
+    device = relationship("Device", back_populates="baseline")
+
+    def __repr__(self):
+        return f"<DeviceBaseline(device_id={self.device_id}, flows={self.total_flows})>"
+
+    def to_dict(self):
+        """Convertir a diccionario para API"""
+        return {
+            'device_id': self.device_id,
+            'hourly_histogram': self.hourly_histogram,
+            'destinations': len(self.destinations or []),
+            'ports': self.ports,
+            'total_flows': self.total_flows,
+            'total_bytes': self.total_bytes,
+            'max_bytes': self.max_bytes,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
         }
@@ -12,14 +12,15 @@ from collections import defaultdict
 class BandwidthAnalyzer:
     """Analizador de consumo de ancho de banda"""
 
-    def __init__(self, db_session):
+    def __init__(self, session_factory):
         """
         Inicializar analizador
 
         Args:
-            db_session: Sesión de base de datos
+            session_factory: Factory de sesiones de base de datos (ej. el pool de
+                             solo lectura; una sesión corta por consulta)
         """
-        self.db_session = db_session
+        self.session_factory = session_factory
 
     def get_bandwidth_by_device(self, hours: int = 1) -> List[Dict]:
         """
@@ -29,7 +30,9 @@ class BandwidthAnalyzer:
             hours: Horas a analizar (hacia atrás desde ahora)
 
         Returns:
-            Lista de dispositivos con su consumo [{device_id, bytes, mbps}, ...]
+            Lista de dispositivos con su consumo [{device_id, bytes, mbps}, ...].
+            `total_records` cuenta filas de `flows` (un intervalo de flush de
+            un flujo cada una), no conexiones
         """
         from agent.database.models import Device, Flow
 
@@ -38,23 +41,24 @@ class BandwidthAnalyzer:
         # Query: Sumar bytes por dispositivo
         from sqlalchemy import func
 
-        results = self.db_session.query(
-            Device.id,
-            Device.hostname,
-            Device.vendor,
-            Device.device_type,
-            Device.ip_address,
-            func.sum(Flow.bytes_sent).label('total_bytes'),
-            func.count(Flow.id).label('total_flows')
-        ).join(
-            Flow, Device.id == Flow.device_id
-        ).filter(
-            Flow.timestamp >= cutoff
-        ).group_by(
-            Device.id
-        ).order_by(
-            func.sum(Flow.bytes_sent).desc()
-        ).all()
+        with self.session_factory() as session:
+            results = session.query(
+                Device.id,
+                Device.hostname,
+                Device.vendor,
+                Device.device_type,
+                Device.ip_address,
+                func.sum(Flow.bytes_sent).label('total_bytes'),
+                func.count(Flow.id).label('total_records')
+            ).join(
+                Flow, Device.id == Flow.device_id
+            ).filter(
+                Flow.timestamp >= cutoff
+            ).group_by(
+                Device.id
+            ).order_by(
+                func.sum(Flow.bytes_sent).desc()
+            ).all()
 
         # Convertir a lista de dicts
         devices = []
@@ -74,7 +78,7 @@ class BandwidthAnalyzer:
                 'bytes_sent': bytes_sent,
                 'mbps_avg': round(mbps, 2),
                 'percentage': round(percentage, 1),
-                'total_flows': r.total_flows
+                'total_records': r.total_records
             })
 
         return devices
@@ -134,28 +138,30 @@ class BandwidthAnalyzer:
             hours: Horas de historial
 
         Returns:
-            Lista de puntos temporales [{timestamp, bytes}, ...]
+            Lista de puntos temporales [{timestamp, bytes, mbps, records}, ...]
+            (`records` = intervalos de flujo guardados en esa hora)
         """
         from agent.database.models import Flow
         from sqlalchemy import func
 
         cutoff = datetime.utcnow() - timedelta(hours=hours)
 
-        # Agrupar por hora
-        query = self.db_session.query(
-            func.strftime('%Y-%m-%d %H:00:00', Flow.timestamp).label('hour'),
-            func.sum(Flow.bytes_sent).label('total_bytes'),
-            func.count(Flow.id).label('flow_count')
-        ).filter(
-            Flow.timestamp >= cutoff
-        )
+        with self.session_factory() as session:
+            # Agrupar por hora
+            query = session.query(
+                func.strftime('%Y-%m-%d %H:00:00', Flow.timestamp).label('hour'),
+                func.sum(Flow.bytes_sent).label('total_bytes'),
+                func.count(Flow.id).label('record_count')
+            ).filter(
+                Flow.timestamp >= cutoff
+            )
 
-        if device_id:
-            query = query.filter(Flow.device_id == device_id)
+            if device_id:
+                query = query.filter(Flow.device_id == device_id)
 
-        query = query.group_by('hour').order_by('hour')
+            query = query.group_by('hour').order_by('hour')
 
-        results = query.all()
+            results = query.all()
 
         timeline = []
         for r in results:
@@ -163,7 +169,7 @@ class BandwidthAnalyzer:
                 'timestamp': datetime.strptime(r.hour, '%Y-%m-%d %H:%M:%S'),
                 'bytes': r.total_bytes or 0,
                 'mbps': ((r.total_bytes or 0) * 8) / (3600 * 1_000_000),  # Mbps promedio en esa hora
-                'flows': r.flow_count
+                'records': r.record_count
             })
 
         return timeline
@@ -177,29 +183,31 @@ class BandwidthAnalyzer:
             limit: Número de resultados
 
         Returns:
-            Lista de destinos [{dest_ip, dest_country, bytes, flows}, ...]
+            Lista de destinos [{dest_ip, dest_country, bytes, records}, ...]
+            (`record_count` = intervalos de flujo guardados, no conexiones)
         """
         from agent.database.models import Flow
         from sqlalchemy import func
 
-        query = self.db_session.query(
-            Flow.dest_ip,
-            Flow.dest_country,
-            Flow.dest_city,
-            func.sum(Flow.bytes_sent).label('total_bytes'),
-            func.count(Flow.id).label('flow_count')
-        )
+        with self.session_factory() as session:
+            query = session.query(
+                Flow.dest_ip,
+                Flow.dest_country,
+                Flow.dest_city,
+                func.sum(Flow.bytes_sent).label('total_bytes'),
+                func.count(Flow.id).label('record_count')
+            )
 
-        if device_id:
-            query = query.filter(Flow.device_id == device_id)
+            if device_id:
+                query = query.filter(Flow.device_id == device_id)
 
-        query = query.group_by(
-            Flow.dest_ip, Flow.dest_country, Flow.dest_city
-        ).order_by(
-            func.sum(Flow.bytes_sent).desc()
-        ).limit(limit)
+            query = query.group_by(
+                Flow.dest_ip, Flow.dest_country, Flow.dest_city
+            ).order_by(
+                func.sum(Flow.bytes_sent).desc()
+            ).limit(limit)
 
-        results = query.all()
+            results = query.all()
 
         destinations = []
         for r in results:
@@ -209,7 +217,7 @@ class BandwidthAnalyzer:
                 'dest_city': r.dest_city or 'Unknown',
                 'bytes_sent': r.total_bytes or 0,
                 'mb_sent': round((r.total_bytes or 0) / (1024 * 1024), 2),
-                'flow_count': r.flow_count
+                'record_count': r.record_count
             })
 
         return destinations
@@ -4,5 +4,7 @@ IoT Sentry - Sniffer package
 
 from .packet_capture import PacketCapture
 from .flow_tracker import FlowTracker
+from .packet_pipeline import PacketPipeline
+from .capture_supervisor import CaptureSupervisor
 
-__all__ = ['PacketCapture', 'FlowTracker']
+__all__ = ['PacketCapture', 'FlowTracker', 'PacketPipeline', 'CaptureSupervisor']
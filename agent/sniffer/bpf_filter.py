@@ -0,0 +1,130 @@
+"""
+IoT Sentry - Filtros BPF
+
+Genera filtros BPF a partir de los dispositivos monitoreados y los aplica en
+caliente sobre el socket de captura, para que el tráfico de hosts no
+monitoreados se descarte en el kernel
+"""
+
+import ipaddress
+import socket
+from typing import Iterable, List
+
+# Filtro base: todo el tráfico IPv4 (comportamiento original)
+DEFAULT_FILTER = "ip"
+
+# Límites conservadores: cada término "src host"/"src net" compila a 2-3
+# instrucciones BPF y el kernel rechaza programas de más de 4096 (BPF_MAXINSNS)
+MAX_FILTER_TERMS = 1000
+
+# Prefijo usado al agregar hosts en subredes cuando no caben como términos exactos
+SUPERNET_PREFIX = 24
+
+
+def _terms_for_networks(networks: Iterable[ipaddress.IPv4Network]) -> List[str]:
+    """
+    Convertir redes en términos de filtro BPF
+
+    Args:
+        networks: Redes IPv4
+
+    Returns:
+        Lista de términos ('src host X' o 'src net X/N')
+    """
+    terms = []
+    for network in networks:
+        if network.prefixlen == 32:
+            terms.append(f"src host {network.network_address}")
+        else:
+            terms.append(f"src net {network}")
+    return terms
+
+
+def _join_terms(terms: List[str]) -> str:
+    """
+    Combinar términos en una expresión BPF completa
+
+    Args:
+        terms: Términos de origen
+
+    Returns:
+        Expresión 'ip and (t1 or t2 ...)'
+    """
+    return f"{DEFAULT_FILTER} and ({' or '.join(terms)})"
+
+
+def build_bpf_filters(ip_addresses: Iterable[str], max_terms: int = MAX_FILTER_TERMS) -> List[str]:
+    """
+    Generar filtros BPF candidatos, del más selectivo al más general
+
+    1. Hosts exactos (rangos contiguos colapsados en subredes exactas)
+    2. Subredes /24 que cubren a los hosts (superconjunto, el filtrado fino
+       se sigue haciendo en userspace)
+    3. "ip" (fallback cuando nada cabe en un programa BPF)
+
+    Args:
+        ip_addresses: IPs de dispositivos monitoreados
+        max_terms: Máximo de términos permitidos por filtro
+
+    Returns:
+        Lista de expresiones BPF en orden de preferencia
+    """
+    hosts = []
+    for ip in ip_addresses:
+        try:
+            address = ipaddress.ip_address(ip)
+        except ValueError:
+            continue
+        if address.version == 4:
+            hosts.append(ipaddress.ip_network(address))
+
+    if not hosts:
+        return [DEFAULT_FILTER]
+
+    candidates = []
+
+    exact = list(ipaddress.collapse_addresses(hosts))
+    if len(exact) <= max_terms:
+        candidates.append(_join_terms(_terms_for_networks(exact)))
+
+    supernets = list(ipaddress.collapse_addresses(
+        network.supernet(new_prefix=SUPERNET_PREFIX) if network.prefixlen > SUPERNET_PREFIX else network
+        for network in exact
+    ))
+    if len(supernets) <= max_terms and supernets != exact:
+        candidates.append(_join_terms(_terms_for_networks(supernets)))
+
+    candidates.append(DEFAULT_FILTER)
+    return candidates
+
+
+def attach_bpf_filter(sock, bpf_filter: str, iface=None):
+    """
+    Compilar y aplicar un filtro BPF sobre un socket de captura abierto
+
+    Reemplaza el filtro anterior de forma atómica sin cerrar el socket.
+    Soporta sockets AF_PACKET propios y los sockets de escucha de Scapy
+    (Linux nativo, libpcap y /dev/bpf en BSD/macOS).
+
+    Args:
+        sock: socket.socket o SuperSocket de Scapy
+        bpf_filter: Expresión BPF
+        iface: Interfaz usada para compilar el filtro
+
+    Raises:
+        Exception: Si el filtro no se puede compilar o aplicar
+    """
+    # Socket libpcap de Scapy
+    pcap_fd = getattr(sock, 'pcap_fd', None)
+    if pcap_fd is not None:
+        pcap_fd.setfilter(bpf_filter)
+        return
+
+    fd = sock if isinstance(sock, socket.socket) else sock.ins
+
+    if isinstance(fd, socket.socket):
+        from scapy.arch.linux import attach_filter
+    else:
+        from scapy.arch.bpf.core import attach_filter
+
+    attach_filter(fd, bpf_filter, iface)
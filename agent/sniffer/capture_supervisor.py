@@ -0,0 +1,361 @@
+"""
+IoT Sentry - Supervisor de Captura Multi-proceso
+
+Ejecuta un proceso de captura por interfaz (o varios por interfaz con
+PACKET_FANOUT en Linux). Cada proceso decodifica y agrega flujos localmente
+y envía al motor solo deltas de flujo compactos, evitando el límite del GIL
+"""
+
+import multiprocessing
+import queue
+import socket
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from .packet_decoder import ETH_P_ALL, decode_ethernet
+from .bpf_filter import build_bpf_filters, attach_bpf_filter
+from agent.analyzer.ip_classifier import is_lan_ip
+
+# Constantes de AF_PACKET (linux/if_packet.h)
+SOL_PACKET = 263
+PACKET_FANOUT = 18
+PACKET_FANOUT_HASH = 0  # Reparte por hash de flujo: un flujo siempre va al mismo proceso
+
+# Delta de flujo: (src_ip, dst_ip, dst_port, protocol, bytes, packets, first_seen, last_seen)
+FlowDelta = tuple
+
+
+def _open_worker_socket(interface: str, fanout_group: Optional[int]):
+    """
+    Abrir socket de captura para un worker
+
+    Args:
+        interface: Interfaz de red
+        fanout_group: ID de grupo PACKET_FANOUT (None = sin fanout)
+
+    Returns:
+        Tupla (socket, es_af_packet)
+    """
+    if hasattr(socket, 'AF_PACKET'):
+        sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, socket.htons(ETH_P_ALL))
+        sock.bind((interface, 0))
+        sock.settimeout(0.2)
+
+        if fanout_group is not None:
+            sock.setsockopt(SOL_PACKET, PACKET_FANOUT,
+                            (fanout_group & 0xFFFF) | (PACKET_FANOUT_HASH << 16))
+
+        return sock, True
+
+    # Otros sistemas: socket libpcap de Scapy (sin fanout)
+    from scapy.all import conf
+    return conf.L2listen(iface=interface), False
+
+
+def _apply_worker_filter(sock, interface: str, monitored_ips):
+    """
+    Aplicar el filtro BPF más selectivo posible en el socket del worker
+
+    Args:
+        sock: Socket de captura
+        interface: Interfaz de red
+        monitored_ips: IPs monitoreadas
+    """
+    for candidate in build_bpf_filters(monitored_ips):
+        try:
+            attach_bpf_filter(sock, candidate, interface)
+            return
+        except Exception:
+            continue
+
+
+def capture_worker(shard_id: int, interface: str, fanout_group: Optional[int],
+                   monitored_ips: List[str], control_queue, result_queue,
+                   stop_event, report_interval: float, skip_local_traffic: bool = False):
+    """
+    Proceso de captura: decodifica, agrega flujos y envía deltas
+
+    Args:
+        shard_id: Identificador del shard
+        interface: Interfaz de red
+        fanout_group: ID de grupo PACKET_FANOUT (None = sin fanout)
+        monitored_ips: IPs iniciales a monitorear
+        control_queue: Cola de mensajes del supervisor (ej. nuevas IPs)
+        result_queue: Cola hacia el supervisor
+        stop_event: Evento de parada
+        report_interval: Segundos entre envíos de deltas
+        skip_local_traffic: Descartar los paquetes cuyo destino es de la red local
+    """
+    monitored = set(monitored_ips)
+    flows: Dict[tuple, list] = {}
+    stats = {'packets_captured': 0, 'packets_processed': 0,
+             'packets_skipped_local': 0, 'errors': 0}
+
+    try:
+        sock, is_af_packet = _open_worker_socket(interface, fanout_group)
+    except Exception as e:
+        result_queue.put(('error', shard_id, f"{interface}: {e}"))
+        return
+
+    _apply_worker_filter(sock, interface, monitored)
+
+    buffer = bytearray(65536)
+    view = memoryview(buffer)
+    next_report = time.monotonic() + report_interval
+
+    try:
+        while not stop_event.is_set():
+            frame = None
+
+            try:
+                if is_af_packet:
+                    length = sock.recv_into(buffer)
+                    frame = view[:length]
+                else:
+                    _, frame, _ = sock.recv_raw()
+            except socket.timeout:
+                pass
+            except Exception:
+                stats['errors'] += 1
+
+            if frame:
+                stats['packets_captured'] += 1
+                decoded = decode_ethernet(frame)
+
+                if decoded is None or decoded[0] not in monitored:
+                    pass
+                elif skip_local_traffic and is_lan_ip(decoded[1]):
+                    # Tráfico interno de la LAN: no llega a los deltas
+                    stats['packets_skipped_local'] += 1
+                else:
+                    stats['packets_processed'] += 1
+                    src_ip, dst_ip, dst_port, protocol, size = decoded
+                    now = time.time()
+                    key = (src_ip, dst_ip, dst_port, protocol)
+
+                    flow = flows.get(key)
+                    if flow is None:
+                        flows[key] = [size, 1, now, now]
+                    else:
+                        flow[0] += size
+                        flow[1] += 1
+                        flow[3] = now
+
+            if time.monotonic() >= next_report:
+                next_report = time.monotonic() + report_interval
+
+                # Mensajes de control (ej. cambio de dispositivos monitoreados)
+                try:
+                    while True:
+                        command, payload = control_queue.get_nowait()
+                        if command == 'monitored':
+                            monitored = set(payload)
+                            _apply_worker_filter(sock, interface, monitored)
+                except queue.Empty:
+                    pass
+
+                # Se envía aunque no haya flujos para mantener las stats al día
+                deltas = [key + tuple(values) for key, values in flows.items()]
+                try:
+                    result_queue.put(('deltas', shard_id, deltas, dict(stats)), timeout=0.1)
+                    flows = {}
+                except queue.Full:
+                    # El motor va atrasado: seguir agregando y reintentar luego
+                    pass
+    finally:
+        sock.close()
+
+        if flows:
+            deltas = [key + tuple(values) for key, values in flows.items()]
+            result_queue.put(('deltas', shard_id, deltas, dict(stats)))
+
+
+class CaptureSupervisor:
+    """
+    Supervisor de procesos de captura
+
+    Expone la misma interfaz básica que PacketCapture (set_monitored_devices,
+    start, stop, is_running, get_stats) pero entrega deltas de flujo
+    agregados en lugar de paquetes individuales.
+    """
+
+    def __init__(self, interfaces: List[str], workers_per_interface: int = 1,
+                 report_interval: float = 1.0, queue_size: int = 1024,
+                 skip_local_traffic: bool = False):
+        """
+        Inicializar supervisor
+
+        Args:
+            interfaces: Interfaces de red a capturar (un proceso por interfaz)
+            workers_per_interface: Procesos por interfaz (>1 usa PACKET_FANOUT, solo Linux)
+            report_interval: Segundos entre envíos de deltas de cada worker
+            queue_size: Capacidad de la cola de resultados
+            skip_local_traffic: Descartar en los workers los paquetes cuyo destino
+                                es de la red local (privado, link-local, multicast...)
+        """
+        if not interfaces:
+            raise ValueError("Se requiere al menos una interfaz")
+
+        if workers_per_interface > 1 and not hasattr(socket, 'AF_PACKET'):
+            print("⚠️  PACKET_FANOUT solo está disponible en Linux: 1 proceso por interfaz")
+            workers_per_interface = 1
+
+        self.interfaces = interfaces
+        self.workers_per_interface = workers_per_interface
+        self.report_interval = report_interval
+        self.skip_local_traffic = skip_local_traffic
+
+        self.context = multiprocessing.get_context('spawn')
+        self.result_queue = self.context.Queue(maxsize=queue_size)
+        self.stop_event = self.context.Event()
+
+        self.workers = []
+        self.control_queues = []
+        self.collector_thread = None
+        self.running = False
+
+        self.delta_callback: Optional[Callable] = None
+        self.monitored_ips: List[str] = []
+
+        # Stats por shard (último reporte de cada proceso)
+        self.shard_stats: Dict[int, dict] = {}
+        self.flow_deltas = 0
+
+    def set_monitored_devices(self, ip_addresses: list):
+        """
+        Configurar IPs a monitorear en todos los procesos de captura
+
+        Args:
+            ip_addresses: Lista de IPs de dispositivos IoT
+        """
+        self.monitored_ips = list(ip_addresses)
+        print(f"📡 Monitoreando {len(self.monitored_ips)} dispositivos "
+              f"en {len(self.interfaces)} interfaces")
+
+        for control_queue in self.control_queues:
+            control_queue.put(('monitored', self.monitored_ips))
+
+    def set_delta_callback(self, callback: Callable[[List[FlowDelta]], None]):
+        """
+        Configurar callback que recibe lotes de deltas de flujo
+
+        Args:
+            callback: Función que recibe una lista de tuplas
+                      (src_ip, dst_ip, dst_port, protocol, bytes, packets, first_seen, last_seen)
+        """
+        self.delta_callback = callback
+
+    def _collector_loop(self):
+        """
+        Recibir deltas de los workers y entregarlos al callback
+        """
+        while self.running or not self.result_queue.empty():
+            try:
+                message = self.result_queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+
+            if message[0] == 'error':
+                _, shard_id, error = message
+                print(f"❌ Error en worker de captura {shard_id}: {error}")
+                continue
+
+            _, shard_id, deltas, stats = message
+            self.shard_stats[shard_id] = stats
+            self.flow_deltas += len(deltas)
+
+            if self.delta_callback:
+                try:
+                    self.delta_callback(deltas)
+                except Exception as e:
+                    print(f"⚠️  Error procesando deltas de flujo: {e}")
+
+    def start(self):
+        """
+        Iniciar procesos de captura y thread colector
+        """
+        if self.running:
+            print("⚠️  Captura ya está en ejecución")
+            return
+
+        self.running = True
+        self.stop_event.clear()
+
+        shard_id = 0
+        for index, interface in enumerate(self.interfaces):
+            # Un grupo de fanout por interfaz (el ID es global al host)
+            fanout_group = None
+            if self.workers_per_interface > 1:
+                fanout_group = (multiprocessing.current_process().pid + index) & 0xFFFF
+
+            for _ in range(self.workers_per_interface):
+                control_queue = self.context.Queue()
+                worker = self.context.Process(
+                    target=capture_worker,
+                    args=(shard_id, interface, fanout_group, self.monitored_ips,
+                          control_queue, self.result_queue, self.stop_event,
+                          self.report_interval, self.skip_local_traffic),
+                    daemon=True
+                )
+                worker.start()
+
+                self.workers.append(worker)
+                self.control_queues.append(control_queue)
+                shard_id += 1
+
+        self.collector_thread = threading.Thread(target=self._collector_loop, daemon=True)
+        self.collector_thread.start()
+
+        print(f"✅ Captura multi-proceso iniciada ({len(self.workers)} workers)")
+
+    def stop(self):
+        """
+        Detener procesos de captura (entregan sus últimos deltas antes de salir)
+        """
+        if not self.running:
+            return
+
+        print("🛑 Deteniendo captura...")
+        self.stop_event.set()
+
+        for worker in self.workers:
+            worker.join(timeout=2)
+            if worker.is_alive():
+                worker.terminate()
+
+        self.running = False
+        if self.collector_thread:
+            self.collector_thread.join(timeout=2)
+
+        self.workers = []
+        self.control_queues = []
+
+        print("✅ Captura detenida")
+
+    def is_running(self) -> bool:
+        """
+        Verificar si la captura está activa
+
+        Returns:
+            True si está capturando
+        """
+        return self.running
+
+    def get_stats(self) -> dict:
+        """
+        Obtener stats combinadas de todos los shards
+
+        Returns:
+            Dict con totales y detalle por shard
+        """
+        shards = dict(self.shard_stats)
+
+        return {
+            'capture_workers': len(self.workers),
+            'packets_captured': sum(s['packets_captured'] for s in shards.values()),
+            'packets_processed': sum(s['packets_processed'] for s in shards.values()),
+            'packets_skipped_local': sum(s['packets_skipped_local'] for s in shards.values()),
+            'flow_deltas': self.flow_deltas,
+            'shards': shards,
+        }
@@ -0,0 +1,362 @@
+"""
+IoT Sentry - Tabla de Flujos Compacta
+
+Almacena los flujos activos en columnas `array` paralelas en lugar de un
+dict por flujo: IPs y protocolos internados como enteros, timestamps como
+epoch float y totales mantenidos incrementalmente
+"""
+
+from array import array
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+
+EPOCH = datetime(1970, 1, 1)
+
+# Clave de flujo: (src_ip, dst_ip, dst_port, protocol)
+FlowKey = Tuple[str, str, Optional[int], str]
+
+
+def to_epoch(timestamp) -> float:
+    """
+    Convertir timestamp (datetime UTC naive o epoch) a epoch float
+
+    Args:
+        timestamp: datetime o float
+
+    Returns:
+        Segundos desde epoch
+    """
+    if isinstance(timestamp, datetime):
+        return (timestamp - EPOCH).total_seconds()
+    return float(timestamp)
+
+
+class FlowTable:
+    """
+    Tabla de flujos con almacenamiento columnar
+
+    Cada flujo ocupa un slot en columnas paralelas. La clave del flujo se
+    empaqueta en un único int a partir de los IDs internados, de modo que
+    el dict de lookup no guarda tuplas ni strings por flujo. Los slots
+    liberados se reutilizan.
+    """
+
+    def __init__(self):
+        """
+        Inicializar tabla vacía
+        """
+        # Internado de IPs y protocolos → enteros pequeños
+        self._ip_ids: Dict[str, int] = {}
+        self._ips: List[str] = []
+        self._protocol_ids: Dict[str, int] = {}
+        self._protocols: List[str] = []
+
+        # Clave empaquetada → slot
+        self._slots: Dict[int, int] = {}
+        self._free: List[int] = []
+
+        # Columnas de clave
+        self.src = array('L')
+        self.dst = array('L')
+        self.port = array('l')     # -1 = sin puerto
+        self.proto = array('B')
+
+        # Columnas de métricas
+        self.bytes = array('Q')
+        self.packets = array('Q')
+        self.first_seen = array('d')
+        self.last_seen = array('d')
+
+        # Totales de los flujos activos (mantenidos en O(1))
+        self.total_bytes = 0
+        self.total_packets = 0
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def _intern_ip(self, ip: str) -> int:
+        """
+        Obtener ID entero de una IP (creándolo si no existe)
+
+        Args:
+            ip: Dirección IP
+
+        Returns:
+            ID de la IP
+        """
+        ip_id = self._ip_ids.get(ip)
+        if ip_id is None:
+            ip_id = len(self._ips)
+            self._ip_ids[ip] = ip_id
+            self._ips.append(ip)
+        return ip_id
+
+    def _intern_protocol(self, protocol: str) -> int:
+        """
+        Obtener ID entero de un protocolo
+
+        Args:
+            protocol: Nombre del protocolo
+
+        Returns:
+            ID del protocolo
+        """
+        proto_id = self._protocol_ids.get(protocol)
+        if proto_id is None:
+            proto_id = len(self._protocols)
+            self._protocol_ids[protocol] = proto_id
+            self._protocols.append(protocol)
+        return proto_id
+
+    @staticmethod
+    def _pack_key(src_id: int, dst_id: int, port: int, proto_id: int) -> int:
+        """
+        Empaquetar clave de flujo en un int
+
+        Args:
+            src_id: ID de IP origen
+            dst_id: ID de IP destino
+            port: Puerto destino (-1 = sin puerto)
+            proto_id: ID de protocolo
+
+        Returns:
+            Clave empaquetada
+        """
+        return (((src_id << 32 | dst_id) << 17 | (port + 1)) << 8) | proto_id
+
+    def _slot_key(self, slot: int) -> int:
+        """
+        Reconstruir clave empaquetada de un slot
+
+        Args:
+            slot: Slot del flujo
+
+        Returns:
+            Clave empaquetada
+        """
+        return self._pack_key(self.src[slot], self.dst[slot], self.port[slot], self.proto[slot])
+
+    def find_slot(self, src_ip: str, dst_ip: str, dst_port: Optional[int],
+                  protocol: str) -> Optional[int]:
+        """
+        Buscar slot de un flujo sin crear IDs nuevos
+
+        Returns:
+            Slot o None si el flujo no existe
+        """
+        src_id = self._ip_ids.get(src_ip)
+        dst_id = self._ip_ids.get(dst_ip)
+        proto_id = self._protocol_ids.get(protocol)
+        if src_id is None or dst_id is None or proto_id is None:
+            return None
+
+        port = -1 if dst_port is None else dst_port
+        return self._slots.get(self._pack_key(src_id, dst_id, port, proto_id))
+
+    def add(self, src_ip: str, dst_ip: str, dst_port: Optional[int], protocol: str,
+            size: int, packets: int, first_seen: float, last_seen: float) -> int:
+        """
+        Sumar tráfico a un flujo (creándolo si no existe) en O(1)
+
+        Args:
+            src_ip: IP origen
+            dst_ip: IP destino
+            dst_port: Puerto destino
+            protocol: Protocolo
+            size: Bytes a sumar
+            packets: Paquetes a sumar
+            first_seen: Epoch del primer paquete
+            last_seen: Epoch del último paquete
+
+        Returns:
+            Slot del flujo
+        """
+        ip_ids = self._ip_ids
+        src_id = ip_ids.get(src_ip)
+        if src_id is None:
+            src_id = self._intern_ip(src_ip)
+        dst_id = ip_ids.get(dst_ip)
+        if dst_id is None:
+            dst_id = self._intern_ip(dst_ip)
+        proto_id = self._protocol_ids.get(protocol)
+        if proto_id is None:
+            proto_id = self._intern_protocol(protocol)
+
+        port = -1 if dst_port is None else dst_port
+        key = (((src_id << 32 | dst_id) << 17 | (port + 1)) << 8) | proto_id
+
+        slot = self._slots.get(key)
+        if slot is not None:
+            self.bytes[slot] += size
+            self.packets[slot] += packets
+            if first_seen < self.first_seen[slot]:
+                self.first_seen[slot] = first_seen
+            if last_seen > self.last_seen[slot]:
+                self.last_seen[slot] = last_seen
+        else:
+            slot = self._allocate(src_id, dst_id, port, proto_id, size, packets, first_seen, last_seen)
+            self._slots[key] = slot
+
+        self.total_bytes += size
+        self.total_packets += packets
+        return slot
+
+    def _allocate(self, src_id: int, dst_id: int, port: int, proto_id: int,
+                  size: int, packets: int, first_seen: float, last_seen: float) -> int:
+        """
+        Reservar un slot (reutilizando uno libre si hay)
+
+        Returns:
+            Slot asignado
+        """
+        if self._free:
+            slot = self._free.pop()
+            self.src[slot] = src_id
+            self.dst[slot] = dst_id
+            self.port[slot] = port
+            self.proto[slot] = proto_id
+            self.bytes[slot] = size
+            self.packets[slot] = packets
+            self.first_seen[slot] = first_seen
+            self.last_seen[slot] = last_seen
+            return slot
+
+        slot = len(self.src)
+        self.src.append(src_id)
+        self.dst.append(dst_id)
+        self.port.append(port)
+        self.proto.append(proto_id)
+        self.bytes.append(size)
+        self.packets.append(packets)
+        self.first_seen.append(first_seen)
+        self.last_seen.append(last_seen)
+        return slot
+
+    def remove(self, slot: int):
+        """
+        Eliminar un flujo y liberar su slot
+
+        Args:
+            slot: Slot del flujo
+        """
+        del self._slots[self._slot_key(slot)]
+
+        self.total_bytes -= self.bytes[slot]
+        self.total_packets -= self.packets[slot]
+        self.bytes[slot] = 0
+        self.packets[slot] = 0
+        self._free.append(slot)
+
+    def get(self, src_ip: str, dst_ip: str, dst_port: Optional[int],
+            protocol: str) -> Optional[dict]:
+        """
+        Obtener un flujo como dict
+
+        Returns:
+            Dict del flujo o None si no existe
+        """
+        slot = self.find_slot(src_ip, dst_ip, dst_port, protocol)
+        return self.record(slot) if slot is not None else None
+
+    def key(self, slot: int) -> FlowKey:
+        """
+        Obtener clave legible de un slot
+
+        Args:
+            slot: Slot del flujo
+
+        Returns:
+            Tupla (src_ip, dst_ip, dst_port, protocol)
+        """
+        port = self.port[slot]
+        return (
+            self._ips[self.src[slot]],
+            self._ips[self.dst[slot]],
+            None if port < 0 else port,
+            self._protocols[self.proto[slot]],
+        )
+
+    def record(self, slot: int) -> dict:
+        """
+        Materializar un flujo como dict
+
+        Args:
+            slot: Slot del flujo
+
+        Returns:
+            Dict con clave y métricas del flujo
+        """
+        src_ip, dst_ip, dst_port, protocol = self.key(slot)
+        return {
+            'src_ip': src_ip,
+            'dst_ip': dst_ip,
+            'dst_port': dst_port,
+            'protocol': protocol,
+            'bytes': self.bytes[slot],
+            'packets': self.packets[slot],
+            'first_seen': self.first_seen[slot],
+            'last_seen': self.last_seen[slot],
+        }
+
+    def slots(self) -> List[int]:
+        """
+        Obtener los slots ocupados (copia, se puede modificar la tabla al iterar)
+
+        Returns:
+            Lista de slots
+        """
+        return list(self._slots.values())
+
+    def records(self) -> Iterator[dict]:
+        """
+        Iterar todos los flujos activos como dicts
+
+        Yields:
+            Dict de cada flujo
+        """
+        for slot in self.slots():
+            yield self.record(slot)
+
+    def merge(self, other: 'FlowTable'):
+        """
+        Sumar todos los flujos de otra tabla (ej. deltas de un shard)
+
+        Args:
+            other: Tabla a sumar
+        """
+        for slot in other.slots():
+            src_ip, dst_ip, dst_port, protocol = other.key(slot)
+            self.add(src_ip, dst_ip, dst_port, protocol, other.bytes[slot],
+                     other.packets[slot], other.first_seen[slot], other.last_seen[slot])
+
+    def needs_compaction(self) -> bool:
+        """
+        Verificar si las tablas de internado o los slots libres crecieron demasiado
+
+        Returns:
+            True si conviene compactar
+        """
+        live = len(self._slots)
+        return len(self._ips) > 2 * live + 1024 or len(self._free) > live + 1024
+
+    def compact(self):
+        """
+        Reconstruir la tabla con solo los flujos activos (libera IPs y slots huérfanos)
+        """
+        compacted = FlowTable()
+        compacted.merge(self)
+
+        self.__dict__.update(compacted.__dict__)
+
+    def stats(self) -> dict:
+        """
+        Obtener totales de la tabla en O(1)
+
+        Returns:
+            Dict con flujos activos, bytes y paquetes
+        """
+        return {
+            'active_flows': len(self._slots),
+            'total_bytes': self.total_bytes,
+            'total_packets': self.total_packets,
+        }
@@ -4,9 +4,55 @@ IoT Sentry - Flow Tracker
 Agrega paquetes en flujos de red y los persiste en base de datos
 """
 
-from datetime import datetime, timedelta
-from typing import Dict, Tuple
+from datetime import datetime
+from typing import Callable, Dict, List
+import heapq
+import itertools
 import threading
+import time
+
+from .flow_table import FlowTable, to_epoch
+
+# Timeouts estilo NetFlow (segundos)
+FLOW_IDLE_TIMEOUT = 300     # Sin paquetes durante este tiempo → flujo terminado
+FLOW_ACTIVE_TIMEOUT = 1800  # Flujos largos se cierran y exportan periódicamente
+
+# Eventos de flujo publicados a los suscriptores
+FLOW_NEW = 'new'        # Primer paquete visto del flujo
+FLOW_UPDATE = 'update'  # Delta del flujo en un intervalo de flush
+FLOW_END = 'end'        # Flujo terminado (idle/active timeout o parada)
+FLOW_EVENTS = (FLOW_NEW, FLOW_UPDATE, FLOW_END)
+
+# Motivos de fin de flujo
+END_IDLE = 'idle'
+END_ACTIVE = 'active'
+END_SHUTDOWN = 'shutdown'
+
+
+class FlowShard:
+    """
+    Shard de ingesta: tabla de deltas protegida por su propio lock
+
+    Los threads de captura solo escriben aquí. El flush intercambia la
+    tabla por una vacía bajo el lock (O(1)) y procesa los deltas fuera.
+    """
+
+    def __init__(self):
+        """Inicializar shard vacío"""
+        self.lock = threading.Lock()
+        self.table = FlowTable()
+
+    def swap(self) -> FlowTable:
+        """
+        Extraer los deltas acumulados dejando una tabla vacía
+
+        Returns:
+            Tabla con los deltas desde el último swap
+        """
+        fresh = FlowTable()
+        with self.lock:
+            table, self.table = self.table, fresh
+        return table
 
 
 class FlowTracker:
@@ -17,31 +63,83 @@ class FlowTracker:
     (src_ip, dst_ip, dst_port, protocol)
     """
 
-    def __init__(self, db_session, flush_interval: int = 30):
+    def __init__(self, session_factory, flush_interval: int = 30, device_index=None,
+                 num_shards: int = 16, idle_timeout: float = FLOW_IDLE_TIMEOUT,
+                 active_timeout: float = FLOW_ACTIVE_TIMEOUT, expiry_interval: float = 1.0,
+                 use_packet_clock: bool = False, geo_enricher=None, geo_wait: float = 1.0):
         """
         Inicializar tracker
 
         Args:
-            db_session: Sesión de base de datos SQLAlchemy
+            session_factory: Factory de sesiones SQLAlchemy (cada flush abre
+                             una sesión propia en el thread de flush)
             flush_interval: Intervalo en segundos para guardar flujos en DB
+            device_index: DeviceIndex para resolver IP → device_id sin queries
+                          (None = se carga desde la DB una vez por flush)
+            num_shards: Shards de ingesta con lock propio (potencia de 2)
+            idle_timeout: Segundos sin paquetes tras los que un flujo termina
+            active_timeout: Duración máxima de un flujo antes de cerrarlo y exportarlo
+            expiry_interval: Segundos entre revisiones de expiración
+            use_packet_clock: Usar el timestamp de los paquetes como reloj
+                              (reproducción de capturas) en lugar del reloj del sistema
+            geo_enricher: GeoEnricher que resuelve cada destino nuevo en segundo
+                          plano (None = flujos sin datos geográficos)
+            geo_wait: Segundos máximos que el flush espera a los destinos pendientes
         """
-        self.db_session = db_session
-        self.flush_interval = flush_interval
+        if num_shards < 1 or num_shards & (num_shards - 1):
+            raise ValueError("num_shards debe ser una potencia de 2")
 
-        # Diccionario de flujos activos
+        self.session_factory = session_factory
+        self.flush_interval = flush_interval
+        self.device_index = device_index
+        self.idle_timeout = idle_timeout
+        self.active_timeout = active_timeout
+        self.expiry_interval = expiry_interval
+        self.use_packet_clock = use_packet_clock
+        self.geo_enricher = geo_enricher
+        self.geo_wait = geo_wait
+
+        # Shards de ingesta: cada flujo cae siempre en el mismo shard
+        self.shards = [FlowShard() for _ in range(num_shards)]
+        self.shard_mask = num_shards - 1
+
+        # Tabla compacta de flujos activos (acumulados, solo la toca el flush)
         # Key: (src_ip, dst_ip, dst_port, protocol)
-        # Value: {'bytes': int, 'packets': int, 'last_seen': datetime}
-        self.active_flows: Dict[Tuple, dict] = {}
-
-        # Lock para thread-safety
+        # Columnas: bytes, packets, first_seen, last_seen (epoch)
+        self.active_flows = FlowTable()
+
+        # Tráfico del intervalo actual: solo los flujos con cambios desde el
+        # último flush (lo que se persiste)
+        self.interval_flows = FlowTable()
+
+        # Min-heap de expiración: (deadline, seq, flow_key), una entrada por flujo.
+        # Las entradas se validan al salir (borrado perezoso): si el flujo
+        # recibió tráfico, se reinserta con su nuevo deadline. El número de
+        # secuencia desempata deadlines iguales sin comparar las keys (un
+        # dst_port None frente a un int lanzaría TypeError)
+        self.expiry_heap: List[tuple] = []
+        self._heap_seq = itertools.count()
+        self.packet_clock = 0.0
+
+        # Suscriptores por evento y flujos nuevos pendientes de publicar
+        self.subscribers: Dict[str, List[Callable[[List[dict]], None]]] = {
+            event: [] for event in FLOW_EVENTS
+        }
+        self.new_flows: List[dict] = []
+        self.flows_finished = 0
+
+        # Protege active_flows/interval_flows/expiry_heap; nunca lo toma la captura
         self.lock = threading.Lock()
 
+        # Serializa flushes (thread periódico y flush final)
+        self.flush_lock = threading.Lock()
+
         # Thread de flush periódico
         self.flush_thread = None
         self.running = False
 
     def track_packet(self, src_ip: str, dst_ip: str, dst_port: int,
-                     protocol: str, size: int, timestamp: datetime):
+                     protocol: str, size: int, timestamp):
         """
         Agregar paquete a flujo existente o crear nuevo flujo
 
@@ -51,83 +149,369 @@ class FlowTracker:
             dst_port: Puerto destino
             protocol: Protocolo (TCP, UDP, etc.)
             size: Tamaño del paquete en bytes
-            timestamp: Timestamp de captura
+            timestamp: Timestamp de captura (datetime UTC o epoch)
+        """
+        epoch = to_epoch(timestamp)
+        shard = self.shards[(hash(src_ip) ^ hash(dst_ip)) & self.shard_mask]
+
+        with shard.lock:
+            shard.table.add(src_ip, dst_ip, dst_port, protocol, size, 1, epoch, epoch)
+
+    def merge_flow(self, src_ip: str, dst_ip: str, dst_port: int, protocol: str,
+                   size: int, packets: int, first_seen, last_seen):
+        """
+        Agregar un delta de flujo ya agregado (ej. desde un proceso de captura)
+
+        Args:
+            src_ip: IP origen
+            dst_ip: IP destino
+            dst_port: Puerto destino
+            protocol: Protocolo (TCP, UDP, etc.)
+            size: Bytes del delta
+            packets: Paquetes del delta
+            first_seen: Primer paquete del delta (datetime UTC o epoch)
+            last_seen: Último paquete del delta (datetime UTC o epoch)
+        """
+        shard = self.shards[(hash(src_ip) ^ hash(dst_ip)) & self.shard_mask]
+
+        with shard.lock:
+            shard.table.add(src_ip, dst_ip, dst_port, protocol, size, packets,
+                            to_epoch(first_seen), to_epoch(last_seen))
+
+    def _merge_pending(self):
+        """
+        Recoger los deltas de todos los shards y sumarlos a active_flows
+        y al intervalo actual
+
+        Debe llamarse con self.lock tomado. Cada shard se bloquea solo
+        durante el intercambio de su tabla.
         """
-        # Crear key del flujo
-        flow_key = (src_ip, dst_ip, dst_port, protocol)
+        table = self.active_flows
+        heap = self.expiry_heap
+
+        for shard in self.shards:
+            if not len(shard.table):
+                continue
+
+            deltas = shard.swap()
+            self.interval_flows.merge(deltas)
+
+            for slot in deltas.slots():
+                key = deltas.key(slot)
+                first_seen = deltas.first_seen[slot]
+                last_seen = deltas.last_seen[slot]
+
+                active_count = len(table)
+                table.add(*key, deltas.bytes[slot], deltas.packets[slot], first_seen, last_seen)
+
+                if len(table) > active_count:
+                    # Flujo nuevo: programar su expiración
+                    deadline = min(last_seen + self.idle_timeout, first_seen + self.active_timeout)
+                    heapq.heappush(heap, (deadline, next(self._heap_seq), key))
+
+                    # y geolocalizar su destino en segundo plano (una vez por destino)
+                    if self.geo_enricher is not None:
+                        self.geo_enricher.request(key[1])
+
+                    if self.subscribers[FLOW_NEW]:
+                        self.new_flows.append(deltas.record(slot))
+
+                if last_seen > self.packet_clock:
+                    self.packet_clock = last_seen
+
+    def subscribe(self, callback: Callable[[List[dict]], None], event: str = FLOW_END):
+        """
+        Suscribirse a eventos de flujo
+
+        Los registros son dicts de FlowTable.record (src_ip, dst_ip, dst_port,
+        protocol, bytes, packets, first_seen, last_seen en epoch) más los
+        campos geográficos (dest_country, dest_city, dest_lat, dest_lon) si
+        el destino ya está resuelto. Según el evento:
+        - 'new': primer paquete del flujo
+        - 'update': bytes/paquetes del intervalo de flush, con 'device_id' y
+                    'total_bytes'/'total_packets' acumulados del flujo
+        - 'end': totales del flujo y 'end_reason' ('idle', 'active' o 'shutdown')
+
+        Los callbacks se ejecutan en el thread de mantenimiento, sin locks.
+
+        Args:
+            callback: Función que recibe una lista de registros
+            event: 'new', 'update' o 'end'
+        """
+        if event not in FLOW_EVENTS:
+            raise ValueError(f"Evento de flujo inválido: {event} (opciones: {', '.join(FLOW_EVENTS)})")
+        self.subscribers[event].append(callback)
+
+    def unsubscribe(self, callback: Callable[[List[dict]], None], event: str = FLOW_END):
+        """
+        Cancelar suscripción a eventos de flujo
+
+        Args:
+            callback: Función registrada con subscribe
+            event: Evento al que se suscribió
+        """
+        if callback in self.subscribers.get(event, []):
+            self.subscribers[event].remove(callback)
+
+    def _attach_geo(self, records: List[dict]):
+        """
+        Añadir a los registros la geolocalización ya resuelta del destino
+
+        Args:
+            records: Registros de flujo
+        """
+        enricher = self.geo_enricher
+        if enricher is None:
+            return
+
+        for record in records:
+            geo_info = enricher.get(record['dst_ip'])
+            if geo_info:
+                record['dest_country'] = geo_info.get('country')
+                record['dest_city'] = geo_info.get('city')
+                record['dest_lat'] = geo_info.get('latitude')
+                record['dest_lon'] = geo_info.get('longitude')
+
+    def _publish(self, event: str, records: List[dict]):
+        """
+        Entregar registros a los suscriptores de un evento (sin locks tomados)
+
+        Args:
+            event: 'new', 'update' o 'end'
+            records: Registros de flujo
+        """
+        if not records:
+            return
+
+        if event == FLOW_END:
+            self.flows_finished += len(records)
+
+        subscribers = list(self.subscribers[event])
+        if not subscribers:
+            return
+
+        if event != FLOW_UPDATE:
+            self._attach_geo(records)
+
+        for callback in subscribers:
+            try:
+                callback(records)
+            except Exception as e:
+                print(f"⚠️  Error en suscriptor de flujos ({event}): {e}")
+
+    def _take_new_flows(self) -> List[dict]:
+        """
+        Extraer los flujos nuevos pendientes de publicar (con self.lock tomado)
+
+        Returns:
+            Registros de flujos nuevos
+        """
+        new_flows, self.new_flows = self.new_flows, []
+        return new_flows
+
+    def _now(self) -> float:
+        """
+        Obtener el instante actual para expiración
+
+        Returns:
+            Epoch (reloj de paquetes en reproducción, reloj del sistema si no)
+        """
+        return self.packet_clock if self.use_packet_clock else time.time()
+
+    def _expire_flows(self):
+        """
+        Cerrar flujos que superaron el idle o active timeout
+
+        Solo se visitan las entradas del heap cuyo deadline ya pasó, así que
+        el coste es proporcional a los flujos que expiran (más las
+        reinserciones de flujos que siguieron recibiendo tráfico).
+        """
+        finished = []
 
         with self.lock:
-            if flow_key in self.active_flows:
-                # Actualizar flujo existente
-                self.active_flows[flow_key]['bytes'] += size
-                self.active_flows[flow_key]['packets'] += 1
-                self.active_flows[flow_key]['last_seen'] = timestamp
-            else:
-                # Crear nuevo flujo
-                self.active_flows[flow_key] = {
-                    'bytes': size,
-                    'packets': 1,
-                    'first_seen': timestamp,
-                    'last_seen': timestamp
-                }
+            self._merge_pending()
+
+            table = self.active_flows
+            heap = self.expiry_heap
+            now = self._now()
+
+            while heap and heap[0][0] <= now:
+                _, _, key = heapq.heappop(heap)
+
+                slot = table.find_slot(*key)
+                if slot is None:
+                    continue
+
+                idle_deadline = table.last_seen[slot] + self.idle_timeout
+                active_deadline = table.first_seen[slot] + self.active_timeout
+                deadline = min(idle_deadline, active_deadline)
+
+                if deadline > now:
+                    # Hubo tráfico desde que se programó: reprogramar
+                    heapq.heappush(heap, (deadline, next(self._heap_seq), key))
+                    continue
+
+                record = table.record(slot)
+                record['end_reason'] = END_IDLE if idle_deadline <= active_deadline else END_ACTIVE
+                finished.append(record)
+                table.remove(slot)
+
+            if table.needs_compaction():
+                table.compact()
+
+            new_flows = self._take_new_flows()
+
+        self._publish(FLOW_NEW, new_flows)
+        self._publish(FLOW_END, finished)
 
     def _flush_flows(self):
         """
-        Guardar flujos activos en base de datos y limpiar antiguos
+        Guardar el tráfico del intervalo en base de datos
+
+        Cada fila de `flows` es el delta de un flujo en un intervalo de flush
+        (bytes/paquetes nuevos, timestamp = primer paquete del intervalo), de
+        modo que la escritura escala con los flujos que cambiaron y SUM()
+        sobre la tabla da totales correctos.
+
+        La captura nunca espera al flush: los deltas se extraen de los shards
+        con un swap y la escritura en DB ocurre sin ningún lock tomado.
         """
-        from agent.database.models import Flow, Device
+        from agent.database.models import Flow
 
-        with self.lock:
-            if not self.active_flows:
+        with self.flush_lock:
+            with self.lock:
+                self._merge_pending()
+
+                interval, self.interval_flows = self.interval_flows, FlowTable()
+                new_flows = self._take_new_flows()
+
+                # Totales acumulados de los flujos que cambiaron (para 'update')
+                totals = {}
+                if self.subscribers[FLOW_UPDATE]:
+                    table = self.active_flows
+                    for slot in interval.slots():
+                        key = interval.key(slot)
+                        active_slot = table.find_slot(*key)
+                        if active_slot is not None:
+                            totals[key] = (table.bytes[active_slot], table.packets[active_slot])
+
+            self._publish(FLOW_NEW, new_flows)
+
+            if not len(interval):
                 return
 
+            # Construir filas y guardar en DB sin locks (la captura sigue en los shards)
+            resolve_device_id = self._get_device_resolver()
             flows_to_save = []
-            now = datetime.utcnow()
+            updates = []
+
+            # Dar margen a los destinos nuevos para llegar a la DB ya geolocalizados
+            enricher = self.geo_enricher
+            if enricher is not None:
+                enricher.wait_idle(self.geo_wait)
+
+            for slot in interval.slots():
+                src_ip, dst_ip, dst_port, protocol = interval.key(slot)
 
-            # Procesar cada flujo
-            for (src_ip, dst_ip, dst_port, protocol), data in list(self.active_flows.items()):
                 # Buscar device_id
-                device = self.db_session.query(Device).filter_by(ip_address=src_ip).first()
-                if not device:
+                device_id = resolve_device_id(src_ip)
+                if device_id is None:
                     # Si el dispositivo no existe, skip
                     continue
 
-                # Crear registro de flujo
-                flow = Flow(
-                    device_id=device.id,
+                geo_info = enricher.get(dst_ip) if enricher is not None else None
+                if geo_info is None:
+                    if enricher is not None:
+                        # Destino descartado (cola llena) o expulsado de la caché:
+                        # volver a pedirlo para los próximos intervalos
+                        # (no-op si está pendiente o ya resuelto sin datos)
+                        enricher.request(dst_ip)
+                    geo_info = {}
+
+                flows_to_save.append(Flow(
+                    device_id=device_id,
                     dest_ip=dst_ip,
                     dest_port=dst_port,
                     protocol=protocol,
-                    bytes_sent=data['bytes'],
-                    packets_sent=data['packets'],
-                    timestamp=data['first_seen']
-                )
+                    dest_country=geo_info.get('country'),
+                    dest_city=geo_info.get('city'),
+                    dest_lat=geo_info.get('latitude'),
+                    dest_lon=geo_info.get('longitude'),
+                    bytes_sent=interval.bytes[slot],
+                    packets_sent=interval.packets[slot],
+                    timestamp=datetime.utcfromtimestamp(interval.first_seen[slot])
+                ))
+
+                if self.subscribers[FLOW_UPDATE]:
+                    record = interval.record(slot)
+                    record['device_id'] = device_id
+                    record['dest_country'] = geo_info.get('country')
+                    record['dest_city'] = geo_info.get('city')
+                    record['dest_lat'] = geo_info.get('latitude')
+                    record['dest_lon'] = geo_info.get('longitude')
+                    record['total_bytes'], record['total_packets'] = totals.get(
+                        (src_ip, dst_ip, dst_port, protocol),
+                        (record['bytes'], record['packets'])
+                    )
+                    updates.append(record)
 
-                flows_to_save.append(flow)
+            if flows_to_save:
+                # Sesión corta: la conexión de escritura se libera antes de publicar
+                with self.session_factory() as session:
+                    try:
+                        session.bulk_save_objects(flows_to_save)
+                        session.commit()
+                        print(f"💾 Guardados {len(flows_to_save)} flujos en DB")
+                    except Exception as e:
+                        print(f"❌ Error guardando flujos: {e}")
+                        session.rollback()
+
+            self._publish(FLOW_UPDATE, updates)
+
+    def _get_device_resolver(self):
+        """
+        Obtener función IP → device_id para el flush
 
-                # Limpiar flujos antiguos (> 5 minutos de inactividad)
-                if now - data['last_seen'] > timedelta(minutes=5):
-                    del self.active_flows[(src_ip, dst_ip, dst_port, protocol)]
+        Returns:
+            Callable que recibe una IP y devuelve el device_id (o None)
+        """
+        if self.device_index is not None:
+            return self.device_index.get_device_id
 
-            # Guardar en DB
-            if flows_to_save:
-                try:
-                    self.db_session.bulk_save_objects(flows_to_save)
-                    self.db_session.commit()
-                    print(f"💾 Guardados {len(flows_to_save)} flujos en DB")
-                except Exception as e:
-                    print(f"❌ Error guardando flujos: {e}")
-                    self.db_session.rollback()
+        # Sin índice: una sola query por flush en lugar de una por flujo
+        from agent.database.models import Device
+
+        with self.session_factory() as session:
+            ip_to_id = {
+                ip: device_id
+                for device_id, ip in session.query(Device.id, Device.ip_address)
+                if ip
+            }
+        return ip_to_id.get
 
     def _flush_loop(self):
         """
-        Loop de flush periódico (ejecutado en thread)
+        Loop de mantenimiento (ejecutado en thread): expiración en cada tick
+        y flush a DB cada flush_interval
         """
-        import time
+        next_flush = time.monotonic() + self.flush_interval
 
         while self.running:
-            time.sleep(self.flush_interval)
-            self._flush_flows()
+            time.sleep(self.expiry_interval)
+
+            # Un error en un tick no debe matar el thread: el siguiente
+            # tick reintenta con los flujos que sigan pendientes
+            try:
+                self._expire_flows()
+            except Exception as e:
+                print(f"⚠️  Error expirando flujos: {e}")
+
+            if time.monotonic() >= next_flush:
+                next_flush = time.monotonic() + self.flush_interval
+                try:
+                    self._flush_flows()
+                except Exception as e:
+                    print(f"⚠️  Error en flush de flujos: {e}")
 
     def start(self):
         """
@@ -139,7 +523,8 @@ class FlowTracker:
         self.running = True
         self.flush_thread = threading.Thread(target=self._flush_loop, daemon=True)
         self.flush_thread.start()
-        print(f"✅ Flow tracker iniciado (flush cada {self.flush_interval}s)")
+        print(f"✅ Flow tracker iniciado (flush cada {self.flush_interval}s, "
+              f"idle {self.idle_timeout}s, active {self.active_timeout}s)")
 
     def stop(self):
         """
@@ -150,11 +535,24 @@ class FlowTracker:
 
         self.running = False
 
+        if self.flush_thread:
+            self.flush_thread.join(timeout=2)
+
         # Flush final
+        self._expire_flows()
         self._flush_flows()
 
-        if self.flush_thread:
-            self.flush_thread.join(timeout=2)
+        # Cerrar los flujos que siguen activos
+        with self.lock:
+            finished = []
+            for record in self.active_flows.records():
+                record['end_reason'] = END_SHUTDOWN
+                finished.append(record)
+
+            self.active_flows = FlowTable()
+            self.expiry_heap = []
+
+        self._publish(FLOW_END, finished)
 
         print("✅ Flow tracker detenido")
 
@@ -166,12 +564,8 @@ class FlowTracker:
             Dict con stats
         """
         with self.lock:
-            total_flows = len(self.active_flows)
-            total_bytes = sum(f['bytes'] for f in self.active_flows.values())
-            total_packets = sum(f['packets'] for f in self.active_flows.values())
-
-            return {
-                'active_flows': total_flows,
-                'total_bytes': total_bytes,
-                'total_packets': total_packets
-            }
+            self._merge_pending()
+            stats = self.active_flows.stats()
+
+        stats['flows_finished'] = self.flows_finished
+        return stats
@@ -4,43 +4,149 @@ IoT Sentry - Captura de Paquetes
 Captura pasiva de tráfico de red para análisis
 """
 
-from scapy.all import sniff, IP, TCP, UDP, conf
+from scapy.all import sniff, IP, IPv6, TCP, UDP, Ether, conf
 from datetime import datetime
-from typing import Callable, Optional, Set
+from typing import Callable, List, Optional, Set
+import select
+import socket
 import threading
+import time
+
+from .packet_pipeline import PacketPipeline
+from .packet_decoder import ETH_P_ALL, decode_ethernet, decode_frame, decode_ip
+from .pcap_reader import read_capture_file
+from .bpf_filter import DEFAULT_FILTER, build_bpf_filters, attach_bpf_filter
+from agent.analyzer.ip_classifier import is_lan_ip
 
 
 class PacketCapture:
-    """Captura de paquetes de red"""
+    """
+    Captura de paquetes de red
+
+    Backends disponibles:
+    - 'scapy': sniff() con disección completa de Scapy (compatibilidad)
+    - 'raw': bytes crudos decodificados con struct (AF_PACKET en Linux,
+             socket libpcap de Scapy con recv_raw() en otros sistemas)
+    - 'pcap': reproducción offline de un archivo .pcap/.pcapng (no requiere root)
+    """
 
-    def __init__(self, interface: Optional[str] = None):
+    BACKENDS = ('scapy', 'raw', 'pcap')
+
+    # Tamaño del buffer de recepción del backend raw (cabe cualquier trama)
+    RAW_BUFFER_SIZE = 65536
+
+    def __init__(self, interface: Optional[str] = None, queue_size: int = 10000,
+                 batch_size: int = 256, batch_timeout: float = 0.05,
+                 overflow_policy: Optional[str] = None, backend: str = 'scapy',
+                 pcap_file: Optional[str] = None, replay_speed: Optional[float] = None,
+                 skip_local_traffic: bool = False):
         """
         Inicializar capturador de paquetes
 
         Args:
             interface: Interfaz de red (None = auto-detectar)
+            queue_size: Capacidad de la cola entre captura y procesamiento
+            batch_size: Paquetes por lote entregado al callback
+            batch_timeout: Segundos máximos de espera para completar un lote
+            overflow_policy: 'drop_oldest', 'drop_newest' o 'block'
+                             (None = 'block' al reproducir archivos, 'drop_oldest' en vivo)
+            backend: 'scapy', 'raw' o 'pcap'
+            pcap_file: Archivo .pcap/.pcapng a reproducir (backend 'pcap')
+            replay_speed: Velocidad de reproducción (None = lo más rápido posible,
+                          1.0 = ritmo original, 2.0 = el doble de rápido)
+            skip_local_traffic: Descartar antes de encolar los paquetes cuyo destino
+                                es de la red local (privado, link-local, multicast...)
         """
+        if backend not in self.BACKENDS:
+            raise ValueError(
+                f"Backend de captura inválido: {backend} (opciones: {', '.join(self.BACKENDS)})"
+            )
+        if backend == 'pcap' and not pcap_file:
+            raise ValueError("El backend 'pcap' requiere pcap_file")
+
         self.interface = interface
+        self.backend = backend
+        self.pcap_file = pcap_file
+        self.replay_speed = replay_speed
+        self.replay_finished = threading.Event()
+        self.skip_local_traffic = skip_local_traffic
+        self.packets_skipped = 0
+
+        if overflow_policy is None:
+            # Un archivo se puede leer más rápido de lo que se procesa: mejor
+            # frenar la lectura que descartar paquetes
+            overflow_policy = 'block' if backend == 'pcap' else 'drop_oldest'
         self.running = False
         self.thread = None
         self.packet_callback = None
 
+        # Cola acotada: el thread de sniff solo encola, un worker procesa
+        self.pipeline = PacketPipeline(
+            self._dispatch_batch,
+            max_size=queue_size,
+            batch_size=batch_size,
+            batch_timeout=batch_timeout,
+            overflow_policy=overflow_policy
+        )
+
         # Desactivar verbose de Scapy
         conf.verb = 0
 
         # Set de IPs a monitorear (dispositivos conocidos)
         self.monitored_ips: Set[str] = set()
 
+        # Filtro BPF en kernel generado a partir de monitored_ips
+        self.bpf_filter = DEFAULT_FILTER
+        self.bpf_candidates: List[str] = [DEFAULT_FILTER]
+        self.capture_socket = None
+        self.filter_lock = threading.Lock()
+
     def set_monitored_devices(self, ip_addresses: list):
         """
         Configurar IPs de dispositivos a monitorear
 
+        Si la captura está activa, el filtro BPF del socket se reemplaza en
+        caliente para que el kernel descarte el tráfico de otros hosts.
+
         Args:
             ip_addresses: Lista de IPs de dispositivos IoT
         """
         self.monitored_ips = set(ip_addresses)
+        self.bpf_candidates = build_bpf_filters(self.monitored_ips)
         print(f"📡 Monitoreando {len(self.monitored_ips)} dispositivos")
 
+        if self.capture_socket is not None:
+            self._apply_bpf_filter(self.capture_socket)
+
+    def _apply_bpf_filter(self, sock):
+        """
+        Aplicar el filtro BPF más selectivo que acepte el kernel
+
+        Prueba los candidatos en orden (hosts exactos, subredes, "ip"). Si
+        ninguno se puede aplicar, el filtrado queda solo en userspace.
+
+        Args:
+            sock: Socket de captura abierto
+        """
+        iface = self.interface or conf.iface
+        last_error = None
+
+        with self.filter_lock:
+            for candidate in self.bpf_candidates:
+                try:
+                    attach_bpf_filter(sock, candidate, iface)
+                except Exception as e:
+                    last_error = e
+                    continue
+
+                if candidate != self.bpf_filter:
+                    print(f"🧹 Filtro BPF actualizado ({len(candidate)} caracteres)")
+                self.bpf_filter = candidate
+                return
+
+            print(f"⚠️  No se pudo aplicar filtro BPF en kernel: {last_error}")
+            print("   El filtrado por dispositivo se hará en userspace")
+
     def set_callback(self, callback: Callable):
         """
         Configurar callback para procesar paquetes capturados
@@ -82,43 +188,231 @@ class PacketCapture:
                 protocol = "UDP"
                 dst_port = packet[UDP].dport
 
-            # Llamar callback si está configurado
-            if self.packet_callback:
-                self.packet_callback(
+            # Encolar tupla compacta; el callback se ejecuta en el worker
+            self._enqueue((src_ip, dst_ip, dst_port, protocol, packet_size), time.time())
+
+        except Exception as e:
+            print(f"⚠️  Error procesando paquete: {e}")
+
+    def _process_frame(self, frame):
+        """
+        Procesar trama Ethernet cruda (camino rápido, sin Scapy)
+
+        Args:
+            frame: Bytes o memoryview de la trama
+        """
+        self._enqueue(decode_ethernet(frame), time.time())
+
+    def _process_record(self, record: tuple):
+        """
+        Procesar registro leído de un archivo de captura
+
+        Args:
+            record: Tupla (timestamp, linktype, data, wire_length)
+        """
+        timestamp, linktype, data, wire_length = record
+
+        # Se conserva el timestamp original de la captura
+        self._enqueue(decode_frame(linktype, data, wire_length), timestamp)
+
+    def _enqueue(self, decoded: Optional[tuple], timestamp: float):
+        """
+        Filtrar un paquete decodificado y encolarlo
+
+        Args:
+            decoded: Tupla (src_ip, dst_ip, dst_port, protocol, size) o None
+            timestamp: Epoch de captura
+        """
+        if decoded is None or decoded[0] not in self.monitored_ips:
+            return
+
+        # Tráfico interno de la LAN: no llega ni a la cola
+        if self.skip_local_traffic and is_lan_ip(decoded[1]):
+            self.packets_skipped += 1
+            return
+
+        self.pipeline.put(decoded + (timestamp,))
+
+    def _dispatch_batch(self, batch: List[tuple]):
+        """
+        Entregar un lote de paquetes al callback (ejecutado en el worker)
+
+        Args:
+            batch: Lista de tuplas (src_ip, dst_ip, dst_port, protocol, size, epoch)
+        """
+        callback = self.packet_callback
+        if not callback:
+            return
+
+        for src_ip, dst_ip, dst_port, protocol, size, epoch in batch:
+            try:
+                callback(
                     src_ip=src_ip,
                     dst_ip=dst_ip,
                     dst_port=dst_port,
                     protocol=protocol,
-                    size=packet_size,
-                    timestamp=datetime.utcnow()
+                    size=size,
+                    timestamp=datetime.utcfromtimestamp(epoch)
                 )
-
-        except Exception as e:
-            print(f"⚠️  Error procesando paquete: {e}")
+            except Exception as e:
+                print(f"⚠️  Error procesando paquete: {e}")
 
     def _capture_loop(self):
         """
         Loop de captura (ejecutado en thread separado)
         """
         try:
-            print(f"🔍 Iniciando captura en interfaz: {self.interface or 'auto'}")
+            print(f"🔍 Iniciando captura en interfaz: {self.interface or 'auto'} "
+                  f"(backend: {self.backend})")
 
-            # Filtro BPF para optimizar captura
-            # Solo capturamos IP outbound (desde nuestra red)
-            bpf_filter = "ip"
+            if self.backend == 'raw':
+                self._capture_loop_raw()
+            elif self.backend == 'pcap':
+                self._capture_loop_pcap_file()
+            else:
+                self._capture_loop_scapy()
 
+        except Exception as e:
+            print(f"❌ Error en captura de paquetes: {e}")
+            self.running = False
+
+    def _capture_loop_scapy(self):
+        """
+        Captura con sniff() de Scapy (disección completa por paquete)
+        """
+        # Abrimos el socket nosotros para poder cambiar el filtro BPF en caliente
+        sock = conf.L2listen(iface=self.interface)
+        self._open_capture_socket(sock)
+        try:
             # Iniciar captura
             sniff(
-                iface=self.interface,
-                filter=bpf_filter,
+                opened_socket=sock,
                 prn=self._process_packet,
                 store=False,  # No almacenar paquetes en memoria
                 stop_filter=lambda x: not self.running
             )
+        finally:
+            self._close_capture_socket(sock)
 
-        except Exception as e:
-            print(f"❌ Error en captura de paquetes: {e}")
-            self.running = False
+    def _capture_loop_raw(self):
+        """
+        Captura de bytes crudos decodificados con struct
+        """
+        if hasattr(socket, 'AF_PACKET'):
+            self._capture_loop_af_packet()
+        else:
+            self._capture_loop_pcap_raw()
+
+    def _capture_loop_af_packet(self):
+        """
+        Captura con socket AF_PACKET (Linux): recv_into sobre un buffer reutilizado
+        """
+        sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, socket.htons(ETH_P_ALL))
+        try:
+            sock.bind((self.interface or str(conf.iface), 0))
+            sock.settimeout(0.5)
+            self._open_capture_socket(sock)
+
+            buffer = bytearray(self.RAW_BUFFER_SIZE)
+            view = memoryview(buffer)
+            process_frame = self._process_frame
+
+            while self.running:
+                try:
+                    length = sock.recv_into(buffer)
+                except socket.timeout:
+                    continue
+
+                process_frame(view[:length])
+        finally:
+            self._close_capture_socket(sock)
+
+    def _capture_loop_pcap_raw(self):
+        """
+        Captura con el socket libpcap de Scapy leyendo bytes sin diseccionar
+        """
+        sock = conf.L2listen(iface=self.interface)
+        self._open_capture_socket(sock)
+        try:
+            process_frame = self._process_frame
+
+            while self.running:
+                ready, _, _ = select.select([sock], [], [], 0.5)
+                if not ready:
+                    continue
+
+                cls, data, _ = sock.recv_raw()
+                if not data:
+                    continue
+
+                if cls is Ether:
+                    process_frame(data)
+                elif cls is IP or cls is IPv6:
+                    # Enlaces de IP crudo (sin cabecera Ethernet)
+                    self._enqueue(decode_ip(data, 0, len(data)), time.time())
+        finally:
+            self._close_capture_socket(sock)
+
+    def _capture_loop_pcap_file(self):
+        """
+        Reproducir un archivo .pcap/.pcapng (a máxima velocidad o al ritmo original)
+        """
+        speed = self.replay_speed
+        first_timestamp = None
+        replay_start = None
+        count = 0
+
+        for record in read_capture_file(self.pcap_file):
+            if not self.running:
+                break
+
+            if speed:
+                # Respetar los tiempos entre paquetes (escalados por speed)
+                if first_timestamp is None:
+                    first_timestamp = record[0]
+                    replay_start = time.monotonic()
+
+                delay = (record[0] - first_timestamp) / speed - (time.monotonic() - replay_start)
+                if delay > 0:
+                    time.sleep(delay)
+
+            self._process_record(record)
+            count += 1
+
+        print(f"📼 Reproducción terminada: {count} paquetes leídos de {self.pcap_file}")
+        self.replay_finished.set()
+
+    def wait_until_finished(self, timeout: Optional[float] = None) -> bool:
+        """
+        Esperar a que termine la reproducción del archivo (backend 'pcap')
+
+        Args:
+            timeout: Segundos máximos de espera (None = sin límite)
+
+        Returns:
+            True si la reproducción terminó
+        """
+        return self.replay_finished.wait(timeout)
+
+    def _open_capture_socket(self, sock):
+        """
+        Registrar socket de captura y aplicarle el filtro BPF actual
+
+        Args:
+            sock: Socket de captura recién abierto
+        """
+        self._apply_bpf_filter(sock)
+        self.capture_socket = sock
+
+    def _close_capture_socket(self, sock):
+        """
+        Cerrar socket de captura
+
+        Args:
+            sock: Socket de captura
+        """
+        self.capture_socket = None
+        sock.close()
 
     def start(self):
         """
@@ -129,6 +423,10 @@ class PacketCapture:
             return
 
         self.running = True
+        self.replay_finished.clear()
+
+        # Iniciar worker del pipeline antes de empezar a encolar
+        self.pipeline.start()
 
         # Iniciar thread de captura
         self.thread = threading.Thread(target=self._capture_loop, daemon=True)
@@ -149,6 +447,9 @@ class PacketCapture:
         if self.thread:
             self.thread.join(timeout=2)
 
+        # Procesar paquetes pendientes y detener worker
+        self.pipeline.stop()
+
         print("✅ Captura detenida")
 
     def is_running(self) -> bool:
@@ -160,6 +461,18 @@ class PacketCapture:
         """
         return self.running
 
+    def get_stats(self) -> dict:
+        """
+        Obtener contadores de captura
+
+        Returns:
+            Dict con paquetes encolados, descartados, procesados y
+            omitidos por ser tráfico local
+        """
+        stats = self.pipeline.get_stats()
+        stats['packets_skipped_local'] = self.packets_skipped
+        return stats
+
 
 def main():
     """
@@ -0,0 +1,193 @@
+"""
+IoT Sentry - Decodificador Rápido de Paquetes
+
+Parseo de cabeceras Ethernet / IPv4 / IPv6 / TCP / UDP directamente desde
+el buffer crudo con struct, sin construir objetos Scapy
+"""
+
+import socket
+import struct
+from typing import Optional, Tuple
+
+# EtherTypes
+ETH_P_ALL = 0x0003
+ETH_P_IP = 0x0800
+ETH_P_IPV6 = 0x86DD
+ETH_P_8021Q = 0x8100
+ETH_P_8021AD = 0x88A8
+
+ETH_HEADER_LEN = 14
+VLAN_TAG_LEN = 4
+SLL_HEADER_LEN = 16
+
+# Link types de libpcap soportados
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_IPV4 = 228
+LINKTYPE_IPV6 = 229
+
+# Protocolos de transporte
+IPPROTO_TCP = 6
+IPPROTO_UDP = 17
+
+# Cabeceras de extensión IPv6 que se pueden saltar para llegar a TCP/UDP
+IPV6_EXTENSION_HEADERS = {0, 43, 60}  # Hop-by-hop, Routing, Destination options
+IPV6_FRAGMENT_HEADER = 44
+
+PROTOCOL_NAMES = {
+    IPPROTO_TCP: 'TCP',
+    IPPROTO_UDP: 'UDP',
+}
+
+_unpack_u16 = struct.Struct('!H').unpack_from
+_inet_ntoa = socket.inet_ntoa
+_inet_ntop = socket.inet_ntop
+_AF_INET6 = socket.AF_INET6
+
+# (src_ip, dst_ip, dst_port, protocol, size)
+DecodedPacket = Tuple[str, str, Optional[int], str, int]
+
+
+def decode_ip(buf, offset: int, size: int) -> Optional[DecodedPacket]:
+    """
+    Decodificar cabecera IP (v4 o v6) y el puerto destino TCP/UDP
+
+    Args:
+        buf: Buffer (bytes, bytearray o memoryview)
+        offset: Posición donde comienza la cabecera IP
+        size: Tamaño total a reportar para el paquete
+
+    Returns:
+        Tupla (src_ip, dst_ip, dst_port, protocol, size) o None si no es IP
+    """
+    buf_len = len(buf)
+    if buf_len < offset + 20:
+        return None
+
+    version = buf[offset] >> 4
+
+    if version == 4:
+        ihl = (buf[offset] & 0x0F) * 4
+        proto = buf[offset + 9]
+        src_ip = _inet_ntoa(buf[offset + 12:offset + 16])
+        dst_ip = _inet_ntoa(buf[offset + 16:offset + 20])
+
+        # Fragmentos no iniciales no llevan cabecera de transporte
+        frag_offset = _unpack_u16(buf, offset + 6)[0] & 0x1FFF
+        l4_offset = offset + ihl if frag_offset == 0 else -1
+
+    elif version == 6:
+        if buf_len < offset + 40:
+            return None
+
+        proto = buf[offset + 6]
+        src_ip = _inet_ntop(_AF_INET6, buf[offset + 8:offset + 24])
+        dst_ip = _inet_ntop(_AF_INET6, buf[offset + 24:offset + 40])
+        l4_offset = offset + 40
+
+        # Saltar cabeceras de extensión
+        while proto in IPV6_EXTENSION_HEADERS and buf_len >= l4_offset + 8:
+            proto = buf[l4_offset]
+            l4_offset += (buf[l4_offset + 1] + 1) * 8
+
+        if proto == IPV6_FRAGMENT_HEADER and buf_len >= l4_offset + 8:
+            frag_offset = _unpack_u16(buf, l4_offset + 2)[0] >> 3
+            proto = buf[l4_offset]
+            l4_offset = l4_offset + 8 if frag_offset == 0 else -1
+
+    else:
+        return None
+
+    protocol = PROTOCOL_NAMES.get(proto, 'OTHER')
+    dst_port = None
+
+    if protocol != 'OTHER' and 0 <= l4_offset and buf_len >= l4_offset + 4:
+        dst_port = _unpack_u16(buf, l4_offset + 2)[0]
+
+    return (src_ip, dst_ip, dst_port, protocol, size)
+
+
+def decode_ethernet(frame, size: Optional[int] = None) -> Optional[DecodedPacket]:
+    """
+    Decodificar trama Ethernet (con soporte para tags VLAN 802.1Q/802.1ad)
+
+    Args:
+        frame: Trama cruda (bytes, bytearray o memoryview)
+        size: Tamaño a reportar (None = longitud de la trama)
+
+    Returns:
+        Tupla (src_ip, dst_ip, dst_port, protocol, size) o None si no es IP
+    """
+    frame_len = len(frame)
+    if frame_len < ETH_HEADER_LEN:
+        return None
+
+    if size is None:
+        size = frame_len
+
+    offset = 12
+    ether_type = _unpack_u16(frame, offset)[0]
+
+    # Saltar tags VLAN (pueden estar apilados: QinQ)
+    while ether_type in (ETH_P_8021Q, ETH_P_8021AD) and frame_len >= offset + 2 + VLAN_TAG_LEN:
+        offset += VLAN_TAG_LEN
+        ether_type = _unpack_u16(frame, offset)[0]
+
+    if ether_type != ETH_P_IP and ether_type != ETH_P_IPV6:
+        return None
+
+    return decode_ip(frame, offset + 2, size)
+
+
+def decode_frame(linktype: int, frame, size: Optional[int] = None) -> Optional[DecodedPacket]:
+    """
+    Decodificar una trama según su link type de libpcap
+
+    Args:
+        linktype: Link type (LINKTYPE_*)
+        frame: Trama cruda
+        size: Tamaño a reportar (None = longitud de la trama)
+
+    Returns:
+        Tupla (src_ip, dst_ip, dst_port, protocol, size) o None si no es IP
+    """
+    if size is None:
+        size = len(frame)
+
+    if linktype == LINKTYPE_ETHERNET:
+        return decode_ethernet(frame, size)
+
+    if linktype in (LINKTYPE_RAW, LINKTYPE_IPV4, LINKTYPE_IPV6):
+        return decode_ip(frame, 0, size)
+
+    if linktype == LINKTYPE_LINUX_SLL and len(frame) >= SLL_HEADER_LEN:
+        ether_type = _unpack_u16(frame, 14)[0]
+        if ether_type == ETH_P_IP or ether_type == ETH_P_IPV6:
+            return decode_ip(frame, SLL_HEADER_LEN, size)
+
+    return None
+
+
+def main():
+    """
+    Función principal para testing standalone
+    """
+    print("🛡️  IoT Sentry - Packet Decoder Test")
+    print("=" * 50)
+    print()
+
+    # Trama Ethernet + IPv4 + TCP sintética (192.168.1.100 → 8.8.8.8:443)
+    frame = (
+        b'\xff' * 6 + b'\x02' * 6 + b'\x08\x00' +
+        b'\x45\x00\x00\x28\x00\x00\x40\x00\x40\x06\x00\x00' +
+        socket.inet_aton('192.168.1.100') + socket.inet_aton('8.8.8.8') +
+        b'\xd4\x31\x01\xbb' + b'\x00' * 16
+    )
+
+    print(f"📦 {decode_ethernet(frame)}")
+    print("✨ Test completado!")
+
+
+if __name__ == "__main__":
+    main()
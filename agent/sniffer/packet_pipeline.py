@@ -0,0 +1,177 @@
+"""
+IoT Sentry - Pipeline de Ingesta de Paquetes
+
+Cola acotada entre el thread de captura y el procesamiento por lotes
+"""
+
+from collections import deque
+from typing import Callable, List
+import threading
+
+
+class PacketPipeline:
+    """
+    Cola acotada con consumo por lotes
+
+    El thread de captura solo encola tuplas compactas; un worker las
+    drena en lotes de `batch_size` paquetes o cada `batch_timeout`
+    segundos (lo que ocurra primero) y se las pasa al consumidor.
+
+    Políticas de desbordamiento:
+    - 'drop_oldest': descarta el paquete más antiguo de la cola
+    - 'drop_newest': descarta el paquete entrante
+    - 'block': bloquea al productor hasta que haya espacio
+    """
+
+    OVERFLOW_POLICIES = ('drop_oldest', 'drop_newest', 'block')
+
+    def __init__(self, consumer: Callable[[List[tuple]], None], max_size: int = 10000,
+                 batch_size: int = 256, batch_timeout: float = 0.05,
+                 overflow_policy: str = 'drop_oldest'):
+        """
+        Inicializar pipeline
+
+        Args:
+            consumer: Función que recibe una lista de tuplas (un lote)
+            max_size: Capacidad máxima de la cola
+            batch_size: Paquetes por lote
+            batch_timeout: Tiempo máximo (segundos) antes de drenar un lote incompleto
+            overflow_policy: 'drop_oldest', 'drop_newest' o 'block'
+        """
+        if overflow_policy not in self.OVERFLOW_POLICIES:
+            raise ValueError(
+                f"Política de desbordamiento inválida: {overflow_policy} "
+                f"(opciones: {', '.join(self.OVERFLOW_POLICIES)})"
+            )
+
+        self.consumer = consumer
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.batch_timeout = batch_timeout
+        self.overflow_policy = overflow_policy
+
+        # deque.append/popleft son thread-safe; con maxlen el propio deque
+        # descarta el elemento más antiguo al desbordar
+        maxlen = max_size if overflow_policy == 'drop_oldest' else None
+        self.queue = deque(maxlen=maxlen)
+
+        # Señales productor → worker (lote listo) y worker → productor (hay espacio)
+        self._batch_ready = threading.Event()
+        self._space_available = threading.Event()
+
+        # Contadores (cada uno lo escribe un único thread)
+        self.queued = 0
+        self.dropped = 0
+        self.processed = 0
+        self.batches = 0
+
+        self.running = False
+        self.thread = None
+
+    def put(self, item: tuple) -> bool:
+        """
+        Encolar un paquete (llamado desde el thread de captura)
+
+        Args:
+            item: Tupla compacta del paquete
+
+        Returns:
+            True si se encoló, False si se descartó
+        """
+        queue = self.queue
+
+        if len(queue) >= self.max_size:
+            if self.overflow_policy == 'drop_newest':
+                self.dropped += 1
+                return False
+
+            if self.overflow_policy == 'drop_oldest':
+                # append() expulsará el más antiguo
+                self.dropped += 1
+
+            else:
+                # 'block': esperar a que el worker libere espacio
+                while self.running and len(queue) >= self.max_size:
+                    self._space_available.clear()
+                    self._batch_ready.set()
+                    self._space_available.wait(self.batch_timeout)
+
+        queue.append(item)
+        self.queued += 1
+
+        if len(queue) >= self.batch_size:
+            self._batch_ready.set()
+
+        return True
+
+    def _drain(self):
+        """
+        Drenar la cola en lotes y entregarlos al consumidor
+        """
+        queue = self.queue
+        popleft = queue.popleft
+
+        while queue:
+            count = min(len(queue), self.batch_size)
+            batch = [popleft() for _ in range(count)]
+
+            self._space_available.set()
+
+            try:
+                self.consumer(batch)
+            except Exception as e:
+                print(f"⚠️  Error procesando lote de paquetes: {e}")
+
+            self.processed += count
+            self.batches += 1
+
+    def _worker_loop(self):
+        """
+        Loop del worker (ejecutado en thread separado)
+        """
+        while self.running:
+            self._batch_ready.wait(self.batch_timeout)
+            self._batch_ready.clear()
+            self._drain()
+
+        # Vaciar lo que quede al detener
+        self._drain()
+
+    def start(self):
+        """
+        Iniciar worker de consumo
+        """
+        if self.running:
+            return
+
+        self.running = True
+        self.thread = threading.Thread(target=self._worker_loop, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """
+        Detener worker (procesa los paquetes pendientes antes de salir)
+        """
+        if not self.running:
+            return
+
+        self.running = False
+        self._batch_ready.set()
+        self._space_available.set()
+
+        if self.thread:
+            self.thread.join(timeout=2)
+
+    def get_stats(self) -> dict:
+        """
+        Obtener contadores del pipeline
+
+        Returns:
+            Dict con stats
+        """
+        return {
+            'packets_queued': self.queued,
+            'packets_dropped': self.dropped,
+            'packets_processed': self.processed,
+            'queue_depth': len(self.queue),
+        }
@@ -0,0 +1,171 @@
+"""
+IoT Sentry - Lector de Capturas pcap/pcapng
+
+Lectura secuencial de archivos .pcap y .pcapng con struct, sin Scapy
+"""
+
+import struct
+from typing import BinaryIO, Iterator, Tuple
+
+# Magic numbers pcap clásico
+PCAP_MAGIC_USEC = 0xA1B2C3D4
+PCAP_MAGIC_NSEC = 0xA1B23C4D
+
+# Tipos de bloque pcapng
+PCAPNG_SECTION_HEADER = 0x0A0D0D0A
+PCAPNG_INTERFACE_DESCRIPTION = 0x00000001
+PCAPNG_SIMPLE_PACKET = 0x00000003
+PCAPNG_ENHANCED_PACKET = 0x00000006
+PCAPNG_BYTE_ORDER_MAGIC = 0x1A2B3C4D
+PCAPNG_OPTION_IF_TSRESOL = 9
+
+# (timestamp_epoch, linktype, data, wire_length)
+PcapRecord = Tuple[float, int, bytes, int]
+
+
+def _read_pcap(f: BinaryIO, header: bytes) -> Iterator[PcapRecord]:
+    """
+    Leer registros de un archivo pcap clásico
+
+    Args:
+        f: Archivo abierto (posicionado tras los 4 bytes de magic)
+        header: Primeros 4 bytes del archivo
+
+    Yields:
+        Tuplas (timestamp, linktype, data, wire_length)
+    """
+    for endian in ('<', '>'):
+        magic = struct.unpack(endian + 'I', header)[0]
+        if magic in (PCAP_MAGIC_USEC, PCAP_MAGIC_NSEC):
+            break
+    else:
+        raise ValueError("Archivo pcap inválido (magic desconocido)")
+
+    divisor = 1e9 if magic == PCAP_MAGIC_NSEC else 1e6
+
+    rest = f.read(20)
+    if len(rest) < 20:
+        return
+    linktype = struct.unpack(endian + 'HHiIII', rest)[5] & 0x0FFFFFFF
+
+    record_header = struct.Struct(endian + 'IIII')
+    read = f.read
+
+    while True:
+        raw = read(16)
+        if len(raw) < 16:
+            return
+
+        ts_sec, ts_frac, incl_len, orig_len = record_header.unpack(raw)
+        data = read(incl_len)
+        if len(data) < incl_len:
+            return
+
+        yield (ts_sec + ts_frac / divisor, linktype, data, orig_len)
+
+
+def _read_pcapng(f: BinaryIO) -> Iterator[PcapRecord]:
+    """
+    Leer paquetes de un archivo pcapng
+
+    Args:
+        f: Archivo abierto (posicionado tras el tipo del primer bloque)
+
+    Yields:
+        Tuplas (timestamp, linktype, data, wire_length)
+    """
+    endian = '<'
+    block_type = PCAPNG_SECTION_HEADER
+    # Por interfaz: (linktype, divisor de timestamp)
+    interfaces = []
+    read = f.read
+
+    while True:
+        raw_len = read(4)
+        if len(raw_len) < 4:
+            return
+
+        if block_type == PCAPNG_SECTION_HEADER:
+            # El orden de bytes se define en cada sección
+            bom = read(4)
+            endian = '<' if struct.unpack('<I', bom)[0] == PCAPNG_BYTE_ORDER_MAGIC else '>'
+            block_len = struct.unpack(endian + 'I', raw_len)[0]
+            read(block_len - 12)
+            interfaces = []
+
+        else:
+            block_len = struct.unpack(endian + 'I', raw_len)[0]
+            body = read(block_len - 8)
+            if len(body) < block_len - 8:
+                return
+
+            if block_type == PCAPNG_INTERFACE_DESCRIPTION:
+                linktype = struct.unpack_from(endian + 'H', body, 0)[0]
+                interfaces.append((linktype, _parse_tsresol(body, endian)))
+
+            elif block_type == PCAPNG_ENHANCED_PACKET:
+                if_id, ts_high, ts_low, cap_len, orig_len = struct.unpack_from(endian + 'IIIII', body, 0)
+                if if_id < len(interfaces):
+                    linktype, divisor = interfaces[if_id]
+                    timestamp = ((ts_high << 32) | ts_low) / divisor
+                    yield (timestamp, linktype, body[20:20 + cap_len], orig_len)
+
+            elif block_type == PCAPNG_SIMPLE_PACKET and interfaces:
+                orig_len = struct.unpack_from(endian + 'I', body, 0)[0]
+                cap_len = min(orig_len, len(body) - 8)
+                yield (0.0, interfaces[0][0], body[4:4 + cap_len], orig_len)
+
+        raw_type = read(4)
+        if len(raw_type) < 4:
+            return
+        block_type = struct.unpack(endian + 'I', raw_type)[0]
+
+
+def _parse_tsresol(body: bytes, endian: str) -> float:
+    """
+    Obtener divisor de timestamp de un Interface Description Block
+
+    Args:
+        body: Cuerpo del bloque (sin tipo ni longitud inicial)
+        endian: '<' o '>'
+
+    Returns:
+        Divisor para convertir el timestamp a segundos (default microsegundos)
+    """
+    offset = 8
+    # El bloque termina con la longitud repetida (4 bytes)
+    end = len(body) - 4
+
+    while offset + 4 <= end:
+        code, length = struct.unpack_from(endian + 'HH', body, offset)
+        if code == 0:
+            break
+        if code == PCAPNG_OPTION_IF_TSRESOL and length >= 1:
+            value = body[offset + 4]
+            if value & 0x80:
+                return float(2 ** (value & 0x7F))
+            return float(10 ** value)
+        offset += 4 + ((length + 3) & ~3)
+
+    return 1e6
+
+
+def read_capture_file(path: str) -> Iterator[PcapRecord]:
+    """
+    Iterar los paquetes de un archivo .pcap o .pcapng
+
+    Args:
+        path: Ruta al archivo
+
+    Yields:
+        Tuplas (timestamp, linktype, data, wire_length)
+    """
+    with open(path, 'rb') as f:
+        header = f.read(4)
+        if len(header) < 4:
+            return
+
+        if struct.unpack('<I', header)[0] == PCAPNG_SECTION_HEADER:
+            yield from _read_pcapng(f)
+        else:
+            yield from _read_pcap(f, header)
@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""
+IoT Sentry - Benchmark de Throughput
+
+Reproduce un archivo .pcap/.pcapng a través del motor completo (sin root ni
+red) y reporta paquetes/segundo, latencia por etapa y pico de memoria (RSS).
+
+Uso:
+    python benchmark.py captura.pcap
+    python benchmark.py captura.pcapng --speed 1.0     # ritmo original
+    python benchmark.py captura.pcap --flush-interval 5 --geoip GeoLite2-City.mmdb
+"""
+
+import argparse
+import ipaddress
+import os
+import sys
+import tempfile
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+# Ajustar path para imports
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+class StageTimer:
+    """
+    Acumulador de latencias por etapa del pipeline
+    """
+
+    def __init__(self):
+        """Inicializar acumulador"""
+        # stage -> [llamadas, tiempo total (s), tiempo máximo (s)]
+        self.stages: Dict[str, list] = {}
+        self.lock = threading.Lock()
+
+    def wrap(self, stage: str, func: Callable) -> Callable:
+        """
+        Envolver una función para medir su latencia
+
+        Args:
+            stage: Nombre de la etapa
+            func: Función a medir
+
+        Returns:
+            Función instrumentada con la misma firma
+        """
+        stats = self.stages.setdefault(stage, [0, 0.0, 0.0])
+        perf_counter = time.perf_counter
+
+        def timed(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = perf_counter() - start
+                with self.lock:
+                    stats[0] += 1
+                    stats[1] += elapsed
+                    if elapsed > stats[2]:
+                        stats[2] = elapsed
+
+        return timed
+
+    def report(self) -> Dict[str, dict]:
+        """
+        Obtener resumen por etapa
+
+        Returns:
+            Dict stage → {'calls', 'total_s', 'avg_us', 'max_us'}
+        """
+        return {
+            stage: {
+                'calls': calls,
+                'total_s': total,
+                'avg_us': (total / calls * 1e6) if calls else 0.0,
+                'max_us': peak * 1e6,
+            }
+            for stage, (calls, total, peak) in self.stages.items()
+        }
+
+
+def get_peak_rss_mb() -> Optional[float]:
+    """
+    Obtener pico de memoria residente del proceso
+
+    Returns:
+        RSS máximo en MB o None si no está disponible
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reporta KB, macOS bytes
+    if sys.platform == 'darwin':
+        return peak / (1024 * 1024)
+    return peak / 1024
+
+
+def seed_devices_from_capture(pcap_file: str) -> int:
+    """
+    Registrar como dispositivos las IPs privadas que originan tráfico en la captura
+
+    Args:
+        pcap_file: Archivo .pcap/.pcapng
+
+    Returns:
+        Número de dispositivos registrados
+    """
+    from agent.database import get_db, Device
+    from agent.sniffer.pcap_reader import read_capture_file
+    from agent.sniffer.packet_decoder import decode_frame
+
+    sources = set()
+    for _, linktype, data, wire_length in read_capture_file(pcap_file):
+        decoded = decode_frame(linktype, data, wire_length)
+        if decoded:
+            sources.add(decoded[0])
+
+    count = 0
+    with get_db() as db:
+        for ip in sorted(sources):
+            address = ipaddress.ip_address(ip)
+            if address.version != 4 or not address.is_private:
+                continue
+
+            # MAC sintética administrada localmente derivada de la IP
+            mac = '02:00:' + ':'.join(f'{b:02x}' for b in address.packed)
+            if not db.query(Device).filter_by(mac_address=mac).first():
+                db.add(Device(mac_address=mac, ip_address=ip, hostname=f'bench-{ip}',
+                              vendor='Benchmark', device_type='camera'))
+                count += 1
+
+    return count
+
+
+def run_benchmark(pcap_file: str, replay_speed: Optional[float] = None,
+                  flush_interval: int = 30, geoip_path: Optional[str] = None) -> dict:
+    """
+    Ejecutar el motor completo sobre un archivo de captura
+
+    Args:
+        pcap_file: Archivo .pcap/.pcapng
+        replay_speed: None = máxima velocidad, 1.0 = ritmo original
+        flush_interval: Intervalo de flush de flujos (segundos)
+        geoip_path: Ruta a GeoLite2-City.mmdb (None = ubicación por defecto)
+
+    Returns:
+        Dict con resultados del benchmark
+    """
+    from core import IoTSentryEngine
+    from agent.analyzer import GeoLocator
+
+    timer = StageTimer()
+
+    class BenchmarkEngine(IoTSentryEngine):
+        """Motor instrumentado: mide cada etapa antes de iniciar la captura"""
+
+        def _start_capture(self):
+            capture = self.packet_capture
+            capture._process_record = timer.wrap('decode', capture._process_record)
+            capture.packet_callback = timer.wrap('packet_callback', capture.packet_callback)
+
+            self.flow_tracker.flush_interval = flush_interval
+            self.flow_tracker.track_packet = timer.wrap('flow_tracking', self.flow_tracker.track_packet)
+            self.flow_tracker._flush_flows = timer.wrap('db_flush', self.flow_tracker._flush_flows)
+            self.geo_locator.geolocate = timer.wrap('geolocation', self.geo_locator.geolocate)
+            self.behavior_profiler.process_flow_events = timer.wrap(
+                'profiling', self.behavior_profiler.process_flow_events
+            )
+
+            super()._start_capture()
+
+    devices = seed_devices_from_capture(pcap_file)
+
+    engine = BenchmarkEngine(capture_backend='pcap', pcap_file=pcap_file, replay_speed=replay_speed)
+    if geoip_path:
+        engine.geo_locator = GeoLocator(geoip_path)
+        engine.geo_enricher.geo_locator = engine.geo_locator
+
+    start = time.perf_counter()
+    engine.start()
+    engine.packet_capture.wait_until_finished()
+
+    # Esperar a que el worker procese todo lo encolado
+    pipeline = engine.packet_capture.pipeline
+    while pipeline.processed + pipeline.dropped < pipeline.queued:
+        time.sleep(0.01)
+    processing_time = time.perf_counter() - start
+
+    capture_stats = engine.packet_capture.get_stats()
+    engine.stop()
+    total_time = time.perf_counter() - start
+
+    packets = capture_stats['packets_processed']
+
+    return {
+        'pcap_file': pcap_file,
+        'devices': devices,
+        'packets': packets,
+        'packets_dropped': capture_stats['packets_dropped'],
+        'processing_time_s': processing_time,
+        'total_time_s': total_time,
+        'packets_per_second': packets / processing_time if processing_time > 0 else 0.0,
+        'stages': timer.report(),
+        'peak_rss_mb': get_peak_rss_mb(),
+    }
+
+
+def print_report(results: dict):
+    """
+    Imprimir resultados del benchmark
+
+    Args:
+        results: Dict devuelto por run_benchmark
+    """
+    print()
+    print("📊 RESULTADOS DEL BENCHMARK")
+    print("=" * 60)
+    print(f"Archivo:            {results['pcap_file']}")
+    print(f"Dispositivos:       {results['devices']} nuevos registrados")
+    print(f"Paquetes:           {results['packets']} procesados, {results['packets_dropped']} descartados")
+    print(f"Tiempo:             {results['processing_time_s']:.3f}s "
+          f"(total con flush final: {results['total_time_s']:.3f}s)")
+    print(f"Throughput:         {results['packets_per_second']:,.0f} paquetes/s")
+
+    if results['peak_rss_mb'] is not None:
+        print(f"Pico de RSS:        {results['peak_rss_mb']:.1f} MB")
+
+    print()
+    print(f"{'Etapa':<18}{'Llamadas':>12}{'Total (s)':>12}{'Prom (µs)':>12}{'Máx (µs)':>12}")
+    print("-" * 66)
+    for stage, stats in results['stages'].items():
+        print(f"{stage:<18}{stats['calls']:>12}{stats['total_s']:>12.3f}"
+              f"{stats['avg_us']:>12.1f}{stats['max_us']:>12.1f}")
+
+
+def main():
+    """
+    Punto de entrada del benchmark
+    """
+    parser = argparse.ArgumentParser(description="Benchmark de throughput de IoT Sentry")
+    parser.add_argument('pcap_file', help="Archivo .pcap o .pcapng a reproducir")
+    parser.add_argument('--speed', type=float, default=None,
+                        help="Velocidad de reproducción (1.0 = ritmo original; por defecto lo más rápido posible)")
+    parser.add_argument('--flush-interval', type=int, default=30,
+                        help="Intervalo de flush de flujos en segundos (default 30)")
+    parser.add_argument('--geoip', default=None, help="Ruta a GeoLite2-City.mmdb")
+    parser.add_argument('--database-url', default=None,
+                        help="URL de base de datos (default: SQLite temporal)")
+    args = parser.parse_args()
+
+    # Base por defecto del proceso (se abre al primer uso)
+    from agent.database import configure
+
+    temp_dir = None
+    if args.database_url:
+        configure(url=args.database_url)
+    else:
+        temp_dir = tempfile.TemporaryDirectory(prefix='iotsentry-bench-')
+        configure(path=os.path.join(temp_dir.name, 'bench.db'))
+
+    print("🛡️  IoT Sentry - Benchmark")
+    print("=" * 60)
+
+    try:
+        results = run_benchmark(args.pcap_file, args.speed, args.flush_interval, args.geoip)
+        print_report(results)
+    finally:
+        if temp_dir:
+            temp_dir.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -10,9 +10,10 @@ import threading
 
 from agent.scanner.device_identifier_comprehensive import ComprehensiveDeviceIdentifier
 from agent.scanner import NetworkScanner
-from agent.sniffer import PacketCapture, FlowTracker
-from agent.analyzer import GeoLocator, BehaviorProfiler
-from agent.database import get_db, Device, Flow, Alert
+from agent.sniffer import PacketCapture, FlowTracker, CaptureSupervisor
+from agent.sniffer.flow_tracker import FLOW_EVENTS
+from agent.analyzer import GeoLocator, GeoEnricher, BehaviorProfiler, AlertAggregator
+from agent.database import Database, get_database, Device, Flow, Alert, DeviceIndex
 
 
 class IoTSentryEngine:
@@ -20,23 +21,58 @@ class IoTSentryEngine:
     Motor principal que coordina todos los componentes
     """
 
-    def __init__(self):
+    def __init__(self, capture_backend: str = 'scapy', pcap_file: Optional[str] = None,
+                 replay_speed: Optional[float] = None,
+                 capture_interfaces: Optional[List[str]] = None,
+                 workers_per_interface: int = 1, skip_local_traffic: bool = False,
+                 database: Optional[Database] = None,
+                 session_factory=None, read_session_factory=None):
         """
         Inicializar motor
+
+        Args:
+            capture_backend: Backend de PacketCapture ('scapy', 'raw' o 'pcap')
+            pcap_file: Archivo a reproducir con el backend 'pcap'
+            replay_speed: Velocidad de reproducción (None = máxima, 1.0 = original)
+            capture_interfaces: Interfaces para captura multi-proceso
+                                (None = PacketCapture en un solo thread)
+            workers_per_interface: Procesos de captura por interfaz (PACKET_FANOUT)
+            skip_local_traffic: Ignorar paquetes con destino en la red local
+            database: Base de datos a usar (None = base por defecto)
+            session_factory: Factory de sesiones de escritura
+                             (None = database.SessionLocal)
+            read_session_factory: Factory de sesiones de solo lectura para GUI
+                                  y consultas (None = database.ReadSessionLocal)
         """
         # Componentes
         self.scanner = NetworkScanner()
         self.identifier = ComprehensiveDeviceIdentifier()
         self.geo_locator = GeoLocator()
+        # Geolocalización por destino en un pool aparte (fuera del camino de paquetes)
+        self.geo_enricher = GeoEnricher(self.geo_locator)
         self.packet_capture = None
         self.flow_tracker = None
         self.behavior_profiler = None
+        self.alert_aggregator = None
+
+        # Base de datos: cada componente abre sesiones cortas en su propio
+        # thread (flush, escaneo, GUI); ninguna sesión se comparte entre threads
+        self.database = database or get_database()
+        self.session_factory = session_factory or self.database.SessionLocal
+        self.read_session_factory = read_session_factory or self.database.ReadSessionLocal
 
-        # Base de datos
-        self.db_context = None
-        self.db_session = None
+        # Índice en memoria IP/MAC → dispositivo (evita queries por paquete)
+        self.device_index = DeviceIndex()
 
         # Estado
+        self.capture_backend = capture_backend
+        self.pcap_file = pcap_file
+        self.replay_speed = replay_speed
+        self.capture_interfaces = capture_interfaces
+        self.workers_per_interface = workers_per_interface
+        self.skip_local_traffic = skip_local_traffic
+        # Modo offline: se reproduce un archivo, sin escaneo de red
+        self.offline = capture_backend == 'pcap'
         self.running = False
         self.scan_interval = 300  # 5 minutos
 
@@ -55,20 +91,51 @@ class IoTSentryEngine:
 
         print("🚀 Iniciando IoT Sentry Engine...")
 
-        # Inicializar base de datos
-        self.db_context = get_db()
-        self.db_session = self.db_context.__enter__()
+        # Cargar índice de dispositivos ya conocidos
+        self._rebuild_device_index()
 
         # Inicializar componentes que requieren DB
-        self.behavior_profiler = BehaviorProfiler(self.db_session)
-        self.flow_tracker = FlowTracker(self.db_session)
+        self.behavior_profiler = BehaviorProfiler(self.session_factory,
+                                                  device_index=self.device_index)
+        # Alertas repetidas se agregan en una sola fila (count/first_seen/last_seen)
+        self.alert_aggregator = AlertAggregator(self.session_factory)
+        self.alert_aggregator.load_open_alerts()
+        # En reproducción la expiración sigue el reloj de la captura
+        self.flow_tracker = FlowTracker(self.session_factory, device_index=self.device_index,
+                                        use_packet_clock=self.offline,
+                                        geo_enricher=self.geo_enricher)
+        self.geo_enricher.start()
+
+        # El análisis de comportamiento consume eventos de flujo, no paquetes
+        for event in FLOW_EVENTS:
+            self.flow_tracker.subscribe(
+                lambda flows, event=event: self._on_flow_events(event, flows), event
+            )
 
         # Configurar packet capture
-        self.packet_capture = PacketCapture()
-        self.packet_capture.set_callback(self._on_packet_captured)
+        if self.capture_interfaces and not self.offline:
+            # Un proceso por interfaz: recibimos deltas de flujo ya agregados
+            self.packet_capture = CaptureSupervisor(
+                self.capture_interfaces,
+                workers_per_interface=self.workers_per_interface,
+                skip_local_traffic=self.skip_local_traffic
+            )
+            self.packet_capture.set_delta_callback(self._on_flow_deltas)
+        else:
+            self.packet_capture = PacketCapture(
+                backend=self.capture_backend,
+                pcap_file=self.pcap_file,
+                replay_speed=self.replay_speed,
+                skip_local_traffic=self.skip_local_traffic
+            )
+            self.packet_capture.set_callback(self._on_packet_captured)
 
-        # Hacer escaneo inicial
-        self._scan_network()
+        if self.offline:
+            # Reproducción: monitorear los dispositivos ya registrados en DB
+            self._update_monitored_devices()
+        else:
+            # Hacer escaneo inicial
+            self._scan_network()
 
         # Iniciar captura de paquetes
         self._start_capture()
@@ -78,8 +145,9 @@ class IoTSentryEngine:
 
         # Iniciar thread de escaneo periódico
         self.running = True
-        self.scan_thread = threading.Thread(target=self._scan_loop, daemon=True)
-        self.scan_thread.start()
+        if not self.offline:
+            self.scan_thread = threading.Thread(target=self._scan_loop, daemon=True)
+            self.scan_thread.start()
 
         print("✅ IoT Sentry Engine iniciado")
 
@@ -101,9 +169,15 @@ class IoTSentryEngine:
         if self.flow_tracker:
             self.flow_tracker.stop()
 
-        # Cerrar base de datos
-        if self.db_context:
-            self.db_context.__exit__(None, None, None)
+        # Persistir contadores de alertas pendientes
+        if self.alert_aggregator:
+            self.alert_aggregator.flush()
+
+        # Checkpoint final de los baselines aprendidos
+        if self.behavior_profiler:
+            self.behavior_profiler.save_baselines()
+
+        self.geo_enricher.stop()
 
         # Cerrar geo locator
         self.geo_locator.close()
@@ -119,44 +193,57 @@ class IoTSentryEngine:
         # Escanear
         devices_found = self.scanner.scan_network()
 
-        # Procesar cada dispositivo encontrado
-        for device_data in devices_found:
-            # Identificar fabricante y tipo
-            identification = self.identifier.identify_device(
-                device_data['mac'],
-                device_data['hostname']
-            )
+        new_devices = []
 
-            # Buscar o crear dispositivo en DB
-            device = self.db_session.query(Device).filter_by(
-                mac_address=device_data['mac']
-            ).first()
-
-            if device:
-                # Actualizar existente
-                device.ip_address = device_data['ip']
-                device.hostname = device_data['hostname']
-                device.last_seen = device_data['timestamp']
-            else:
-                # Crear nuevo
-                device = Device(
-                    mac_address=device_data['mac'],
-                    ip_address=device_data['ip'],
-                    hostname=device_data['hostname'],
-                    vendor=identification['vendor'],
-                    device_type=identification['device_type'],
-                    first_seen=device_data['timestamp'],
-                    last_seen=device_data['timestamp']
+        # Unidad de trabajo del escaneo (en el thread de escaneo, tras escanear)
+        with self.session_factory() as session:
+            # Procesar cada dispositivo encontrado
+            for device_data in devices_found:
+                # Identificar fabricante y tipo
+                identification = self.identifier.identify_device(
+                    device_data['mac'],
+                    device_data['hostname']
                 )
-                self.db_session.add(device)
 
-                # Notificar GUI si hay callback
-                if self.on_device_found_callback:
-                    self.on_device_found_callback(device)
-
-        self.db_session.commit()
+                # Buscar o crear dispositivo en DB (el índice evita la query si ya es conocido)
+                entry = self.device_index.get_by_mac(device_data['mac'])
+                if entry:
+                    device = session.get(Device, entry['id'])
+                else:
+                    device = session.query(Device).filter_by(
+                        mac_address=device_data['mac']
+                    ).first()
+
+                if device:
+                    # Actualizar existente
+                    device.ip_address = device_data['ip']
+                    device.hostname = device_data['hostname']
+                    device.last_seen = device_data['timestamp']
+                else:
+                    # Crear nuevo
+                    device = Device(
+                        mac_address=device_data['mac'],
+                        ip_address=device_data['ip'],
+                        hostname=device_data['hostname'],
+                        vendor=identification['vendor'],
+                        device_type=identification['device_type'],
+                        first_seen=device_data['timestamp'],
+                        last_seen=device_data['timestamp']
+                    )
+                    session.add(device)
+                    new_devices.append(device)
+
+            session.commit()
         print(f"✅ Escaneo completado: {len(devices_found)} dispositivos")
 
+        # Reconstruir índice con los IDs ya asignados por la DB
+        self._rebuild_device_index()
+
+        # Notificar GUI si hay callback
+        if self.on_device_found_callback:
+            for device in new_devices:
+                self.on_device_found_callback(device)
+
         # Actualizar IPs monitoreadas en packet capture
         self._update_monitored_devices()
 
@@ -167,11 +254,14 @@ class IoTSentryEngine:
         if not self.packet_capture:
             return
 
-        # Obtener todas las IPs de dispositivos
-        devices = self.db_session.query(Device).all()
-        ip_addresses = [d.ip_address for d in devices if d.ip_address]
+        self.packet_capture.set_monitored_devices(self.device_index.get_ip_addresses())
 
-        self.packet_capture.set_monitored_devices(ip_addresses)
+    def _rebuild_device_index(self):
+        """
+        Reconstruir índice en memoria de dispositivos desde la DB
+        """
+        with self.read_session_factory() as session:
+            self.device_index.rebuild(session.query(Device).all())
 
     def _start_capture(self):
         """
@@ -199,46 +289,51 @@ class IoTSentryEngine:
             size: Tamaño
             timestamp: Timestamp
         """
-        # Agregar a flow tracker
+        # Agregar a flow tracker (el análisis se hace por flujo, ver _on_flow_events)
         if self.flow_tracker:
             self.flow_tracker.track_packet(
                 src_ip, dst_ip, dst_port, protocol, size, timestamp
             )
 
-        # Geolocalizar destino
-        geo_info = self.geo_locator.geolocate(dst_ip)
-
-        if geo_info:
-            # Buscar device_id
-            device = self.db_session.query(Device).filter_by(ip_address=src_ip).first()
-            if not device:
-                return
-
-            # Analizar comportamiento
-            alert_data = self.behavior_profiler.analyze_flow(
-                device_id=device.id,
-                dest_ip=dst_ip,
-                dest_country=geo_info['country'],
-                bytes_sent=size,
-                timestamp=timestamp
-            )
+    def _on_flow_deltas(self, deltas: List[tuple]):
+        """
+        Callback con deltas de flujo agregados por los procesos de captura
 
-            # Crear alerta si se detectó anomalía
-            if alert_data:
-                alert = Alert(
-                    device_id=device.id,
-                    alert_type=alert_data['alert_type'],
-                    severity=alert_data['severity'],
-                    message=alert_data['message'],
-                    metadata=alert_data['metadata'],
-                    timestamp=timestamp
+        Args:
+            deltas: Lista de tuplas (src_ip, dst_ip, dst_port, protocol,
+                    bytes, packets, first_seen, last_seen) con timestamps epoch
+        """
+        for src_ip, dst_ip, dst_port, protocol, size, packets, first_seen, last_seen in deltas:
+            if self.flow_tracker:
+                # La tabla de flujos trabaja directamente con epoch
+                self.flow_tracker.merge_flow(
+                    src_ip, dst_ip, dst_port, protocol, size, packets, first_seen, last_seen
                 )
-                self.db_session.add(alert)
-                self.db_session.commit()
 
-                # Notificar GUI
-                if self.on_alert_callback:
-                    self.on_alert_callback(alert)
+    def _on_flow_events(self, event: str, flows: List[dict]):
+        """
+        Callback con eventos de flujo del FlowTracker: analizar y generar alertas
+
+        Args:
+            event: 'new', 'update' o 'end'
+            flows: Registros de flujo
+        """
+        detected = self.behavior_profiler.process_flow_events(event, flows)
+
+        # Las repeticiones solo incrementan el contador de la alerta abierta
+        for device_id, alert_data, timestamp in detected:
+            self.alert_aggregator.submit(device_id, alert_data, timestamp)
+
+        # Commit por lote: inmediato si hay alertas nuevas, periódico si solo contadores
+        if not self.alert_aggregator.should_flush():
+            return
+
+        alerts = self.alert_aggregator.flush()
+
+        # Notificar GUI (solo alertas nuevas)
+        if self.on_alert_callback:
+            for alert in alerts:
+                self.on_alert_callback(alert)
 
     def _scan_loop(self):
         """
@@ -258,10 +353,9 @@ class IoTSentryEngine:
         Returns:
             Lista de dispositivos
         """
-        if not self.db_session:
-            return []
-
-        return self.db_session.query(Device).all()
+        # Lecturas de la GUI por el pool de solo lectura
+        with self.read_session_factory() as db:
+            return db.query(Device).all()
 
     def get_device_flows(self, device_id: int, limit: int = 100) -> List[Flow]:
         """
@@ -274,14 +368,12 @@ class IoTSentryEngine:
         Returns:
             Lista de flujos
         """
-        if not self.db_session:
-            return []
-
-        return self.db_session.query(Flow).filter_by(
-            device_id=device_id
-        ).order_by(
-            Flow.timestamp.desc()
-        ).limit(limit).all()
+        with self.read_session_factory() as db:
+            return db.query(Flow).filter_by(
+                device_id=device_id
+            ).order_by(
+                Flow.timestamp.desc()
+            ).limit(limit).all()
 
     def get_alerts(self, limit: int = 50) -> List[Alert]:
         """
@@ -293,12 +385,10 @@ class IoTSentryEngine:
         Returns:
             Lista de alertas
         """
-        if not self.db_session:
-            return []
-
-        return self.db_session.query(Alert).order_by(
-            Alert.timestamp.desc()
-        ).limit(limit).all()
+        with self.read_session_factory() as db:
+            return db.query(Alert).order_by(
+                Alert.last_seen.desc()
+            ).limit(limit).all()
 
     def get_stats(self) -> dict:
         """
@@ -307,27 +397,33 @@ class IoTSentryEngine:
         Returns:
             Dict con stats
         """
-        if not self.db_session:
-            return {}
-
-        total_devices = self.db_session.query(Device).count()
-        total_alerts = self.db_session.query(Alert).filter_by(acknowledged=False).count()
-        total_flows = self.db_session.query(Flow).count()
+        with self.read_session_factory() as db:
+            total_devices = db.query(Device).count()
+            total_alerts = db.query(Alert).filter_by(acknowledged=False).count()
+            # Filas de flows: un intervalo de flush de un flujo cada una
+            total_flow_records = db.query(Flow).count()
 
         flow_stats = {}
         if self.flow_tracker:
             flow_stats = self.flow_tracker.get_stats()
 
+        capture_stats = {}
+        if self.packet_capture:
+            capture_stats = self.packet_capture.get_stats()
+
         # Calcular latencia promedio (simple ping al gateway)
         avg_latency = self._calculate_average_latency()
 
         return {
             'total_devices': total_devices,
             'unread_alerts': total_alerts,
-            'total_flows': total_flows,
+            'total_flow_records': total_flow_records,
             'capture_running': self.packet_capture.is_running() if self.packet_capture else False,
             'average_latency': avg_latency,
-            **flow_stats
+            'geolocation': {**self.geo_locator.get_stats(), **self.geo_enricher.get_stats()},
+            'alerts': self.alert_aggregator.get_stats() if self.alert_aggregator else {},
+            **flow_stats,
+            **capture_stats
         }
 
     def _calculate_average_latency(self) -> Optional[float]:
@@ -236,9 +236,9 @@ class MainWindow(QMainWindow):
 
         # Tabla de alertas
         self.alerts_table = QTableWidget()
-        self.alerts_table.setColumnCount(5)
+        self.alerts_table.setColumnCount(6)
         self.alerts_table.setHorizontalHeaderLabels([
-            "Severidad", "Tipo", "Mensaje", "Dispositivo", "Timestamp"
+            "Severidad", "Tipo", "Mensaje", "Dispositivo", "Última vez", "Veces"
         ])
 
         header = self.alerts_table.horizontalHeader()
@@ -247,6 +247,7 @@ class MainWindow(QMainWindow):
         header.setSectionResizeMode(2, QHeaderView.ResizeMode.Stretch)
         header.setSectionResizeMode(3, QHeaderView.ResizeMode.ResizeToContents)
         header.setSectionResizeMode(4, QHeaderView.ResizeMode.ResizeToContents)
+        header.setSectionResizeMode(5, QHeaderView.ResizeMode.ResizeToContents)
 
         layout.addWidget(self.alerts_table)
 
@@ -363,9 +364,11 @@ class MainWindow(QMainWindow):
             self.alerts_table.setItem(row, 1, QTableWidgetItem(alert.alert_type))
             self.alerts_table.setItem(row, 2, QTableWidgetItem(alert.message))
             self.alerts_table.setItem(row, 3, QTableWidgetItem(str(alert.device_id)))
+            last_seen = alert.last_seen or alert.timestamp
             self.alerts_table.setItem(row, 4, QTableWidgetItem(
-                alert.timestamp.strftime("%Y-%m-%d %H:%M:%S") if alert.timestamp else "N/A"
+                last_seen.strftime("%Y-%m-%d %H:%M:%S") if last_seen else "N/A"
             ))
+            self.alerts_table.setItem(row, 5, QTableWidgetItem(str(alert.count or 1)))
 
     def _update_stats(self):
         """
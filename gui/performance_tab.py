@@ -26,13 +26,9 @@ class PerformanceTab(QWidget):
 
         self.network_monitor = NetworkMonitor()
 
-        # Obtener sesión de DB correctamente
-        if hasattr(engine, 'db_session') and engine.db_session:
-            self.bandwidth_analyzer = BandwidthAnalyzer(engine.db_session)
-        else:
-            # Crear nueva sesión si no existe
-            from agent.database import SessionLocal
-            self.bandwidth_analyzer = BandwidthAnalyzer(SessionLocal())
+        # Consultas por el pool de solo lectura del motor (una sesión corta
+        # por consulta): la GUI nunca espera al escritor
+        self.bandwidth_analyzer = BandwidthAnalyzer(engine.read_session_factory)
 
         # Configurar gateway
         net_info = engine.scanner.get_local_network_info()
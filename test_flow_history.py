@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+Test de reconstrucción de flujos desde el historial
+
+Cada fila de `flows` es el delta de un intervalo de flush: los consumidores
+del historial deben contar flujos, no intervalos. Usa una base SQLite en
+memoria (no toca data/iotsentry.db).
+
+Uso:
+    python test_flow_history.py
+    pytest test_flow_history.py
+"""
+
+import os
+import sys
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from agent.analyzer.advanced_behavior_profiler import AdvancedBehaviorProfiler  # noqa: E402
+from agent.analyzer.flow_history import merge_flow_deltas  # noqa: E402
+from agent.database import Database  # noqa: E402
+from agent.database.migrations import run_migrations  # noqa: E402
+from agent.database.models import Device, Flow  # noqa: E402
+
+NOW = datetime(2024, 1, 1, 12, 0)
+
+
+def make_database(deltas: int = 110, interval: int = 30) -> Database:
+    """
+    Crear una base en memoria con un único flujo HTTPS guardado por intervalos
+
+    Args:
+        deltas: Intervalos de flush del flujo
+        interval: Segundos entre intervalos
+
+    Returns:
+        Database con el dispositivo 1 y sus filas de flows
+    """
+    database = Database(in_memory=True)
+    start = NOW - timedelta(seconds=deltas * interval)
+
+    with database.SessionLocal() as session:
+        session.add(Device(id=1, mac_address='aa:bb:cc:dd:ee:01', ip_address='192.168.1.50',
+                           device_type='camera'))
+        session.add_all(
+            Flow(device_id=1, dest_ip='1.2.3.4', dest_port=443, protocol='TCP',
+                 dest_country='United States', bytes_sent=1000, packets_sent=10,
+                 timestamp=start + timedelta(seconds=i * interval))
+            for i in range(deltas)
+        )
+        session.commit()
+    return database
+
+
+def delta(seconds: int, port: int = 443, bytes_sent: int = 100, **extra) -> dict:
+    """Fila de flows mínima para merge_flow_deltas"""
+    return {'device_id': 1, 'dest_ip': '1.2.3.4', 'dest_port': port, 'protocol': 'TCP',
+            'bytes_sent': bytes_sent, 'timestamp': NOW + timedelta(seconds=seconds), **extra}
+
+
+def test_merge_joins_consecutive_intervals():
+    flows = list(merge_flow_deltas([delta(30 * i) for i in range(10)]))
+    assert len(flows) == 1, flows
+    assert flows[0]['bytes_sent'] == 1000
+    assert flows[0]['intervals'] == 10
+    assert flows[0]['timestamp'] == NOW
+
+
+def test_merge_splits_on_idle_and_active_timeout():
+    # Hueco mayor que el idle timeout → dos flujos
+    flows = list(merge_flow_deltas([delta(0), delta(30), delta(1000)],
+                                   idle_timeout=300, active_timeout=1800))
+    assert sorted(flow['bytes_sent'] for flow in flows) == [100, 200]
+
+    # Flujo continuo de 40 minutos → se corta en el active timeout
+    flows = list(merge_flow_deltas([delta(30 * i, bytes_sent=10) for i in range(80)],
+                                   idle_timeout=300, active_timeout=1800))
+    assert sorted(flow['bytes_sent'] for flow in flows) == [200, 600]
+
+
+def test_merge_keeps_keys_apart_and_fills_missing_fields():
+    rows = [delta(0, dest_country=None), delta(0, port=80), delta(30, dest_country='Spain')]
+    flows = {flow['dest_port']: flow for flow in merge_flow_deltas(rows)}
+    assert set(flows) == {443, 80}
+    assert flows[443]['dest_country'] == 'Spain'
+    assert flows[443]['bytes_sent'] == 200
+
+
+def test_rebuild_windows_counts_flows_not_intervals():
+    # 50 intervalos de 30 s (25 min): un solo flujo
+    profiler = AdvancedBehaviorProfiler(make_database(deltas=50).SessionLocal, warm_start=False)
+    profiler.rebuild_windows(NOW)
+    assert profiler.device_windows[1].connection_count('1.2.3.4', NOW) == 1
+
+    # 110 intervalos (55 min): el tracker lo exporta en dos flujos (active timeout)
+    profiler = AdvancedBehaviorProfiler(make_database().SessionLocal, warm_start=False)
+    profiler.rebuild_windows(NOW)
+    assert profiler.device_windows[1].connection_count('1.2.3.4', NOW) == 2
+    assert profiler._check_excessive_connections(1, '1.2.3.4', NOW) is None
+
+
+def test_score_history_scores_flows_not_intervals():
+    profiler = AdvancedBehaviorProfiler(make_database().SessionLocal, warm_start=False)
+    alerts = profiler.score_history(NOW - timedelta(hours=1), NOW)
+    types = [alert['alert_type'] for _, alert, _ in alerts]
+    assert 'excessive_connections' not in types, types
+
+
+def test_score_history_uses_whole_flow_bytes():
+    # 5 intervalos de 30 MB: ninguno supera 100 MB, el flujo completo sí
+    database = Database(in_memory=True)
+    with database.SessionLocal() as session:
+        session.add(Device(id=1, mac_address='aa:bb:cc:dd:ee:01', device_type='camera'))
+        session.add_all(
+            Flow(device_id=1, dest_ip='1.2.3.4', dest_port=443, protocol='TCP',
+                 bytes_sent=30 * 1024 * 1024, timestamp=NOW + timedelta(seconds=30 * i))
+            for i in range(5)
+        )
+        session.commit()
+
+    profiler = AdvancedBehaviorProfiler(database.SessionLocal, warm_start=False)
+    alerts = profiler.score_history(NOW, NOW + timedelta(hours=1))
+    high_volume = [alert for _, alert, _ in alerts if alert['alert_type'] == 'high_volume']
+    assert len(high_volume) == 1, alerts
+    assert high_volume[0]['metadata']['bytes_sent'] == 150 * 1024 * 1024
+
+
+def test_migration_converts_cumulative_chains_to_deltas():
+    database = Database(in_memory=True)
+    first_seen = NOW - timedelta(minutes=5)
+    with database.SessionLocal() as session:
+        session.add(Device(id=1, mac_address='aa:bb:cc:dd:ee:01', device_type='camera'))
+        # Formato antiguo: acumulado por flush con timestamp = inicio del flujo
+        # (el tercer flush no tuvo tráfico, el cuarto viene de un contador reiniciado)
+        session.add_all(
+            Flow(device_id=1, dest_ip='1.2.3.4', dest_port=443, protocol='TCP',
+                 bytes_sent=bytes_sent, packets_sent=packets, timestamp=first_seen)
+            for bytes_sent, packets in [(100, 1), (250, 3), (250, 3), (40, 1)]
+        )
+        # Formato delta: un timestamp por intervalo, no se toca
+        session.add_all(
+            Flow(device_id=1, dest_ip='5.6.7.8', dest_port=53, protocol='UDP',
+                 bytes_sent=80, packets_sent=1, timestamp=NOW + timedelta(seconds=30 * i))
+            for i in range(3)
+        )
+        session.commit()
+
+    engine = database.engine
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM schema_version WHERE version >= 3"))
+    assert run_migrations(engine) == [3]
+
+    def stored():
+        with engine.connect() as conn:
+            return conn.execute(text(
+                "SELECT dest_ip, bytes_sent, packets_sent FROM flows ORDER BY id"
+            )).all()
+
+    expected = [('1.2.3.4', 100, 1), ('1.2.3.4', 150, 2), ('1.2.3.4', 40, 1)] + \
+               [('5.6.7.8', 80, 1)] * 3
+    assert stored() == expected, stored()
+
+    # Interrumpida a mitad (tabla auxiliar sin aplicar): se retoma al repetir
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM schema_version WHERE version >= 3"))
+        conn.execute(text("CREATE TABLE _flow_deltas (id INTEGER, bytes_sent INTEGER, "
+                          "packets_sent INTEGER)"))
+        conn.execute(text("INSERT INTO _flow_deltas VALUES (2, 150, 2)"))
+        conn.execute(text("UPDATE flows SET bytes_sent = 250, packets_sent = 3 WHERE id = 2"))
+    assert run_migrations(engine) == [3]
+    assert stored() == expected, stored()
+    assert run_migrations(engine) == []
+
+
+def main() -> int:
+    """
+    Ejecutar todos los tests sin pytest
+
+    Returns:
+        Código de salida (0 si todos pasan)
+    """
+    print("🧪 Test de reconstrucción de flujos\n")
+    print("=" * 50)
+
+    tests = [(name, func) for name, func in sorted(globals().items())
+             if name.startswith('test_') and callable(func)]
+    failed = 0
+    for name, func in tests:
+        try:
+            func()
+            print(f"   ✅ {name}")
+        except AssertionError as e:
+            failed += 1
+            print(f"   ❌ {name}\n{e}")
+
+    print("\n" + "=" * 50)
+    if failed:
+        print(f"\n❌ {failed} de {len(tests)} tests fallaron")
+        return 1
+    print(f"\n✅ {len(tests)} tests pasaron")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
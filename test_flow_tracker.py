@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Test del flow tracker
+
+Comprueba la expiración de flujos con el reloj de paquetes (sin base de
+datos ni captura) y que el thread de mantenimiento sobreviva a errores.
+
+Uso:
+    python test_flow_tracker.py
+    pytest test_flow_tracker.py
+"""
+
+import os
+import sys
+import threading
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from agent.analyzer.geo_enricher import GeoEnricher  # noqa: E402
+from agent.database import Database  # noqa: E402
+from agent.database.device_index import DeviceIndex  # noqa: E402
+from agent.sniffer.flow_tracker import FLOW_END, FlowTracker  # noqa: E402
+
+
+def make_tracker(**kwargs) -> FlowTracker:
+    """
+    Crear un tracker sin DB que usa el timestamp de los paquetes como reloj
+
+    Returns:
+        FlowTracker con los flujos terminados en `tracker.ended`
+    """
+    tracker = FlowTracker(None, use_packet_clock=True, **kwargs)
+    tracker.ended = []
+    tracker.subscribe(tracker.ended.extend, FLOW_END)
+    return tracker
+
+
+def test_same_deadline_with_and_without_port():
+    # Mismo deadline: el heap no debe comparar ('...', 5353, 'UDP') con ('...', None, 'IGMP')
+    tracker = make_tracker()
+    tracker.track_packet('192.168.1.5', '224.0.0.251', 5353, 'UDP', 100, 1000.0)
+    tracker.track_packet('192.168.1.5', '224.0.0.251', None, 'IGMP', 60, 1000.0)
+    tracker._expire_flows()
+
+    assert len(tracker.active_flows) == 2
+
+    # Un paquete posterior avanza el reloj y cierra ambos por idle timeout
+    tracker.track_packet('192.168.1.6', '8.8.8.8', 53, 'UDP', 80,
+                         1000.0 + tracker.idle_timeout)
+    tracker._expire_flows()
+
+    ended = {(flow['dst_port'], flow['protocol']) for flow in tracker.ended}
+    assert ended == {(5353, 'UDP'), (None, 'IGMP')}, ended
+    assert all(flow['end_reason'] == 'idle' for flow in tracker.ended)
+
+
+def test_flush_loop_survives_errors():
+    tracker = make_tracker(expiry_interval=0.01, flush_interval=0.01)
+    calls = []
+
+    def failing_flush():
+        calls.append(time.monotonic())
+        raise RuntimeError("DB no disponible")
+
+    tracker._flush_flows = failing_flush
+    tracker.running = True
+    tracker.flush_thread = threading.Thread(target=tracker._flush_loop, daemon=True)
+    tracker.flush_thread.start()
+    try:
+        time.sleep(0.2)
+        assert tracker.flush_thread.is_alive()
+        assert len(calls) >= 2, calls
+    finally:
+        tracker.running = False
+        tracker.flush_thread.join(timeout=1)
+
+
+def test_flush_rerequests_missing_geo():
+    # Cola de tamaño 1 sin workers: el segundo destino se descarta al entrar
+    enricher = GeoEnricher(geo_locator=None, queue_size=1)
+    device_index = DeviceIndex()
+    device_index.rebuild([SimpleNamespace(id=1, mac_address='aa:bb:cc:dd:ee:ff',
+                                          ip_address='192.168.1.5',
+                                          device_type=None, vendor=None)])
+    database = Database(in_memory=True)
+
+    tracker = make_tracker(device_index=device_index, geo_enricher=enricher, geo_wait=0)
+    tracker.session_factory = database.SessionLocal
+    tracker.track_packet('192.168.1.5', '8.8.8.8', 53, 'UDP', 80, 1000.0)
+    tracker.track_packet('192.168.1.5', '1.1.1.1', 53, 'UDP', 80, 1000.0)
+    tracker._expire_flows()
+    assert enricher.dropped == 1
+
+    # Un worker resuelve el primero; el flush vuelve a pedir el descartado
+    dst_ip = enricher.queue.get_nowait()
+    enricher.results[dst_ip] = None
+    enricher.pending.discard(dst_ip)
+    dropped_ip = ({'8.8.8.8', '1.1.1.1'} - {dst_ip}).pop()
+
+    tracker._flush_flows()
+    assert enricher.pending == {dropped_ip}, enricher.pending
+    assert enricher.requested == 2
+
+
+def main() -> int:
+    """
+    Ejecutar todos los tests sin pytest
+
+    Returns:
+        Código de salida (0 si todos pasan)
+    """
+    print("🧪 Test del flow tracker\n")
+    print("=" * 50)
+
+    tests = [(name, func) for name, func in sorted(globals().items())
+             if name.startswith('test_') and callable(func)]
+    failed = 0
+    for name, func in tests:
+        try:
+            func()
+            print(f"   ✅ {name}")
+        except AssertionError as e:
+            failed += 1
+            print(f"   ❌ {name}\n{e}")
+
+    print("\n" + "=" * 50)
+    if failed:
+        print(f"\n❌ {failed} de {len(tests)} tests fallaron")
+        return 1
+    print(f"\n✅ {len(tests)} tests pasaron")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -67,12 +67,7 @@ except Exception as e:
 # Test 5: Stats completos
 print("\n5️⃣ Obteniendo stats completos...")
 try:
-    # Inicializar DB primero
-    engine.db_context = engine.scanner.__class__.__module__  # Hack para test
-    from agent.database import get_db
-    engine.db_context = get_db()
-    engine.db_session = engine.db_context.__enter__()
-
+    # Las consultas abren su propia sesión de lectura (no hace falta iniciar el motor)
     stats = engine.get_stats()
     print("   ✅ Stats obtenidos:")
     print(f"      • Dispositivos: {stats.get('total_devices', 0)}")
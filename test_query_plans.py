@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Test de planes de consulta (EXPLAIN QUERY PLAN)
+
+Ejecuta las consultas reales de los componentes sobre una base SQLite en
+memoria, captura el SQL emitido y verifica que SQLite use los índices
+previstos en lugar de recorrer la tabla completa.
+
+Uso:
+    python test_query_plans.py
+    pytest test_query_plans.py
+"""
+
+import os
+import sys
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import event  # noqa: E402
+
+from agent.database import Database  # noqa: E402
+from agent.monitor import BandwidthAnalyzer  # noqa: E402
+from agent.analyzer import BehaviorProfiler  # noqa: E402
+from agent.analyzer.device_baseline import BaselineStore  # noqa: E402
+from agent.analyzer.advanced_behavior_profiler import AdvancedBehaviorProfiler  # noqa: E402
+
+# Base en memoria propia: no toca data/iotsentry.db
+database = Database(in_memory=True)
+engine = database.engine
+SessionLocal = database.SessionLocal
+ReadSessionLocal = database.ReadSessionLocal
+
+
+def capture_plans(call, table: str) -> list:
+    """
+    Ejecutar una llamada y obtener el plan de cada consulta sobre una tabla
+
+    Args:
+        call: Función que ejecuta las consultas
+        table: Tabla cuyas consultas interesan
+
+    Returns:
+        Lista con el plan (texto, un paso por línea) de cada consulta
+    """
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    event.listen(engine, 'before_cursor_execute', capture)
+    try:
+        call()
+    finally:
+        event.remove(engine, 'before_cursor_execute', capture)
+
+    plans = []
+    with engine.connect() as conn:
+        for statement, parameters in statements:
+            if f'FROM {table}' not in statement and f'JOIN {table}' not in statement:
+                continue
+            rows = conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters)
+            plans.append('\n'.join(row[3] for row in rows))
+    return plans
+
+
+def assert_uses_index(plans: list, table: str, index: str, covering: bool = False):
+    """
+    Verificar que todas las consultas busquen en la tabla con un índice
+
+    Args:
+        plans: Planes capturados
+        table: Tabla
+        index: Nombre del índice esperado
+        covering: Exigir que el índice sea covering (sin leer la tabla)
+    """
+    assert plans, f"No se ejecutó ninguna consulta sobre {table}"
+    for plan in plans:
+        uses_covering = f'SEARCH {table} USING COVERING INDEX {index}' in plan
+        uses_index = f'SEARCH {table} USING INDEX {index}' in plan
+        assert uses_covering or (uses_index and not covering), plan
+
+
+# ============ flows ============
+
+def test_bandwidth_by_device_uses_covering_index():
+    analyzer = BandwidthAnalyzer(ReadSessionLocal)
+    plans = capture_plans(lambda: analyzer.get_bandwidth_by_device(hours=1), 'flows')
+    assert_uses_index(plans, 'flows', 'ix_flows_device_time', covering=True)
+
+
+def test_traffic_timeline_uses_covering_index():
+    analyzer = BandwidthAnalyzer(ReadSessionLocal)
+
+    plans = capture_plans(lambda: analyzer.get_traffic_timeline(None, hours=24), 'flows')
+    assert_uses_index(plans, 'flows', 'ix_flows_time_device', covering=True)
+
+    plans = capture_plans(lambda: analyzer.get_traffic_timeline(1, hours=24), 'flows')
+    assert_uses_index(plans, 'flows', 'ix_flows_device_time', covering=True)
+
+
+def test_top_destinations_uses_covering_index():
+    analyzer = BandwidthAnalyzer(ReadSessionLocal)
+    plans = capture_plans(lambda: analyzer.get_top_destinations(1), 'flows')
+    assert_uses_index(plans, 'flows', 'ix_flows_device_dest', covering=True)
+
+
+def test_device_flows_ordered_by_index():
+    from core.iot_sentry_engine import IoTSentryEngine
+
+    engine_ = IoTSentryEngine(capture_backend='pcap', database=database)
+    plans = capture_plans(lambda: engine_.get_device_flows(1), 'flows')
+    assert_uses_index(plans, 'flows', 'ix_flows_device_time')
+    # ORDER BY timestamp DESC LIMIT sale del orden del índice
+    assert all('TEMP B-TREE' not in plan for plan in plans), plans
+
+
+def test_baseline_bootstrap_uses_device_index():
+    store = BaselineStore(SessionLocal)
+    plans = capture_plans(lambda: store._bootstrap(1), 'flows')
+    assert_uses_index(plans, 'flows', 'ix_flows_device_time')
+    # Los deltas se reagrupan en flujos en orden de timestamp (el del índice)
+    assert all('TEMP B-TREE' not in plan for plan in plans), plans
+
+
+def test_window_rebuild_uses_time_range():
+    profiler = AdvancedBehaviorProfiler(SessionLocal, warm_start=False)
+    plans = capture_plans(profiler.rebuild_windows, 'flows')
+    assert len(plans) == 2, plans
+    assert_uses_index(plans, 'flows', 'ix_flows_time_device')
+
+
+def test_score_history_uses_time_range():
+    profiler = AdvancedBehaviorProfiler(SessionLocal, warm_start=False)
+    plans = capture_plans(
+        lambda: profiler.score_history(datetime(2024, 1, 1), datetime(2024, 1, 2)), 'flows'
+    )
+    assert_uses_index(plans, 'flows', 'ix_flows_time_device')
+
+
+# ============ devices ============
+
+def test_device_lookup_by_ip_uses_index():
+    profiler = BehaviorProfiler(SessionLocal)
+    plans = capture_plans(lambda: profiler._resolve_device_id('192.168.1.50'), 'devices')
+    assert_uses_index(plans, 'devices', 'ix_devices_ip_address')
+
+
+def main() -> int:
+    """
+    Ejecutar todos los tests sin pytest
+
+    Returns:
+        Código de salida (0 si todos pasan)
+    """
+    print("🧪 Test de planes de consulta\n")
+    print("=" * 50)
+
+    tests = [(name, func) for name, func in sorted(globals().items())
+             if name.startswith('test_') and callable(func)]
+    failed = 0
+    for name, func in tests:
+        try:
+            func()
+            print(f"   ✅ {name}")
+        except AssertionError as e:
+            failed += 1
+            print(f"   ❌ {name}\n{e}")
+
+    print("\n" + "=" * 50)
+    if failed:
+        print(f"\n❌ {failed} de {len(tests)} tests fallaron")
+        return 1
+    print(f"\n✅ {len(tests)} tests pasaron")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())